@@ -13,6 +13,7 @@ rule-based engine that uses pre-condition factors.
 
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
 
 import joblib
@@ -33,26 +34,54 @@ from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
 
+from training_cache import cache_key, fit_classifier, prepare_training_data
+
 
 DATASET_PATH = Path(__file__).resolve().parent / "dataset" / "EyeConditions_CLEAN_RISK.csv"
 MODEL_PATH = Path(__file__).resolve().parent / "risk_model.joblib"
+# Preprocessed splits + LightGBM binary datasets, keyed by data and config
+PREP_CACHE_DIR = Path(__file__).resolve().parent / "dataset" / ".cache" / "prep"
+
+# Everything that shapes the preprocessed training data (part of its cache key).
+PREPROCESSING_CONFIG = {
+    "target": "Eye_Disease_Risk",
+    "numeric_imputer": "median",
+    "categorical_imputer": "most_frequent",
+    "encoder": "onehot",
+    "test_size": 0.30,
+    "random_state": 42,
+}
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fileobj:
+        for block in iter(lambda: fileobj.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
+# PREPROCESSING_CONFIG["encoder"] -> categorical encoder
+_ENCODERS = {
+    "onehot": lambda: OneHotEncoder(handle_unknown="ignore", sparse_output=False),
+}
+
+
+# The preprocessing is built from PREPROCESSING_CONFIG, which is part of the
+# training-cache key. Any change here that the config does not capture must
+# bump training_cache.CACHE_VERSION, or retrains keep reusing the old cache.
 def _build_pipeline(X: pd.DataFrame) -> Pipeline:
     numeric_features = X.select_dtypes(include=["number", "bool"]).columns.tolist()
     categorical_features = [c for c in X.columns if c not in numeric_features]
 
     numeric_transformer = Pipeline(
-        steps=[("imputer", SimpleImputer(strategy="median"))]
+        steps=[("imputer", SimpleImputer(strategy=PREPROCESSING_CONFIG["numeric_imputer"]))]
     )
 
     categorical_transformer = Pipeline(
         steps=[
-            ("imputer", SimpleImputer(strategy="most_frequent")),
-            (
-                "onehot",
-                OneHotEncoder(handle_unknown="ignore", sparse_output=False),
-            ),
+            ("imputer", SimpleImputer(strategy=PREPROCESSING_CONFIG["categorical_imputer"])),
+            ("onehot", _ENCODERS[PREPROCESSING_CONFIG["encoder"]]()),
         ]
     )
 
@@ -66,9 +95,13 @@ def _build_pipeline(X: pd.DataFrame) -> Pipeline:
     # Keep feature names consistent into LightGBM to avoid sklearn warnings.
     preprocessor.set_output(transform="pandas")
 
+    return Pipeline(steps=[("preprocessor", preprocessor), ("model", _build_model())])
+
+
+def _build_model() -> LGBMClassifier:
     # Constrained-ish params to reduce memorization.
     # (LightGBM will still be strong; these keep the trees shallow and leaves limited.)
-    model = LGBMClassifier(
+    return LGBMClassifier(
         n_estimators=400,
         learning_rate=0.05,
         num_leaves=24,  # 16–32
@@ -81,37 +114,49 @@ def _build_pipeline(X: pd.DataFrame) -> Pipeline:
         n_jobs=-1,
     )
 
-    return Pipeline(steps=[("preprocessor", preprocessor), ("model", model)])
-
 
 def main() -> None:
     if not DATASET_PATH.exists():
         raise FileNotFoundError(f"Dataset not found: {DATASET_PATH}")
 
-    df = pd.read_csv(DATASET_PATH)
+    target_col = PREPROCESSING_CONFIG["target"]
+
+    def build():
+        df = pd.read_csv(DATASET_PATH)
+
+        if target_col not in df.columns:
+            raise ValueError(
+                f"Target column '{target_col}' not found. Available columns: {list(df.columns)}"
+            )
 
-    target_col = "Eye_Disease_Risk"
-    if target_col not in df.columns:
-        raise ValueError(
-            f"Target column '{target_col}' not found. Available columns: {list(df.columns)}"
+        y = df[target_col]
+        X = df.drop(columns=[target_col])
+
+        X_train, X_test, y_train, y_test = train_test_split(
+            X,
+            y,
+            test_size=PREPROCESSING_CONFIG["test_size"],
+            random_state=PREPROCESSING_CONFIG["random_state"],
+            stratify=y,
         )
 
-    y = df[target_col]
-    X = df.drop(columns=[target_col])
+        preprocessor = _build_pipeline(X_train).named_steps["preprocessor"]
+        X_train = preprocessor.fit_transform(X_train)
+        X_test = preprocessor.transform(X_test)
+        return preprocessor, X_train, y_train, X_test, y_test, {"n_rows": int(len(df))}
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X,
-        y,
-        test_size=0.30,
-        random_state=42,
-        stratify=y,
-    )
+    # Imputation, one-hot encoding and LightGBM binning only run when the
+    # dataset or the preprocessing config changed since the last training.
+    key = cache_key(_file_sha256(DATASET_PATH), PREPROCESSING_CONFIG)
+    prepared = prepare_training_data(str(PREP_CACHE_DIR), key, build)
+    print(f"Preprocessed data: {'cached' if prepared.cache_hit else 'built'} ({key[:12]})")
 
-    pipeline = _build_pipeline(X_train)
-    pipeline.fit(X_train, y_train)
+    model = fit_classifier(_build_model(), prepared)
+    pipeline = Pipeline(steps=[("preprocessor", prepared.preprocessor), ("model", model)])
 
-    y_pred = pipeline.predict(X_test)
-    y_proba = pipeline.predict_proba(X_test)[:, 1]
+    y_test = prepared.y_test
+    y_pred = model.predict(prepared.X_test)
+    y_proba = model.predict_proba(prepared.X_test)[:, 1]
 
     # Metrics
     acc = accuracy_score(y_test, y_pred)
@@ -0,0 +1,180 @@
+"""Cache of preprocessed training data for the risk model.
+
+Retraining on an unchanged dataset used to repeat the whole ingest stage:
+split, imputation and one-hot encoding, then LightGBM's histogram binning
+inside `fit()`. This module stores that work under a key made of the
+dataset's content hash and the preprocessing configuration:
+
+    <dir>/<key>/preprocessor.joblib   fitted ColumnTransformer
+    <dir>/<key>/X_train.npy, X_test.npy, y_train.npy, y_test.npy
+                                      preprocessed matrices
+    <dir>/<key>/train.bin             LightGBM `Dataset.save_binary` output
+    <dir>/<key>/meta.json             feature names, row counts
+
+On a hit, training loads the binned Dataset and boosts straight away.
+Boosting hyperparameters (learning rate, leaves, rounds...) are not part of
+the key, so tweaking them reuses the cache. Only the binning parameters in
+DATASET_PARAMS are in the key. `feature_pre_filter` is off so that
+`min_data_in_leaf` can change without rebinning.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import sklearn
+from lightgbm import LGBMClassifier
+from lightgbm.sklearn import _LGBMLabelEncoder
+
+# Bump when the preprocessing code changes in a way the config does not capture
+CACHE_VERSION = 1
+
+# Parameters fixed into the binned LightGBM Dataset (part of the cache key)
+DATASET_PARAMS: dict[str, Any] = {
+    "max_bin": 255,
+    "min_data_in_bin": 3,
+    "bin_construct_sample_cnt": 200000,
+    "data_random_seed": 42,
+    "feature_pre_filter": False,
+    "use_missing": True,
+    "zero_as_missing": False,
+}
+
+
+@dataclass
+class PreparedData:
+    """Preprocessed split of a dataset, ready for boosting."""
+
+    key: str
+    preprocessor: Any
+    train_set: lgb.Dataset
+    X_train: pd.DataFrame
+    y_train: np.ndarray
+    X_test: pd.DataFrame
+    y_test: np.ndarray
+    meta: dict[str, Any]
+    cache_hit: bool
+
+
+# build() -> (fitted preprocessor, X_train, y_train, X_test, y_test, extra meta),
+# with X_* already transformed
+BuildFn = Callable[[], tuple[Any, pd.DataFrame, Any, pd.DataFrame, Any, dict[str, Any]]]
+
+
+def cache_key(content_hash: str, config: dict[str, Any]) -> str:
+    """Key for a dataset's preprocessed form under a preprocessing config."""
+    payload = {
+        "content": content_hash,
+        "config": config,
+        "dataset_params": DATASET_PARAMS,
+        "version": CACHE_VERSION,
+        "sklearn": sklearn.__version__,
+        "lightgbm": lgb.__version__,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _write(directory: str, build: BuildFn) -> None:
+    preprocessor, X_train, y_train, X_test, y_test, extra = build()
+    features = [str(c) for c in X_train.columns]
+    y_train = np.asarray(y_train)
+
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".prep-", dir=os.path.dirname(directory))
+    try:
+        joblib.dump(preprocessor, os.path.join(staging, "preprocessor.joblib"))
+        np.save(os.path.join(staging, "X_train.npy"), X_train.to_numpy(dtype=np.float64))
+        np.save(os.path.join(staging, "X_test.npy"), X_test.to_numpy(dtype=np.float64))
+        np.save(os.path.join(staging, "y_train.npy"), y_train)
+        np.save(os.path.join(staging, "y_test.npy"), np.asarray(y_test))
+
+        labels = _LGBMLabelEncoder().fit_transform(y_train)
+        train_set = lgb.Dataset(X_train, label=labels, params={**DATASET_PARAMS, "verbose": -1})
+        train_set.save_binary(os.path.join(staging, "train.bin"))
+
+        meta = {"features": features, "n_train": int(len(X_train)), "n_test": int(len(X_test)), **extra}
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as fileobj:
+            json.dump(meta, fileobj, indent=2)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # A concurrent run cached the same key first
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def prepare_training_data(cache_dir: str, key: str, build: BuildFn) -> PreparedData:
+    """Preprocessed data for `key`, running `build` only on a cache miss."""
+    directory = os.path.join(cache_dir, key)
+    cache_hit = os.path.exists(os.path.join(directory, "meta.json"))
+    if not cache_hit:
+        _write(directory, build)
+
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as fileobj:
+        meta = json.load(fileobj)
+    features = meta["features"]
+    return PreparedData(
+        key=key,
+        preprocessor=joblib.load(os.path.join(directory, "preprocessor.joblib")),
+        train_set=lgb.Dataset(os.path.join(directory, "train.bin"), params=dict(DATASET_PARAMS)),
+        X_train=pd.DataFrame(np.load(os.path.join(directory, "X_train.npy")), columns=features),
+        y_train=np.load(os.path.join(directory, "y_train.npy")),
+        X_test=pd.DataFrame(np.load(os.path.join(directory, "X_test.npy")), columns=features),
+        y_test=np.load(os.path.join(directory, "y_test.npy")),
+        meta=meta,
+        cache_hit=cache_hit,
+    )
+
+
+# fit_classifier sets LGBMClassifier's private fit state: it follows the
+# LightGBM version pinned in requirements.txt, and tests/test_training_cache.py
+# (parity with a regular fit) must pass before that pin is changed.
+def fit_classifier(
+    model: LGBMClassifier,
+    prepared: PreparedData,
+    callbacks: list[Callable] | None = None,
+) -> LGBMClassifier:
+    """Fit `model` on the cached binned Dataset.
+
+    `LGBMClassifier.fit()` always rebuilds the Dataset from a matrix.
+    Instead, boost with `lightgbm.train` on the cached binary, then give the
+    classifier the state `fit()` would have left. Predictions match a
+    regular fit with the same parameters.
+    """
+    model._le = _LGBMLabelEncoder().fit(prepared.y_train)
+    model._classes = model._le.classes_
+    model._n_classes = len(model._classes)
+    model._class_map = dict(zip(model._classes, model._le.transform(model._classes)))
+    model._class_weight = model.class_weight
+    model._objective = model.objective
+
+    params = model._process_params(stage="fit")
+    params.update(DATASET_PARAMS)
+    booster = lgb.train(
+        params,
+        prepared.train_set,
+        num_boost_round=model.n_estimators,
+        callbacks=callbacks,
+    )
+
+    model._Booster = booster
+    model._n_features = booster.num_feature()
+    model.n_features_in_ = booster.num_feature()
+    model._evals_result = {}
+    model._best_iteration = booster.best_iteration
+    model._best_score = booster.best_score
+    model.fitted_ = True
+    booster.free_dataset()
+    return model
@@ -10,6 +10,8 @@ Outputs:
     - trained model saved to ./models/lightgbm_model.pkl
     - printed evaluation metrics and complexity metrics
     - CSV file with test predictions saved to ./models/test_predictions.csv
+    - hyperparameter search leaderboard saved to ./models/tuning_leaderboard.csv
+      (trials run in parallel; --tune-workers sets the process count)
 
 Sections are commented. Modify CSV_PATH or pass as CLI.
 """
@@ -20,13 +22,18 @@ Sections are commented. Modify CSV_PATH or pass as CLI.
 import os
 import sys
 import argparse
+import json
+import tempfile
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+import multiprocessing
 import pickle
 import numpy as np
 import pandas as pd
 
-from sklearn.model_selection import train_test_split, StratifiedKFold, RandomizedSearchCV
+from sklearn.model_selection import train_test_split, StratifiedKFold, ParameterSampler
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import (
     accuracy_score,
@@ -56,6 +63,8 @@ os.makedirs(DEFAULT_MODEL_DIR, exist_ok=True)
 # If you prefer to hardcode path, set CSV_PATH below or pass it via CLI
 CSV_PATH = "ml_models/dataset/New_data.csv"
 
+LEADERBOARD_PATH = os.path.join(DEFAULT_MODEL_DIR, "tuning_leaderboard.csv")
+
 # -------------------------
 # Utility functions
 # -------------------------
@@ -159,6 +168,132 @@ def get_lgb_complexity_metrics(booster):
         "feature_count": feature_count,
     }
 
+# -------------------------
+# Hyperparameter search
+# -------------------------
+def _build_fold_cache(X, y, n_splits, random_state, cache_dir):
+    """
+    Splits X/y into stratified folds once and saves, per fold:
+      - train.bin / valid.bin: LightGBM binned datasets (valid binned against train)
+      - X_valid.npy / y_valid.npy: raw validation data for scoring
+    Every trial loads these instead of re-splitting and re-binning.
+    """
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    dataset_params = {"feature_pre_filter": False, "verbosity": -1, "seed": random_state}
+    X_values = np.asarray(X, dtype=np.float64)
+    y_values = np.asarray(y)
+    folds = []
+    for i, (train_idx, valid_idx) in enumerate(skf.split(X_values, y_values)):
+        fold_dir = os.path.join(cache_dir, f"fold{i}")
+        os.makedirs(fold_dir, exist_ok=True)
+        train_set = lgb.Dataset(X_values[train_idx], label=y_values[train_idx],
+                                feature_name=list(X.columns), params=dataset_params, free_raw_data=False)
+        valid_set = lgb.Dataset(X_values[valid_idx], label=y_values[valid_idx], reference=train_set)
+        train_set.save_binary(os.path.join(fold_dir, "train.bin"))
+        valid_set.save_binary(os.path.join(fold_dir, "valid.bin"))
+        np.save(os.path.join(fold_dir, "X_valid.npy"), X_values[valid_idx])
+        np.save(os.path.join(fold_dir, "y_valid.npy"), y_values[valid_idx])
+        folds.append(fold_dir)
+    return folds
+
+
+def _run_trial(trial_id, params, folds, num_threads, max_rounds, early_stopping_rounds):
+    """
+    Worker: cross-validates one parameter set on the cached folds with early
+    stopping. Runs in a pool process; num_threads keeps workers x threads
+    within the CPU count.
+    """
+    params = {**params, "num_threads": num_threads, "verbosity": -1}
+    started = time.perf_counter()
+    f1s, losses, rounds = [], [], []
+    for fold_dir in folds:
+        train_set = lgb.Dataset(os.path.join(fold_dir, "train.bin"))
+        valid_set = lgb.Dataset(os.path.join(fold_dir, "valid.bin"), reference=train_set)
+        booster = lgb.train(
+            params,
+            train_set,
+            num_boost_round=max_rounds,
+            valid_sets=[valid_set],
+            callbacks=[lgb.early_stopping(stopping_rounds=early_stopping_rounds, verbose=False)],
+        )
+        X_valid = np.load(os.path.join(fold_dir, "X_valid.npy"))
+        y_valid = np.load(os.path.join(fold_dir, "y_valid.npy"))
+        proba = booster.predict(X_valid, num_iteration=booster.best_iteration)
+        f1s.append(f1_score(y_valid, np.argmax(proba, axis=1), average="weighted"))
+        losses.append(booster.best_score["valid_0"][params["metric"]])
+        rounds.append(booster.best_iteration)
+    return {
+        "trial": trial_id,
+        "params": params,
+        "cv_f1_weighted": float(np.mean(f1s)),
+        "cv_f1_std": float(np.std(f1s)),
+        "cv_logloss": float(np.mean(losses)),
+        "best_iteration": int(np.mean(rounds)),
+        "fit_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def tune_hyperparameters(
+    X,
+    y,
+    base_params,
+    param_dist,
+    n_iter=25,
+    n_splits=3,
+    workers=None,
+    max_rounds=1000,
+    early_stopping_rounds=50,
+    random_state=42,
+    leaderboard_path=LEADERBOARD_PATH,
+):
+    """
+    Randomized search over param_dist, with trials run across a process pool.
+    Folds are split and binned once and shared by all trials. Each trial
+    early-stops on its validation folds.
+    Writes a leaderboard CSV (params, CV metrics, fit time), best first.
+    Returns (best_params, leaderboard DataFrame).
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, n_iter))
+    # Split cores between trials instead of letting every trial use all of them
+    num_threads = max(1, cpu_count // workers)
+    candidates = list(ParameterSampler(param_dist, n_iter=n_iter, random_state=random_state))
+    print(f"Tuning: {len(candidates)} trials x {n_splits} folds on {workers} workers ({num_threads} threads each)")
+
+    results = []
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="lgb_folds_") as cache_dir:
+        folds = _build_fold_cache(X, y, n_splits, random_state, cache_dir)
+        # spawn: forking after LightGBM/OpenMP has run in this process can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(_run_trial, i, {**base_params, **candidate}, folds,
+                            num_threads, max_rounds, early_stopping_rounds)
+                for i, candidate in enumerate(candidates)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"  trial {result['trial']:>3}: f1_weighted={result['cv_f1_weighted']:.4f} "
+                      f"logloss={result['cv_logloss']:.4f} rounds={result['best_iteration']} "
+                      f"({result['fit_seconds']}s) [{len(results)}/{len(candidates)}]")
+
+    leaderboard = pd.DataFrame([
+        {
+            **{k: v for k, v in r.items() if k != "params"},
+            **{k: r["params"][k] for k in param_dist},
+            "params": json.dumps({k: v for k, v in r["params"].items() if k != "num_threads"}, default=str),
+        }
+        for r in results
+    ]).sort_values(["cv_f1_weighted", "cv_logloss"], ascending=[False, True]).reset_index(drop=True)
+    leaderboard.insert(0, "rank", range(1, len(leaderboard) + 1))
+    os.makedirs(os.path.dirname(leaderboard_path) or ".", exist_ok=True)
+    leaderboard.to_csv(leaderboard_path, index=False)
+    print(f"Tuning finished in {time.perf_counter() - started:.1f}s; leaderboard saved to: {leaderboard_path}")
+    print(leaderboard.head(5)[["rank", "cv_f1_weighted", "cv_logloss", "best_iteration", "fit_seconds"]].to_string(index=False))
+
+    return json.loads(leaderboard.loc[0, "params"]), leaderboard
+
 # -------------------------
 # Model training pipeline
 # -------------------------
@@ -171,6 +306,7 @@ def train_and_evaluate(
     random_state=42,
     do_random_search=True,
     n_iter_search=25,
+    tune_workers=None,
 ):
     df = safe_read_csv(csv_path)
 
@@ -235,28 +371,15 @@ def train_and_evaluate(
 
     best_params = params.copy()
     if do_random_search:
-        print("Running quick RandomizedSearchCV (n_iter=%d) to tune key hyperparams..." % n_iter_search)
-        # build lgb estimator wrapper for sklearn
-        clf = lgb.LGBMClassifier(**params, n_estimators=500, n_jobs=-1)
-        fit_params = {
-            "eval_set": [(X_val, y_val)],
-            "eval_metric": "multi_logloss",
-        }
-        rs = RandomizedSearchCV(
-            estimator=clf,
-            param_distributions=param_dist,
+        best_params, _ = tune_hyperparameters(
+            X_train,
+            y_train,
+            base_params=params,
+            param_dist=param_dist,
             n_iter=n_iter_search,
-            scoring="f1_weighted",
-            cv=StratifiedKFold(n_splits=3, shuffle=True, random_state=random_state),
-            verbose=1,
+            workers=tune_workers,
             random_state=random_state,
-            n_jobs=-1,
         )
-        rs.fit(X_train, y_train, **fit_params)
-        print("RandomizedSearch best score:", rs.best_score_)
-        best_params = rs.best_params_
-        # ensure required params exist
-        best_params.update({"objective": "multiclass", "num_class": len(np.unique(y)), "verbosity": -1, "seed": random_state})
         print("Best params selected:", best_params)
     else:
         print("Skipping random search, using default params.")
@@ -320,6 +443,7 @@ def main():
     parser.add_argument("--smote", action="store_true", help="Apply SMOTE balancing to training set (requires imblearn)")
     parser.add_argument("--no-random-search", dest="do_rs", action="store_false", help="Disable randomized hyperparam search")
     parser.add_argument("--n-iter", type=int, default=25, help="Random search iterations")
+    parser.add_argument("--tune-workers", type=int, default=None, help="Parallel tuning processes (default: CPU count)")
     args = parser.parse_args()
 
     if not args.csv:
@@ -336,6 +460,7 @@ def main():
         use_smote=args.smote,
         do_random_search=args.do_rs,
         n_iter_search=args.n_iter,
+        tune_workers=args.tune_workers,
     )
 
     print("\nFinished. Summary:")
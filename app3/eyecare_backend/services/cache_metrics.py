@@ -0,0 +1,85 @@
+"""
+Per-namespace metrics for the @cached decorators
+
+Backend-wide numbers (Redis keyspace_hits, SimpleCache totals) mix every
+user of the cache together. The decorators record here, per key_prefix:
+
+- hits / misses (and stale hits served while refreshing ahead)
+- errors: cache backend failures and computations that raised
+- fills: recomputations that were stored, with their duration and the size
+  of the stored value
+
+so TTLs can be tuned per endpoint: a namespace with a low hit rate and a
+cheap fill does not need caching; an expensive fill with a high miss rate
+needs a longer TTL.
+"""
+import threading
+
+_COUNTERS = ('hits', 'stale_hits', 'misses', 'errors', 'uncacheable', 'fills')
+
+
+class CacheMetrics:
+    """Thread-safe counters keyed by namespace (the decorator's key_prefix)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._namespaces = {}
+
+    def _ns(self, namespace):
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            ns = self._namespaces[namespace] = dict.fromkeys(_COUNTERS, 0)
+            ns.update(fill_seconds=0.0, max_fill_seconds=0.0, bytes=0, max_bytes=0)
+        return ns
+
+    def incr(self, namespace, counter):
+        with self._lock:
+            self._ns(namespace)[counter] += 1
+
+    def hit(self, namespace, stale=False):
+        self.incr(namespace, 'stale_hits' if stale else 'hits')
+
+    def miss(self, namespace):
+        self.incr(namespace, 'misses')
+
+    def error(self, namespace):
+        self.incr(namespace, 'errors')
+
+    def fill(self, namespace, seconds, size=None):
+        """Record a recomputation that was stored (size in bytes, if known)"""
+        with self._lock:
+            ns = self._ns(namespace)
+            ns['fills'] += 1
+            ns['fill_seconds'] += seconds
+            ns['max_fill_seconds'] = max(ns['max_fill_seconds'], seconds)
+            if size is not None:
+                ns['bytes'] += size
+                ns['max_bytes'] = max(ns['max_bytes'], size)
+
+    def snapshot(self):
+        """Metrics per namespace, with derived hit rate and averages"""
+        with self._lock:
+            namespaces = {name: dict(ns) for name, ns in self._namespaces.items()}
+
+        result = {}
+        for name, ns in sorted(namespaces.items()):
+            hits = ns['hits'] + ns['stale_hits']
+            lookups = hits + ns['misses']
+            fills = ns['fills']
+            result[name] = {
+                **{counter: ns[counter] for counter in _COUNTERS},
+                'hit_rate': round(hits / lookups * 100, 1) if lookups else 0.0,
+                'avg_fill_ms': round(ns['fill_seconds'] / fills * 1000, 2) if fills else 0.0,
+                'max_fill_ms': round(ns['max_fill_seconds'] * 1000, 2),
+                'avg_size_bytes': round(ns['bytes'] / fills) if fills else 0,
+                'max_size_bytes': ns['max_bytes'],
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._namespaces.clear()
+
+
+# Shared by every @cached decorator in the process
+cache_metrics = CacheMetrics()
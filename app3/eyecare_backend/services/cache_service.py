@@ -1,49 +1,249 @@
 """
 Redis Cache Service
 Provides caching functionality for frequently accessed data
+
+Invalidation is tag based: every cached entry is registered under its
+key_prefix (plus optional extra tags such as "assessments:user:<id>"), and
+each tag has a generation counter ("cache:gen:<tag>") that is stored with the
+entry. A lookup reads the entry and the counters in one MGET and treats an
+entry stored under older generations as a miss. invalidate_tags() bumps the
+counters - one INCR per tag - so the old entries simply stop being read and
+are overwritten or expire on their TTL. Nothing runs KEYS against the shared
+Redis.
+
+Connections come from a BlockingConnectionPool (REDIS_MAX_CONNECTIONS,
+waiting up to REDIS_POOL_TIMEOUT seconds), values use the binary format of
+services/cache_serializer, and get_many()/set_many() batch keys into one
+round trip. Hits and misses are logged at DEBUG for a sample of
+CACHE_LOG_SAMPLE_RATE of the calls.
+
+Every Redis call goes through a circuit breaker (services/circuit_breaker).
+When Redis errors or slows down repeatedly the circuit opens and calls use a
+small in-process LocalCache instead of waiting on socket timeouts; tag
+invalidations made meanwhile are replayed on Redis once it recovers.
+
+The decorator records hits, misses, errors, fill time and value size per
+key_prefix in services/cache_metrics; get_cache_stats() reports them under
+"namespaces" (Redis's own keyspace counters are shared with everything else
+using the instance, e.g. the rate limiter).
 """
-import redis
-import json
+import fnmatch
+import logging
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from flask import request
+
+import redis
+
+from services.cache_metrics import cache_metrics
+from services.cache_serializer import CacheSerializer
+from services.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+LOG_SAMPLE_RATE = float(os.getenv('CACHE_LOG_SAMPLE_RATE', 0.01))
+
+serializer = CacheSerializer()
 
 # Initialize Redis client
 try:
-    redis_client = redis.Redis(
+    redis_pool = redis.BlockingConnectionPool(
         host=os.getenv('REDIS_HOST', 'localhost'),
         port=int(os.getenv('REDIS_PORT', 6379)),
         db=int(os.getenv('REDIS_DB', 0)),
         password=os.getenv('REDIS_PASSWORD', None),
-        decode_responses=True,
-        socket_timeout=5,
-        socket_connect_timeout=5
+        max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+        timeout=float(os.getenv('REDIS_POOL_TIMEOUT', 5)),
+        # Sub-second: a slow Redis must fail fast into the circuit breaker
+        # (REDIS_BREAKER_LATENCY) rather than stall the request
+        socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.5)),
+        socket_connect_timeout=2
     )
+    redis_client = redis.Redis(connection_pool=redis_pool)
     # Test connection
     redis_client.ping()
     REDIS_ENABLED = True
-    print("✅ Redis connection successful")
+    logger.info("Redis connection successful")
 except (redis.ConnectionError, redis.TimeoutError) as e:
-    print(f"⚠️  Redis connection failed: {e}. Caching disabled.")
+    logger.warning(f"Redis connection failed: {e}. Caching disabled.")
     redis_client = None
     REDIS_ENABLED = False
 
+class LocalCache:
+    """
+    In-process stand-in for Redis while the circuit is open
+    
+    Implements the subset of redis-py commands this module uses. Bounded
+    LRU (CACHE_LOCAL_MAX_ENTRIES) so an outage cannot grow it without limit.
+    """
+    
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', 1024))
+        self._data = OrderedDict()  # key -> (value, expires or None)
+        self._lock = threading.Lock()
+    
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[0]
+    
+    def _store(self, key, value, timeout=None):
+        self._data[key] = (value, time.monotonic() + timeout if timeout else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+    
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+    
+    def mget(self, keys):
+        with self._lock:
+            return [self._live(k) for k in keys]
+    
+    def setex(self, key, timeout, value):
+        with self._lock:
+            self._store(key, value, timeout)
+        return True
+    
+    def incr(self, key):
+        with self._lock:
+            value = int(self._live(key) or 0) + 1
+            self._store(key, str(value))
+            return value
+    
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(k, None) is not None for k in keys)
+    
+    def scan_iter(self, match='*', count=None):
+        with self._lock:
+            return iter([k for k in self._data if fnmatch.fnmatch(k, match)])
+    
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+    
+    def dbsize(self):
+        return len(self._data)
+    
+    def pipeline(self, transaction=False):
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    """Pipeline stand-in for LocalCache: runs each command, collects results"""
+    
+    def __init__(self, client):
+        self._client = client
+        self._results = []
+    
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+    
+        def command(*args, **kwargs):
+            self._results.append(method(*args, **kwargs))
+            return self
+        return command
+    
+    def execute(self):
+        results, self._results = self._results, []
+        return results
+
+
+local_cache = LocalCache()
+breaker = CircuitBreaker('redis')
+_pending_tags = set()
+_pending_lock = threading.Lock()
+
+def _call(op):
+    """
+    Run op(client) on Redis through the circuit breaker
+    
+    While the circuit is open op runs on the LocalCache instead, so a
+    degraded Redis costs nothing rather than a socket timeout per call.
+    """
+    if not breaker.allow():
+        return op(local_cache)
+    start = time.monotonic()
+    try:
+        result = op(redis_client)
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        breaker.record_failure(e)
+        return op(local_cache)
+    except Exception:
+        # Redis answered (e.g. a command error): not an availability problem
+        breaker.record_success(time.monotonic() - start)
+        raise
+    breaker.record_success(time.monotonic() - start)
+    if _pending_tags:
+        _replay_invalidations()
+    return result
+
+def _replay_invalidations():
+    """Apply tag invalidations that happened while the circuit was open"""
+    global _pending_tags
+    with _pending_lock:
+        tags, _pending_tags = _pending_tags, set()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(_tag_key(tag))
+        pipe.execute()
+    except Exception as e:
+        with _pending_lock:
+            _pending_tags |= tags
+        logger.warning(f"Cache invalidation replay error: {e}")
+
+def _log_sampled(message, *args):
+    """DEBUG-log a hot-path event for a sample of calls only"""
+    if LOG_SAMPLE_RATE > 0 and logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+        logger.debug(message, *args)
+
 def cache_key(*args, **kwargs):
     """Generate cache key from function arguments"""
     key_parts = [str(arg) for arg in args]
     key_parts.extend([f"{k}={v}" for k, v in sorted(kwargs.items())])
     return ":".join(key_parts)
 
-def cached(timeout=300, key_prefix=""):
+def _tag_key(tag):
+    return f"cache:gen:{tag}"
+
+def _resolve_tags(key_prefix, tags, args, kwargs):
+    """Tags for a cached call: the key_prefix plus static or computed extra tags"""
+    if callable(tags):
+        tags = tags(*args, **kwargs)
+    return ([key_prefix] if key_prefix else []) + list(tags or ())
+
+def tag_generations(tags):
+    """Current generation of each tag (0 if never invalidated)"""
+    if not tags:
+        return []
+    keys = [_tag_key(t) for t in tags]
+    return [int(v or 0) for v in _call(lambda client: client.mget(keys))]
+
+def cached(timeout=300, key_prefix="", tags=None):
     """
     Decorator to cache function results in Redis
     
     Args:
         timeout: Cache expiration time in seconds (default 5 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key (also registered as a tag)
+        tags: Extra tags - a list, or a callable taking the function's
+            arguments, e.g. lambda user_id: [f"assessments:user:{user_id}"]
     
     Example:
-        @cached(timeout=600, key_prefix="user_profile")
+        @cached(timeout=600, key_prefix="user_profile",
+                tags=lambda user_id: [f"user:{user_id}"])
         def get_user_profile(user_id):
             # Expensive database query
             return user_data
@@ -55,34 +255,123 @@ def cached(timeout=300, key_prefix=""):
                 # If Redis is disabled, just call the function
                 return f(*args, **kwargs)
             
-            # Generate cache key
-            key = f"{key_prefix}:{cache_key(*args, **kwargs)}"
+            try:
+                # One round trip: the entry plus its tags' current generations
+                key = f"{key_prefix}:{cache_key(*args, **kwargs)}"
+                keys = [key] + [_tag_key(t) for t in _resolve_tags(key_prefix, tags, args, kwargs)]
+                cached_value, *generations = _call(lambda client: client.mget(keys))
+                generations = [int(g or 0) for g in generations]
+            except Exception as e:
+                cache_metrics.error(key_prefix)
+                logger.warning(f"Cache error: {e}. Falling back to direct call.")
+                return f(*args, **kwargs)
+            
+            if cached_value is not None:
+                try:
+                    # Entries are stored as [generations, value]
+                    stored_generations, result = serializer.loads(cached_value)
+                    if stored_generations == generations:
+                        cache_metrics.hit(key_prefix)
+                        _log_sampled("Cache hit: %s", key)
+                        return result
+                except Exception as e:
+                    cache_metrics.error(key_prefix)
+                    logger.warning(f"Cache entry {key} unreadable ({e}); recomputing")
             
+            # Cache miss - call the function
+            cache_metrics.miss(key_prefix)
+            _log_sampled("Cache miss: %s", key)
+            start = time.perf_counter()
             try:
-                # Try to get from cache
-                cached_value = redis_client.get(key)
-                if cached_value:
-                    print(f"🎯 Cache hit: {key}")
-                    return json.loads(cached_value)
-                
-                # Cache miss - call the function
-                print(f"💾 Cache miss: {key}")
                 result = f(*args, **kwargs)
-                
-                # Store in cache
-                redis_client.setex(key, timeout, json.dumps(result))
-                return result
-                
+            except Exception:
+                cache_metrics.error(key_prefix)
+                raise
+            elapsed = time.perf_counter() - start
+            
+            # Store in cache, stamped with the generations read above: if a tag
+            # was invalidated meanwhile, the entry is already stale
+            try:
+                serialized = serializer.dumps([generations, result])
+                _call(lambda client: client.setex(key, timeout, serialized))
+                cache_metrics.fill(key_prefix, elapsed, len(serialized))
             except Exception as e:
-                print(f"⚠️  Cache error: {e}. Falling back to direct call.")
-                return f(*args, **kwargs)
+                cache_metrics.error(key_prefix)
+                logger.warning(f"Cache store error: {e}")
+            return result
         
         return wrapped
     return decorator
 
-def invalidate_cache(pattern):
+def get_many(keys):
+    """
+    Get several cached values in one round trip
+    
+    Returns:
+        Dict of key -> value for the keys that were found
+    """
+    keys = list(keys)
+    if not REDIS_ENABLED or not redis_client or not keys:
+        return {}
+    
+    try:
+        result = {}
+        for key, raw in zip(keys, _call(lambda client: client.mget(keys))):
+            if raw is not None:
+                result[key] = serializer.loads(raw)
+        return result
+    except Exception as e:
+        logger.warning(f"Cache get_many error: {e}")
+        return {}
+
+def set_many(mapping, timeout=300):
+    """Store several values (key -> value) in one pipelined round trip"""
+    if not REDIS_ENABLED or not redis_client or not mapping:
+        return
+    
+    try:
+        items = [(key, serializer.dumps(value)) for key, value in mapping.items()]
+    
+        def op(client):
+            pipe = client.pipeline(transaction=False)
+            for key, serialized in items:
+                pipe.setex(key, timeout, serialized)
+            return pipe.execute()
+        _call(op)
+    except Exception as e:
+        logger.warning(f"Cache set_many error: {e}")
+
+def invalidate_tags(*tags):
+    """
+    Invalidate every cached entry registered under any of the tags
+    
+    Example:
+        invalidate_tags("user_profile", "assessments:user:123")
+    """
+    if not REDIS_ENABLED or not redis_client:
+        return
+    
+    def op(client):
+        if client is local_cache:
+            # Redis is unreachable: remember the tags for when it's back
+            with _pending_lock:
+                _pending_tags.update(tags)
+        pipe = client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(_tag_key(tag))
+        return pipe.execute()
+    
+    try:
+        _call(op)
+    except Exception as e:
+        logger.warning(f"Cache invalidation error: {e}")
+
+def invalidate_cache(pattern, batch_size=500):
     """
-    Invalidate cache keys matching a pattern
+    Delete cache keys matching a glob pattern
+    
+    Walks the keyspace incrementally with SCAN instead of blocking Redis
+    with KEYS. Prefer invalidate_tags() where the entries are tagged.
     
     Args:
         pattern: Redis key pattern (e.g., "user_profile:user_123*")
@@ -93,13 +382,24 @@ def invalidate_cache(pattern):
     if not REDIS_ENABLED or not redis_client:
         return
     
+    def op(client):
+        deleted = 0
+        batch = []
+        for key in client.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += client.delete(*batch)
+                batch = []
+        if batch:
+            deleted += client.delete(*batch)
+        return deleted
+    
     try:
-        keys = redis_client.keys(pattern)
-        if keys:
-            redis_client.delete(*keys)
-            print(f"🗑️  Invalidated {len(keys)} cache keys matching '{pattern}'")
+        deleted = _call(op)
+        if deleted:
+            logger.info(f"Invalidated {deleted} cache keys matching '{pattern}'")
     except Exception as e:
-        print(f"⚠️  Cache invalidation error: {e}")
+        logger.warning(f"Cache invalidation error: {e}")
 
 def clear_all_cache():
     """Clear all cache (use with caution!)"""
@@ -107,16 +407,21 @@ def clear_all_cache():
         return
     
     try:
-        redis_client.flushdb()
-        print("🗑️  All cache cleared")
+        _call(lambda client: client.flushdb())
+        logger.info("All cache cleared")
     except Exception as e:
-        print(f"⚠️  Cache clear error: {e}")
+        logger.warning(f"Cache clear error: {e}")
 
 def get_cache_stats():
     """Get cache statistics"""
     if not REDIS_ENABLED or not redis_client:
         return {"enabled": False, "message": "Redis not available"}
     
+    if breaker.state == 'open':
+        return {"enabled": True, "circuit_breaker": breaker.snapshot(),
+                "fallback_keys": local_cache.dbsize(),
+                "namespaces": cache_metrics.snapshot()}
+    
     try:
         info = redis_client.info('stats')
         return {
@@ -124,7 +429,9 @@ def get_cache_stats():
             "total_keys": redis_client.dbsize(),
             "hits": info.get('keyspace_hits', 0),
             "misses": info.get('keyspace_misses', 0),
-            "hit_rate": round(info.get('keyspace_hits', 0) / max(info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0), 1) * 100, 2)
+            "hit_rate": round(info.get('keyspace_hits', 0) / max(info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0), 1) * 100, 2),
+            "circuit_breaker": breaker.snapshot(),
+            "namespaces": cache_metrics.snapshot()
         }
     except Exception as e:
         return {"enabled": False, "error": str(e)}
@@ -0,0 +1,107 @@
+"""
+Circuit breaker for remote dependencies (Redis)
+
+closed     Calls go through. Consecutive failures - errors, or calls slower
+           than latency_threshold - are counted; failure_threshold of them
+           open the circuit.
+open       Calls are refused immediately (callers use their fallback) for
+           recovery_timeout seconds.
+half_open  One probe call is let through. Success closes the circuit,
+           failure opens it again for another recovery_timeout.
+
+Defaults come from REDIS_BREAKER_FAILURES, REDIS_BREAKER_LATENCY (seconds)
+and REDIS_BREAKER_RECOVERY (seconds).
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker"""
+
+    def __init__(self, name, failure_threshold=None, latency_threshold=None, recovery_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv('REDIS_BREAKER_FAILURES', 5))
+        self.latency_threshold = latency_threshold or float(os.getenv('REDIS_BREAKER_LATENCY', 0.25))
+        self.recovery_timeout = recovery_timeout or float(os.getenv('REDIS_BREAKER_RECOVERY', 30))
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._trips = 0
+        self._last_error = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self):
+        """Whether the caller may use the dependency now (False: use the fallback)"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self, elapsed=0.0):
+        """Record a completed call; slow calls count as failures"""
+        if elapsed > self.latency_threshold:
+            self.record_failure(f'slow call ({elapsed * 1000:.0f} ms)')
+            return
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit '{self.name}' closed: dependency recovered")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error=None):
+        """Record a failed call; may open the circuit"""
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error is not None else None
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._trips += 1
+                    logger.warning(
+                        f"Circuit '{self.name}' opened after {self._failures} failures "
+                        f"(last: {self._last_error}); using fallback for {self.recovery_timeout:.0f}s"
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        """State for health/metrics endpoints"""
+        with self._lock:
+            state = self._current_state()
+            return {
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._failures,
+                'trips': self._trips,
+                'last_error': self._last_error,
+                'retry_in_seconds': (
+                    max(0.0, round(self.recovery_timeout - (time.monotonic() - self._opened_at), 1))
+                    if state == OPEN else None
+                ),
+            }
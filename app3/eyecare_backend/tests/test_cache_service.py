@@ -0,0 +1,209 @@
+"""
+Tests for the Redis cache service (tag invalidation)
+"""
+import fnmatch
+import pytest
+
+import redis
+
+from services import cache_service
+from services.circuit_breaker import CircuitBreaker
+
+
+class FakeRedis:
+    """Just enough of the redis-py client for the cache service"""
+
+    def __init__(self):
+        self.data = {}
+        self.keys_called = False
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, timeout, value):
+        self.data[key] = value
+
+    def mget(self, keys):
+        return [self.data.get(k) for k in keys]
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def delete(self, *keys):
+        return sum(self.data.pop(k, None) is not None for k in keys)
+
+    def keys(self, pattern):
+        self.keys_called = True
+        return [k for k in self.data if fnmatch.fnmatch(k, pattern)]
+
+    def scan_iter(self, match='*', count=None):
+        return iter([k for k in list(self.data) if fnmatch.fnmatch(k, match)])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(cache_service, 'redis_client', client)
+    monkeypatch.setattr(cache_service, 'REDIS_ENABLED', True)
+    monkeypatch.setattr(cache_service, 'breaker', CircuitBreaker('redis', failure_threshold=2, recovery_timeout=30))
+    monkeypatch.setattr(cache_service, 'local_cache', cache_service.LocalCache())
+    monkeypatch.setattr(cache_service, '_pending_tags', set())
+    return client
+
+
+def test_tag_invalidation_bumps_generation(fake_redis):
+    calls = []
+
+    @cache_service.cached(timeout=60, key_prefix='profile', tags=lambda user_id: [f'user:{user_id}'])
+    def get_profile(user_id):
+        calls.append(user_id)
+        return {'user_id': user_id, 'version': len(calls)}
+
+    assert get_profile('u1')['version'] == 1
+    assert get_profile('u1')['version'] == 1
+    assert get_profile('u2')['version'] == 2
+
+    # Only u1's entries are invalidated
+    cache_service.invalidate_tags('user:u1')
+    assert get_profile('u1')['version'] == 3
+    assert get_profile('u2')['version'] == 2
+
+    # The key_prefix is a tag too
+    cache_service.invalidate_tags('profile')
+    assert get_profile('u2')['version'] == 4
+    assert not fake_redis.keys_called
+
+
+def test_hit_is_one_round_trip(fake_redis, monkeypatch):
+    @cache_service.cached(timeout=60, key_prefix='profile', tags=lambda user_id: [f'user:{user_id}'])
+    def get_profile(user_id):
+        return {'user_id': user_id}
+
+    get_profile('u1')
+    commands = []
+    for name in ('get', 'mget'):
+        command = getattr(fake_redis, name)
+        monkeypatch.setattr(fake_redis, name,
+                            lambda *args, _name=name, _command=command: commands.append(_name) or _command(*args))
+    assert get_profile('u1') == {'user_id': 'u1'}
+    assert commands == ['mget']
+
+
+def test_pattern_invalidation_uses_scan(fake_redis):
+    fake_redis.data.update({'stats:a': '1', 'stats:b': '2', 'other:c': '3'})
+    cache_service.invalidate_cache('stats:*')
+    assert set(fake_redis.data) == {'other:c'}
+    assert not fake_redis.keys_called
+
+
+def test_get_many_set_many_round_trip(fake_redis):
+    cache_service.set_many({'a': {'x': 1}, 'b': [1, 2, 3]}, timeout=60)
+    assert cache_service.get_many(['a', 'b', 'missing']) == {'a': {'x': 1}, 'b': [1, 2, 3]}
+    # Stored in the binary format
+    assert fake_redis.data['a'].startswith(b'\x00')
+
+
+def test_serializer_compresses_large_values_and_reads_legacy_json():
+    from services.cache_serializer import CacheSerializer
+
+    serializer = CacheSerializer(codec='json', compress_threshold=64)
+    value = {'tips': ['drink water'] * 50}
+    data = serializer.dumps(value)
+    assert data[:3] == b'\x00jz'
+    assert len(data) < len(str(value))
+    assert serializer.loads(data) == value
+
+    # Entries written before the binary format are plain JSON text
+    assert serializer.loads('{"legacy": true}') == {'legacy': True}
+
+
+def test_circuit_opens_on_failures_and_recovers(fake_redis, monkeypatch):
+    calls = []
+
+    @cache_service.cached(timeout=60, key_prefix='tips')
+    def get_tips():
+        calls.append(1)
+        return {'version': len(calls)}
+
+    assert get_tips()['version'] == 1
+
+    # Redis goes away: after two failures the circuit opens and the
+    # in-process fallback serves without touching Redis
+    attempts = []
+
+    def down(*args, **kwargs):
+        attempts.append(1)
+        raise redis.ConnectionError('connection refused')
+    for command in ('get', 'mget', 'setex', 'pipeline'):
+        monkeypatch.setattr(fake_redis, command, down)
+    get_tips()
+    assert cache_service.breaker.state == 'open'
+    failed_attempts = len(attempts)
+    version = get_tips()['version']
+    assert get_tips()['version'] == version
+    assert len(attempts) == failed_attempts
+
+    # Invalidations made during the outage are replayed once Redis is back
+    cache_service.invalidate_tags('tips')
+    for command in ('get', 'mget', 'setex', 'pipeline'):
+        monkeypatch.delattr(fake_redis, command)
+    now = cache_service.time.monotonic()
+    monkeypatch.setattr('services.circuit_breaker.time.monotonic', lambda: now + 31)
+    assert cache_service.breaker.state == 'half_open'
+    get_tips()
+    assert cache_service.breaker.state == 'closed'
+    assert fake_redis.data['cache:gen:tips'] == '1'
+
+
+def test_slow_calls_trip_the_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=3, latency_threshold=0.1, recovery_timeout=30)
+    breaker.record_success(0.01)
+    for _ in range(3):
+        breaker.record_success(0.5)
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.snapshot()['trips'] == 1
+
+
+def test_metrics_per_key_prefix(fake_redis, monkeypatch):
+    monkeypatch.setattr(cache_service, 'cache_metrics', cache_service.cache_metrics.__class__())
+
+    @cache_service.cached(timeout=60, key_prefix='tips')
+    def get_tips(category):
+        return {'category': category, 'tips': ['blink often'] * 10}
+
+    @cache_service.cached(timeout=60, key_prefix='profile')
+    def get_profile(user_id):
+        return {'user_id': user_id}
+
+    get_tips('eyes')
+    get_tips('eyes')
+    get_tips('sleep')
+    get_profile('u1')
+
+    namespaces = cache_service.cache_metrics.snapshot()
+    assert namespaces['tips']['hits'] == 1
+    assert namespaces['tips']['misses'] == 2
+    assert namespaces['tips']['fills'] == 2
+    assert namespaces['tips']['hit_rate'] == 33.3
+    assert namespaces['tips']['max_size_bytes'] > namespaces['profile']['max_size_bytes'] > 0
+    assert namespaces['profile']['misses'] == 1
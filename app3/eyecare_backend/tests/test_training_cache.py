@@ -0,0 +1,34 @@
+"""
+EyeCare Backend Tests - Training Cache
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from lightgbm import LGBMClassifier
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ml_models")))
+
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+def test_cached_fit_matches_regular_fit(tmp_path, n_classes):
+    """fit_classifier leaves the same model state as LGBMClassifier.fit (pinned LightGBM internals)"""
+    from training_cache import DATASET_PARAMS, fit_classifier, prepare_training_data
+
+    rng = np.random.default_rng(5)
+    X = pd.DataFrame(rng.normal(size=(400, 4)), columns=["a", "b", "c", "d"])
+    X.iloc[::7, 1] = np.nan
+    y = ((X["a"] > 0).astype(int) + (n_classes == 3) * (X["c"] > 0.5)).to_numpy()
+    params = dict(n_estimators=30, num_leaves=8, min_child_samples=5, subsample=0.8,
+                  subsample_freq=1, random_state=3, verbose=-1)
+
+    prepared = prepare_training_data(str(tmp_path), "key", lambda: (None, X, y, X.head(50), y[:50], {}))
+    cached = fit_classifier(LGBMClassifier(**params), prepared)
+    regular = LGBMClassifier(**params, **DATASET_PARAMS).fit(X, y)
+
+    np.testing.assert_array_equal(cached.predict_proba(X), regular.predict_proba(X))
+    np.testing.assert_array_equal(cached.feature_importances_, regular.feature_importances_)
+    for attr in ("classes_", "n_classes_", "n_features_in_", "feature_name_", "objective_", "n_estimators_"):
+        assert np.all(getattr(cached, attr) == getattr(regular, attr)), attr
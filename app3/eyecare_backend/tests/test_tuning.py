@@ -0,0 +1,31 @@
+"""
+EyeCare Backend Tests - Hyperparameter Tuning
+"""
+import numpy as np
+import pandas as pd
+
+
+def test_parallel_search_writes_leaderboard(tmp_path):
+    """Trials run across the pool and are ranked best first"""
+    from models.train import tune_hyperparameters
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, 4)), columns=["a", "b", "c", "d"])
+    y = pd.Series((X["a"] + X["b"] > 0).astype(int) + (X["c"] > 1).astype(int))
+    base = {"objective": "multiclass", "num_class": 3, "metric": "multi_logloss",
+            "verbosity": -1, "seed": 42, "feature_pre_filter": False}
+    dist = {"num_leaves": [8, 16], "learning_rate": [0.05, 0.1]}
+    path = tmp_path / "leaderboard.csv"
+
+    best, leaderboard = tune_hyperparameters(
+        X, y, base, dist, n_iter=3, workers=2, max_rounds=200, leaderboard_path=str(path)
+    )
+
+    saved = pd.read_csv(path)
+    assert len(saved) == 3
+    assert list(saved["rank"]) == [1, 2, 3]
+    assert saved["cv_f1_weighted"].is_monotonic_decreasing
+    assert (saved["best_iteration"] < 200).all()  # early stopping kicked in
+    assert {"num_leaves", "learning_rate", "fit_seconds", "params"} <= set(saved.columns)
+    assert best["num_leaves"] == leaderboard.loc[0, "num_leaves"]
+    assert "num_threads" not in best
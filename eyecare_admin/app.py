@@ -179,6 +179,18 @@ limiter = Limiter(
 )
 
 
+@app.before_request
+def _ensure_cache_bus():
+    # Subscribe each worker process to cross-worker cache invalidations.
+    # Done lazily per pid so it also works with gunicorn's preload_app (fork).
+    from utils.cache import start_invalidation_bus
+    start_invalidation_bus()
+    if not _IS_TESTING:
+        from utils.cache_warmer import note_request, start_cache_warmer
+        start_cache_warmer(app)
+        note_request()
+
+
 @app.after_request
 def _add_security_headers(response):
     # Basic security headers (safe defaults). Tune further if you add CSP/nonces.
@@ -325,6 +337,7 @@ from routes.admin_routes import admin_bp
 from routes.logs import logs_bp
 from routes.notifications import notifications_bp
 from routes.reports import reports_bp
+from routes.exports import exports_bp
 from api_docs import docs_bp
 from flask_wtf.csrf import generate_csrf
 
@@ -347,6 +360,7 @@ app.register_blueprint(admin_bp, url_prefix='/api/admin')
 app.register_blueprint(logs_bp, url_prefix='/api/logs')
 app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
 app.register_blueprint(reports_bp, url_prefix='/api/reports')
+app.register_blueprint(exports_bp, url_prefix='/api/exports')
 app.register_blueprint(docs_bp)  # API documentation
 
 
@@ -554,11 +568,19 @@ def health_check():
             'database': db_status
         }), 503
     
-    return jsonify({
+    health = {
         'status': 'healthy',
         'database': db_status,
         'timestamp': datetime.now().isoformat()
-    }), 200
+    }
+    # An open Redis circuit is served from the in-memory fallback: degraded, not down
+    from utils.redis_cache import circuit_state
+    redis_circuit = circuit_state()
+    if redis_circuit is not None:
+        health['redis_circuit'] = redis_circuit
+        if redis_circuit['state'] != 'closed':
+            health['status'] = 'degraded'
+    return jsonify(health), 200
 
 # Cache monitoring endpoint (admin only)
 @app.route('/api/cache/stats')
@@ -581,9 +603,10 @@ def cache_stats():
 def clear_cache():
     """Clear cache (all or by prefix)"""
     try:
-        from utils.cache import invalidate_cache
+        from utils.cache import invalidate_cache, invalidate_prefix
         prefix = request.json.get('prefix') if request.json else None
-        count = invalidate_cache(prefix)
+        # A key prefix, not a tag: 'assessment' also clears 'assessment_stats'
+        count = invalidate_prefix(prefix) if prefix else invalidate_cache()
         return jsonify({
             'message': f'Cache cleared successfully',
             'entries_removed': count if prefix else 'all'
@@ -2,12 +2,55 @@
 Database Models Mapping for MySQL (eyecare_db)
 Maps existing MySQL tables to SQLAlchemy models
 """
+import json
+from functools import lru_cache
+
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+_UNSET = object()
+
+# Assessment.to_dict() keys sourced from the assessment_data JSON blob:
+# output key -> (JSON key, default)
+_ASSESSMENT_JSON_FIELDS = {
+    'age': ('age', None),
+    'bmi': ('bmi', None),
+    'blood_pressure': ('blood_pressure', None),
+    'blood_sugar': ('blood_sugar', None),
+    'smoking': ('smoking', False),
+    'alcohol': ('alcohol', False),
+    'screen_time': ('screen_time_hours', None),
+    'sleep_hours': ('sleep_hours', None),
+    'exercise_frequency': ('physical_activity_level', None),
+    'blurred_vision': ('blurred_vision', False),
+    'eye_pain': ('eye_pain', False),
+    'redness': ('redness', False),
+    'dry_eyes': ('dry_eyes', False),
+}
+
+# All keys produced by Assessment.to_dict(), in output order.
+ASSESSMENT_FIELDS = (
+    'id', 'user_id', 'user_name',
+    *_ASSESSMENT_JSON_FIELDS,
+    'risk_level', 'risk_score', 'predicted_disease', 'confidence',
+    'model_version', 'created_at',
+)
+
+
+@lru_cache(maxsize=4096)
+def _parse_assessment_json(raw):
+    """Decode an assessment_data payload; results are shared, treat as read-only."""
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
 # ===========================================
 # EXISTING MYSQL TABLES (from app3)
 # ===========================================
@@ -29,8 +72,20 @@ class User(db.Model):
     
     # Relationships
     assessments = db.relationship('Assessment', backref='user', lazy=True)
-    
-    def to_dict(self):
+
+    def to_dict(self, total_assessments=None):
+        """Serialize a user.
+
+        Pass `total_assessments` when the count was already fetched (see
+        `with_assessment_counts`); otherwise a single COUNT query is issued
+        instead of loading every assessment row.
+        """
+        if total_assessments is None:
+            total_assessments = (
+                db.session.query(db.func.count(Assessment.assessment_id))
+                .filter(Assessment.user_id == self.user_id)
+                .scalar()
+            )
         return {
             'id': self.user_id,
             'full_name': self.full_name or self.username,
@@ -39,9 +94,55 @@ class User(db.Model):
             'status': self.status or 'active',
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'last_login': None,
-            'total_assessments': len(self.assessments) if self.assessments else 0
+            'total_assessments': int(total_assessments or 0)
         }
 
+    @staticmethod
+    def assessment_counts(user_ids):
+        """{user_id: assessment count} for the given users, from one grouped query."""
+        if not user_ids:
+            return {}
+        rows = (
+            db.session.query(Assessment.user_id, db.func.count(Assessment.assessment_id))
+            .filter(Assessment.user_id.in_(user_ids))
+            .group_by(Assessment.user_id)
+            .all()
+        )
+        return dict(rows)
+
+    @staticmethod
+    def serialize_page(users):
+        """Serialize a page of users; counts come from one query over the page's ids."""
+        counts = User.assessment_counts([user.user_id for user in users])
+        return [user.to_dict(total_assessments=counts.get(user.user_id, 0)) for user in users]
+
+    @staticmethod
+    def with_assessment_counts(query):
+        """Attach per-user assessment counts to a User query.
+
+        Outer-joins one grouped subquery over all of assessment_results, so
+        rows come back as (User, total_assessments) tuples. Meant for streams
+        that cover the whole table (exports); for a single page use
+        `serialize_page`, which only counts that page's users.
+        """
+        counts = (
+            db.session.query(
+                Assessment.user_id.label('user_id'),
+                db.func.count(Assessment.assessment_id).label('total_assessments'),
+            )
+            .group_by(Assessment.user_id)
+            .subquery()
+        )
+        return (
+            query.outerjoin(counts, counts.c.user_id == User.user_id)
+            .add_columns(db.func.coalesce(counts.c.total_assessments, 0))
+        )
+
+    @staticmethod
+    def serialize_with_counts(rows):
+        """Serialize (User, total_assessments) rows from `with_assessment_counts`."""
+        return [user.to_dict(total_assessments=count) for user, count in rows]
+
 class Assessment(db.Model):
     """Maps to 'assessment_results' table in MySQL"""
     __tablename__ = 'assessment_results'
@@ -68,41 +169,73 @@ class Assessment(db.Model):
         """Alias for compatibility"""
         return self.assessed_at
     
-    def to_dict(self):
-        import json
-        
-        # Parse assessment_data JSON if available
+    @property
+    def parsed_assessment_data(self):
+        """`assessment_data` decoded as a dict (parsed once per distinct payload)."""
+        return _parse_assessment_json(self.assessment_data)
+
+    def to_dict(self, fields=None, user_name=_UNSET):
+        """Serialize an assessment.
+
+        Args:
+            fields: Optional iterable of keys from ASSESSMENT_FIELDS to include.
+            user_name: Pre-fetched user full name (see `with_user_names`);
+                when omitted the `user` relationship is used.
+        """
+        wanted = ASSESSMENT_FIELDS if fields is None else fields
         assessment_json = {}
-        if self.assessment_data:
-            try:
-                assessment_json = json.loads(self.assessment_data)
-            except:
-                pass
-        
-        return {
-            'id': self.assessment_id,
-            'user_id': self.user_id,
-            'user_name': self.user.full_name if self.user else 'N/A',
-            'age': assessment_json.get('age'),
-            'bmi': assessment_json.get('bmi'),
-            'blood_pressure': assessment_json.get('blood_pressure'),
-            'blood_sugar': assessment_json.get('blood_sugar'),
-            'smoking': assessment_json.get('smoking', False),
-            'alcohol': assessment_json.get('alcohol', False),
-            'screen_time': assessment_json.get('screen_time_hours'),
-            'sleep_hours': assessment_json.get('sleep_hours'),
-            'exercise_frequency': assessment_json.get('physical_activity_level'),
-            'blurred_vision': assessment_json.get('blurred_vision', False),
-            'eye_pain': assessment_json.get('eye_pain', False),
-            'redness': assessment_json.get('redness', False),
-            'dry_eyes': assessment_json.get('dry_eyes', False),
-            'risk_level': self.risk_level.lower() if self.risk_level else 'low',
-            'risk_score': self.risk_score,
-            'predicted_disease': self.predicted_disease,
-            'confidence': self.confidence_score,
-            'model_version': self.model_version,
-            'created_at': self.assessed_at.isoformat() if self.assessed_at else None
-        }
+        if any(f in _ASSESSMENT_JSON_FIELDS for f in wanted):
+            assessment_json = self.parsed_assessment_data
+
+        if 'user_name' in wanted and user_name is _UNSET:
+            user_name = self.user.full_name if self.user else None
+
+        data = {}
+        for field in wanted:
+            if field in _ASSESSMENT_JSON_FIELDS:
+                json_key, default = _ASSESSMENT_JSON_FIELDS[field]
+                data[field] = assessment_json.get(json_key, default)
+            elif field == 'id':
+                data[field] = self.assessment_id
+            elif field == 'user_id':
+                data[field] = self.user_id
+            elif field == 'user_name':
+                data[field] = user_name or 'N/A'
+            elif field == 'risk_level':
+                data[field] = self.risk_level.lower() if self.risk_level else 'low'
+            elif field == 'risk_score':
+                data[field] = self.risk_score
+            elif field == 'predicted_disease':
+                data[field] = self.predicted_disease
+            elif field == 'confidence':
+                data[field] = self.confidence_score
+            elif field == 'model_version':
+                data[field] = self.model_version
+            elif field == 'created_at':
+                data[field] = self.assessed_at.isoformat() if self.assessed_at else None
+        return data
+
+    @staticmethod
+    def with_user_names(query, fields=None):
+        """Attach the owning user's full name to an Assessment query.
+
+        Rows come back as (Assessment, user_full_name) tuples from a single
+        outer join. Blob columns that the requested `fields` do not need are
+        deferred so they are never transferred.
+        """
+        options = [db.defer(Assessment.per_disease_scores)]
+        if fields is not None and not any(f in _ASSESSMENT_JSON_FIELDS for f in fields):
+            options.append(db.defer(Assessment.assessment_data))
+        return (
+            query.outerjoin(User, User.user_id == Assessment.user_id)
+            .add_columns(User.full_name)
+            .options(*options)
+        )
+
+    @staticmethod
+    def serialize_with_user_names(rows, fields=None):
+        """Serialize (Assessment, user_full_name) rows from `with_user_names`."""
+        return [assessment.to_dict(fields=fields, user_name=name) for assessment, name in rows]
 
 class HealthTip(db.Model):
     """Maps to 'health_tips' table in MySQL"""
@@ -379,6 +512,104 @@ class ArchivedEntity(db.Model):
             'reason': self.reason,
         }
 
+class ExportJob(db.Model):
+    """Background export jobs and their downloadable artifacts"""
+    __tablename__ = 'export_jobs'
+
+    id = db.Column(db.String(36), primary_key=True)
+    export_type = db.Column(db.String(50), nullable=False)  # users, assessments, logs, comprehensive
+    format = db.Column(db.String(20), nullable=False)  # csv, json, excel
+    params = db.Column(db.Text)  # JSON query-string of the originating request
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, completed, failed
+    rows_written = db.Column(db.Integer, default=0, nullable=False)
+    total_rows = db.Column(db.Integer)
+    file_path = db.Column(db.String(500))
+    file_size = db.Column(db.BigInteger)
+    error = db.Column(db.Text)
+    requested_by = db.Column(db.Integer, db.ForeignKey('admins.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)  # exporter heartbeat
+
+    requester = db.relationship('Admin', backref=db.backref('export_jobs', lazy=True))
+
+    def to_dict(self):
+        progress = None
+        if self.status == 'completed':
+            progress = 100.0
+        elif self.total_rows:
+            progress = round(min(self.rows_written / self.total_rows, 1.0) * 100, 1)
+        return {
+            'id': self.id,
+            'export_type': self.export_type,
+            'format': self.format,
+            'filename': self.filename,
+            'status': self.status,
+            'rows_written': self.rows_written,
+            'total_rows': self.total_rows,
+            'progress': progress,
+            'file_size': self.file_size,
+            'error': self.error,
+            'requested_by': self.requested_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+def _training_job_slot(context):
+    # Queued/running jobs share one unique slot, so the database admits only one
+    status = context.get_current_parameters().get('status', 'queued')
+    return TrainingJob.ACTIVE_SLOT if status in ('queued', 'running') else None
+
+
+class TrainingJob(db.Model):
+    """Background model retraining jobs (see utils/training_jobs)"""
+    __tablename__ = 'training_jobs'
+    ACTIVE_SLOT = 'active'
+
+    id = db.Column(db.String(36), primary_key=True)
+    dataset_path = db.Column(db.String(500), nullable=False)
+    mode = db.Column(db.String(20), default='full', nullable=False)  # full, continue, refit (see incremental_training)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, completed, failed, cancelled
+    stage = db.Column(db.String(30))  # loading, fitting, evaluating, saving
+    progress = db.Column(db.Float, default=0.0, nullable=False)  # percent
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    result = db.Column(db.Text)  # JSON training summary
+    error = db.Column(db.Text)
+    metrics_id = db.Column(db.Integer, db.ForeignKey('ml_metrics.id'))
+    requested_by = db.Column(db.Integer, db.ForeignKey('admins.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)  # trainer heartbeat
+    completed_at = db.Column(db.DateTime)
+    # ACTIVE_SLOT while queued/running, NULL once finished; unique, so a second
+    # active job fails to insert (NULLs never collide)
+    active_slot = db.Column(db.String(10), unique=True, default=_training_job_slot)
+
+    requester = db.relationship('Admin', backref=db.backref('training_jobs', lazy=True))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'dataset_path': self.dataset_path,
+            'mode': self.mode,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': round(self.progress or 0.0, 1),
+            'cancel_requested': self.cancel_requested,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'metrics_id': self.metrics_id,
+            'requested_by': self.requested_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
 class PendingAction(db.Model):
     """Pending actions that require approval"""
     __tablename__ = 'pending_actions'
@@ -417,8 +648,15 @@ class PendingAction(db.Model):
 def init_db():
     """Initialize database with admin tables and default data"""
     import os
+    from utils.text_search import ensure_text_search_indexes
     db.create_all()
     
+    try:
+        ensure_text_search_indexes(db.engine)
+    except Exception as e:
+        # Search still works without the indexes, just slower
+        print(f"Could not create text search indexes: {e}")
+    
     # Create default super admin if not exists
     if not Admin.query.filter_by(username='admin').first():
         is_production = (os.getenv('FLASK_ENV', '').lower() == 'production') or bool(os.getenv('RENDER'))
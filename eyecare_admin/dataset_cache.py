@@ -0,0 +1,319 @@
+"""Validated, typed columnar cache for risk-model training datasets.
+
+Uploads are validated against RISK_DATASET_SCHEMA while being read in
+chunks, then converted once into a typed columnar copy keyed by the SHA-256
+of the file contents:
+
+    <cache dir>/<sha256>/meta.json      schema, row count, summary statistics
+    <cache dir>/<sha256>/data.parquet   when pyarrow is installed
+    <cache dir>/<sha256>/<column>.npy   otherwise (loaded as memory maps)
+
+`load_dataset()` is what training uses: it returns the cached frame (building
+it on first use), so repeated training runs skip CSV parsing and dtype
+inference entirely. A small index maps (path, size, mtime) to the content
+hash so unchanged files are not re-hashed either.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (parquet engine)
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+TARGET_COLUMN = "Eye_Disease_Risk"
+
+# column -> (dtype, (min, max) or allowed values, required). Feature columns
+# are validated when present; the pipeline trains on whichever are supplied.
+RISK_DATASET_SCHEMA: dict[str, tuple[str, Any, bool]] = {
+    "Age": ("float32", (0, 120), False),
+    "Gender": ("category", ("Male", "Female", "Other"), False),
+    "BMI": ("float32", (5, 100), False),
+    "Screen_Time_Hours": ("float32", (0, 24), False),
+    "Sleep_Hours": ("float32", (0, 24), False),
+    "Smoker": ("float32", (0, 1), False),
+    "Alcohol_Use": ("float32", (0, 1), False),
+    "Diabetes": ("float32", (0, 1), False),
+    "Hypertension": ("float32", (0, 1), False),
+    "Family_History_Eye_Disease": ("float32", (0, 1), False),
+    "Outdoor_Exposure_Hours": ("float32", (0, 24), False),
+    "Diet_Score": ("float32", (0, 10), False),
+    "Water_Intake_Liters": ("float32", (0, 20), False),
+    "Glasses_Usage": ("float32", (0, 1), False),
+    "Previous_Eye_Surgery": ("float32", (0, 1), False),
+    "Physical_Activity_Level": ("float32", (0, 10), False),
+    TARGET_COLUMN: ("int8", (0, 1), True),
+}
+
+CHUNK_ROWS = 50_000
+MAX_REPORTED_ERRORS = 20
+HASH_BLOCK = 1 << 20
+CACHE_DIR_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "dataset", ".cache")
+
+
+class DatasetValidationError(ValueError):
+    """The dataset does not match the expected schema."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__("; ".join(errors[:5]) + (f" (+{len(errors) - 5} more)" if len(errors) > 5 else ""))
+        self.errors = errors
+
+
+@dataclass
+class CachedDataset:
+    content_hash: str
+    path: str
+    rows: int
+    format: str
+    stats: dict[str, Any] = field(default_factory=dict)
+
+
+def cache_dir() -> str:
+    return os.getenv("DATASET_CACHE_DIR") or CACHE_DIR_DEFAULT
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fileobj:
+        for block in iter(lambda: fileobj.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _iter_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Raw (all-string) chunks of a CSV/XLSX file."""
+    if path.lower().endswith(".xlsx"):
+        frame = pd.read_excel(path, dtype=str)
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+        return
+    yield from pd.read_csv(path, dtype=str, chunksize=chunk_rows, skipinitialspace=True)
+
+
+def _check_columns(columns: list[str]) -> list[str]:
+    errors = []
+    missing = [name for name, (_, _, required) in RISK_DATASET_SCHEMA.items() if required and name not in columns]
+    if missing:
+        errors.append(f"Missing columns: {', '.join(missing)}")
+    unknown = [name for name in columns if name not in RISK_DATASET_SCHEMA]
+    if unknown:
+        errors.append(f"Unexpected columns: {', '.join(unknown)}")
+    return errors
+
+
+def _convert_chunk(chunk: pd.DataFrame, first_row: int, errors: list[str]) -> dict[str, np.ndarray]:
+    """Typed column arrays for one raw chunk; problems are appended to `errors`."""
+    columns: dict[str, np.ndarray] = {}
+    for name, (dtype, domain, _) in RISK_DATASET_SCHEMA.items():
+        if name not in chunk.columns:
+            continue
+        raw = chunk[name]
+        present = raw.notna() & (raw.str.strip() != "")
+
+        if dtype == "category":
+            values = raw.where(present).str.strip()
+            invalid = present & ~values.isin(domain)
+            columns[name] = values.to_numpy(dtype=object)
+        else:
+            values = pd.to_numeric(raw.where(present), errors="coerce")
+            lo, hi = domain
+            invalid = (present & values.isna()) | (values < lo) | (values > hi)
+            if name == TARGET_COLUMN:
+                invalid |= ~present
+            columns[name] = values.to_numpy(dtype="float64")
+
+        for index in np.flatnonzero(invalid.to_numpy())[: max(0, MAX_REPORTED_ERRORS - len(errors))]:
+            # +2: header line and 1-based rows
+            errors.append(f"Row {first_row + index + 2}, {name}: invalid value {raw.iloc[index]!r}")
+    return columns
+
+
+def _summary_stats(frame: pd.DataFrame) -> dict[str, Any]:
+    stats: dict[str, Any] = {}
+    for name, column in frame.items():
+        missing = int(column.isna().sum())
+        if column.dtype == object or str(column.dtype) == "category":
+            counts = column.value_counts()
+            stats[name] = {"missing": missing, "counts": {str(k): int(v) for k, v in counts.items()}}
+        else:
+            values = column.astype("float64")
+            stats[name] = {
+                "missing": missing,
+                "mean": None if values.count() == 0 else round(float(values.mean()), 4),
+                "std": None if values.count() < 2 else round(float(values.std()), 4),
+                "min": None if values.count() == 0 else float(values.min()),
+                "max": None if values.count() == 0 else float(values.max()),
+            }
+    target = frame[TARGET_COLUMN]
+    stats["_target_rate"] = round(float(target.mean()), 4) if len(target) else None
+    return stats
+
+
+def validate_dataset(path: str, chunk_rows: int = CHUNK_ROWS) -> pd.DataFrame:
+    """Read and validate a dataset chunk by chunk; returns the typed frame.
+
+    Raises:
+        DatasetValidationError: listing missing/unexpected columns or the
+            first invalid values found
+    """
+    errors: list[str] = []
+    parts: dict[str, list[np.ndarray]] = {}
+    rows = 0
+    for chunk in _iter_chunks(path, chunk_rows):
+        chunk.columns = [str(c).strip() for c in chunk.columns]
+        if rows == 0:
+            column_errors = _check_columns(list(chunk.columns))
+            if column_errors:
+                raise DatasetValidationError(column_errors)
+        for name, values in _convert_chunk(chunk, rows, errors).items():
+            parts.setdefault(name, []).append(values)
+        rows += len(chunk)
+
+    if rows == 0:
+        errors.append("Dataset has no rows")
+    if errors:
+        raise DatasetValidationError(errors)
+
+    frame = pd.DataFrame({
+        name: (
+            pd.Categorical(np.concatenate(values), categories=RISK_DATASET_SCHEMA[name][1])
+            if RISK_DATASET_SCHEMA[name][0] == "category"
+            else np.concatenate(values).astype(RISK_DATASET_SCHEMA[name][0])
+        )
+        for name, values in parts.items()
+    })
+    if frame[TARGET_COLUMN].nunique() < 2:
+        raise DatasetValidationError([f"{TARGET_COLUMN} must contain both classes"])
+    return frame
+
+
+def _write_columns(frame: pd.DataFrame, directory: str) -> str:
+    if PARQUET_AVAILABLE:
+        frame.to_parquet(os.path.join(directory, "data.parquet"), index=False)
+        return "parquet"
+    for name, column in frame.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            array = column.cat.codes.to_numpy()  # int8 codes, -1 = missing
+        else:
+            array = column.to_numpy()
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    return "npy"
+
+
+def _read_columns(directory: str, meta: dict[str, Any]) -> pd.DataFrame:
+    if meta["format"] == "parquet":
+        return pd.read_parquet(os.path.join(directory, "data.parquet"))
+    columns = {}
+    for name, dtype in meta["dtypes"].items():
+        array = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        if dtype == "category":
+            columns[name] = pd.Categorical.from_codes(array, categories=meta["categories"][name])
+        else:
+            columns[name] = array
+    return pd.DataFrame(columns, copy=False)
+
+
+def ingest_dataset(path: str, content_hash: str | None = None) -> CachedDataset:
+    """Validate `path` and store its typed columnar copy (no-op if already cached)."""
+    content_hash = content_hash or file_sha256(path)
+    directory = os.path.join(cache_dir(), content_hash)
+    meta_path = os.path.join(directory, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as fileobj:
+            meta = json.load(fileobj)
+        if _load_index().get(_file_key(path)) != content_hash:
+            _remember_hash(path, content_hash)
+        return CachedDataset(content_hash, path, meta["rows"], meta["format"], meta["stats"])
+
+    frame = validate_dataset(path)
+    meta = {
+        "source": os.path.basename(path),
+        "rows": int(len(frame)),
+        "dtypes": {name: RISK_DATASET_SCHEMA[name][0] for name in frame.columns},
+        "categories": {
+            name: list(RISK_DATASET_SCHEMA[name][1])
+            for name in frame.columns if RISK_DATASET_SCHEMA[name][0] == "category"
+        },
+        "stats": _summary_stats(frame),
+    }
+
+    # Build in a temp dir and rename, so readers never see a partial cache
+    os.makedirs(cache_dir(), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{content_hash[:12]}-", dir=cache_dir())
+    try:
+        meta["format"] = _write_columns(frame, staging)
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as fileobj:
+            json.dump(meta, fileobj, indent=2)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # Another process cached the same content first
+            if not os.path.exists(meta_path):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    _remember_hash(path, content_hash)
+    return CachedDataset(content_hash, path, meta["rows"], meta["format"], meta["stats"])
+
+
+def _index_path() -> str:
+    return os.path.join(cache_dir(), "index.json")
+
+
+def _file_key(path: str) -> str:
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def _load_index() -> dict[str, str]:
+    try:
+        with open(_index_path(), encoding="utf-8") as fileobj:
+            return json.load(fileobj)
+    except (OSError, ValueError):
+        return {}
+
+
+def _remember_hash(path: str, content_hash: str) -> None:
+    index = _load_index()
+    index[_file_key(path)] = content_hash
+    tmp = f"{_index_path()}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fileobj:
+        json.dump(index, fileobj)
+    os.replace(tmp, _index_path())
+
+
+def dataset_hash(path: str) -> str:
+    """Content hash of an ingested dataset (ingesting it first if needed)."""
+    content_hash = _load_index().get(_file_key(path))
+    if content_hash is None or not os.path.exists(os.path.join(cache_dir(), content_hash, "meta.json")):
+        content_hash = ingest_dataset(path).content_hash
+    return content_hash
+
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """Typed training frame for `path`, from the columnar cache (built on first use).
+
+    Gender is returned as plain strings, matching what the model sees at
+    prediction time.
+    """
+    directory = os.path.join(cache_dir(), dataset_hash(path))
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as fileobj:
+        meta = json.load(fileobj)
+    frame = _read_columns(directory, meta)
+    for name in meta.get("categories", {}):
+        frame[name] = frame[name].astype(object).where(frame[name].notna(), np.nan)
+    return frame
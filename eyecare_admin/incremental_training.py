@@ -0,0 +1,319 @@
+"""Incremental updates of the risk model from new assessment results.
+
+A full retrain re-reads the whole CSV. This module updates the current model
+instead, using only labeled assessments recorded since the last update:
+
+1. Pull `assessment_results` rows after the watermark, in keyset chunks of
+   (assessed_at, assessment_id). A row counts as labeled when its
+   `assessment_data` carries a confirmed `Eye_Disease_Risk` of 0 or 1. The
+   model's own predictions are never used as labels.
+2. Send a fixed ~20% of new rows to a holdout, chosen by hashing
+   assessment_id, so a row stays in the holdout on every later run. The
+   base training run's cached test split is added to that holdout.
+3. Update the booster, either by continuing to boost from it
+   (`init_model`, mode "continue") or by refitting its leaf values on the
+   new rows (`Booster.refit`, mode "refit").
+4. Compare candidate and current model log loss on the holdout. Promote
+   the candidate (atomic file replace) only if it is no worse than the
+   current model, within PROMOTION_TOLERANCE. The watermark advances only
+   on promotion.
+
+The watermark and holdout reference live next to the model in
+`<model_path>.state.json`. A full retrain resets the watermark, because
+the new model has not seen any assessment rows.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Iterator
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMClassifier
+from sklearn.metrics import (
+    accuracy_score,
+    confusion_matrix,
+    f1_score,
+    log_loss,
+    precision_score,
+    recall_score,
+    roc_auc_score,
+)
+from sklearn.pipeline import Pipeline
+from sqlalchemy import and_, or_, select
+
+from dataset_cache import cache_dir
+from training_cache import DATASET_PARAMS, attach_booster, booster_params, load_holdout
+
+LABEL_KEY = "Eye_Disease_Risk"
+CHUNK_SIZE = 5000
+HOLDOUT_PERCENT = 20
+MIN_TRAIN_ROWS = 50
+CONTINUE_ROUNDS = 50
+REFIT_DECAY = 0.9  # weight kept by the old leaf values when refitting
+PROMOTION_TOLERANCE = 0.002  # allowed holdout log loss increase
+
+ProgressCallback = Callable[[str, float], None]
+
+
+@dataclass
+class IncrementalResult:
+    promoted: bool
+    reason: str
+    mode: str
+    model_path: str
+    n_rows: int = 0  # new labeled rows pulled
+    n_train: int = 0
+    n_holdout: int = 0
+    current_logloss: float | None = None
+    candidate_logloss: float | None = None
+    accuracy: float = float("nan")
+    precision: float = float("nan")
+    recall: float = float("nan")
+    f1: float = float("nan")
+    roc_auc: float = float("nan")
+    confusion_matrix: list[list[int]] = field(default_factory=list)
+    feature_importance_json: str = "{}"
+    watermark: dict[str, Any] | None = None
+
+    def summary(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("feature_importance_json")
+        if np.isnan(data["roc_auc"]):
+            data["roc_auc"] = None
+        return data
+
+
+def state_path(model_path: str) -> str:
+    return f"{model_path}.state.json"
+
+
+def read_model_state(model_path: str) -> dict[str, Any]:
+    try:
+        with open(state_path(model_path), encoding="utf-8") as fileobj:
+            return json.load(fileobj)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_model_state(model_path: str, state: dict[str, Any]) -> None:
+    tmp = f"{state_path(model_path)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fileobj:
+        json.dump(state, fileobj, indent=2, default=str)
+    os.replace(tmp, state_path(model_path))
+
+
+def _in_holdout(assessment_id: str) -> bool:
+    digest = hashlib.sha1(str(assessment_id).encode()).digest()
+    return int.from_bytes(digest[:4], "big") % 100 < HOLDOUT_PERCENT
+
+
+def iter_labeled_assessments(
+    engine,
+    watermark: dict[str, Any] | None,
+    feature_names: list[str],
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[tuple[pd.DataFrame, dict[str, Any]]]:
+    """Yield (labeled rows, watermark after this chunk) for rows past `watermark`.
+
+    Frames hold `feature_names`, the label and assessment_id; chunks with
+    no labeled rows are yielded empty so the watermark still advances.
+    Rows without an assessed_at cannot be placed against the watermark and
+    are skipped.
+    """
+    from database import Assessment
+
+    table = Assessment.__table__
+    after = None
+    if watermark:
+        after = (datetime.fromisoformat(watermark["assessed_at"]), watermark["assessment_id"])
+
+    while True:
+        stmt = (
+            select(table.c.assessment_id, table.c.assessed_at, table.c.assessment_data)
+            .where(table.c.assessed_at.is_not(None))
+            .order_by(table.c.assessed_at, table.c.assessment_id)
+            .limit(chunk_size)
+        )
+        if after is not None:
+            stmt = stmt.where(or_(
+                table.c.assessed_at > after[0],
+                and_(table.c.assessed_at == after[0], table.c.assessment_id > after[1]),
+            ))
+        with engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        if not rows:
+            return
+
+        records = []
+        for assessment_id, assessed_at, raw in rows:
+            try:
+                data = json.loads(raw) if raw else {}
+            except ValueError:
+                continue
+            label = data.get(LABEL_KEY)
+            if label in (0, 1, "0", "1"):
+                record = {name: data.get(name) for name in feature_names}
+                record[LABEL_KEY] = int(label)
+                record["assessment_id"] = assessment_id
+                records.append(record)
+
+        last_id, last_at = rows[-1][0], rows[-1][1]
+        after = (last_at, last_id)
+        frame = pd.DataFrame(records, columns=[*feature_names, LABEL_KEY, "assessment_id"])
+        yield frame, {"assessed_at": last_at.isoformat(), "assessment_id": last_id}
+        if len(rows) < chunk_size:
+            return
+
+
+def _features(pipe: Pipeline, frame: pd.DataFrame) -> pd.DataFrame:
+    """Raw rows -> model input, coerced like the training data."""
+    X = frame.drop(columns=[LABEL_KEY, "assessment_id"])
+    for name in X.columns:
+        if name.lower() != "gender":
+            X[name] = pd.to_numeric(X[name], errors="coerce")
+    return pipe.named_steps["preprocessor"].transform(X)
+
+
+def _update_booster(
+    model: LGBMClassifier,
+    X: pd.DataFrame,
+    y: np.ndarray,
+    mode: str,
+    callbacks: list[Callable] | None,
+) -> lgb.Booster:
+    labels = np.searchsorted(model.classes_, y)
+    if mode == "refit":
+        return model.booster_.refit(X, labels, decay_rate=REFIT_DECAY)
+    params = booster_params(LGBMClassifier(**model.get_params()), model.classes_)
+    train_set = lgb.Dataset(X, label=labels, params=dict(DATASET_PARAMS))
+    booster = lgb.train(
+        params,
+        train_set,
+        num_boost_round=CONTINUE_ROUNDS,
+        init_model=model.booster_,
+        callbacks=callbacks,
+    )
+    booster.free_dataset()
+    return booster
+
+
+def update_risk_model(
+    engine,
+    model_path: str,
+    mode: str = "continue",
+    progress: ProgressCallback | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    min_train_rows: int = MIN_TRAIN_ROWS,
+) -> IncrementalResult:
+    """Update the saved risk model with labeled assessments since the watermark."""
+    if mode not in ("continue", "refit"):
+        raise ValueError(f"Unknown incremental mode: {mode}")
+    report = progress or (lambda stage, fraction: None)
+    result = IncrementalResult(promoted=False, reason="", mode=mode, model_path=model_path)
+
+    report("loading", 0.0)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found: {model_path}. Run a full training first.")
+    pipe = joblib.load(model_path)
+    model = pipe.named_steps["model"]
+    feature_names = list(pipe.named_steps["preprocessor"].feature_names_in_)
+    state = read_model_state(model_path)
+
+    chunks, watermark = [], state.get("watermark")
+    for frame, watermark in iter_labeled_assessments(engine, state.get("watermark"), feature_names, chunk_size):
+        chunks.append(frame)
+        report("loading", 0.05)
+    new_rows = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    result.n_rows = int(len(new_rows))
+    if new_rows.empty:
+        result.reason = "No new labeled assessments"
+        return result
+
+    holdout_mask = new_rows["assessment_id"].map(_in_holdout).to_numpy()
+    train_rows, holdout_rows = new_rows[~holdout_mask], new_rows[holdout_mask]
+    result.n_train = int(len(train_rows))
+    if result.n_train < min_train_rows:
+        result.reason = f"Only {result.n_train} new training rows (need {min_train_rows})"
+        return result
+
+    report("fitting", 0.1)
+    callbacks = None
+    if progress is not None:
+        def callback(env) -> None:
+            done = env.iteration - env.begin_iteration + 1
+            progress("fitting", 0.1 + 0.75 * done / max(env.end_iteration - env.begin_iteration, 1))
+        callbacks = [callback]
+    booster = _update_booster(
+        model, _features(pipe, train_rows), train_rows[LABEL_KEY].to_numpy(), mode, callbacks
+    )
+    candidate = attach_booster(LGBMClassifier(**model.get_params()), booster, model.classes_)
+
+    report("evaluating", 0.85)
+    X_parts, y_parts = [], []
+    if not holdout_rows.empty:
+        X_parts.append(_features(pipe, holdout_rows))
+        y_parts.append(holdout_rows[LABEL_KEY].to_numpy())
+    base = load_holdout(os.path.join(cache_dir(), "prep"), state["holdout_key"]) if state.get("holdout_key") else None
+    if base is not None:
+        X_parts.append(base[0])
+        y_parts.append(base[1])
+    if not X_parts:
+        result.reason = "No holdout rows to evaluate the update on"
+        return result
+    X_holdout = pd.concat(X_parts, ignore_index=True)
+    y_holdout = np.concatenate(y_parts).astype(int)
+    result.n_holdout = int(len(y_holdout))
+
+    current_proba = model.predict_proba(X_holdout)
+    candidate_proba = candidate.predict_proba(X_holdout)
+    result.current_logloss = float(log_loss(y_holdout, current_proba, labels=model.classes_))
+    result.candidate_logloss = float(log_loss(y_holdout, candidate_proba, labels=model.classes_))
+    if result.candidate_logloss > result.current_logloss + PROMOTION_TOLERANCE:
+        result.reason = (
+            f"Holdout log loss {result.candidate_logloss:.4f} is worse than "
+            f"the current {result.current_logloss:.4f}; keeping the current model"
+        )
+        return result
+
+    y_pred = candidate.classes_[np.argmax(candidate_proba, axis=1)]
+    result.accuracy = float(accuracy_score(y_holdout, y_pred))
+    result.precision = float(precision_score(y_holdout, y_pred, zero_division=0))
+    result.recall = float(recall_score(y_holdout, y_pred, zero_division=0))
+    result.f1 = float(f1_score(y_holdout, y_pred, zero_division=0))
+    try:
+        result.roc_auc = float(roc_auc_score(y_holdout, candidate_proba[:, 1]))
+    except ValueError:
+        pass
+    result.confusion_matrix = confusion_matrix(y_holdout, y_pred).tolist()
+    result.feature_importance_json = json.dumps(
+        dict(sorted(
+            zip(candidate.booster_.feature_name(), map(float, candidate.feature_importances_)),
+            key=lambda item: item[1],
+            reverse=True,
+        ))
+    )
+
+    report("saving", 0.95)
+    updated = Pipeline(steps=[("preprocessor", pipe.named_steps["preprocessor"]), ("model", candidate)])
+    tmp_path = f"{model_path}.tmp"
+    joblib.dump(updated, tmp_path)
+    os.replace(tmp_path, model_path)
+
+    result.promoted = True
+    result.reason = "Promoted"
+    result.watermark = watermark
+    write_model_state(model_path, {
+        **state,
+        "watermark": watermark,
+        "updates": state.get("updates", 0) + 1,
+        "updated_at": datetime.utcnow().isoformat(),
+    })
+    return result
@@ -9,59 +9,64 @@ This module is designed to be imported by Flask routes.
 from __future__ import annotations
 
 import os
-import threading
-from typing import Any, Mapping
+import weakref
+from typing import Any, Mapping, Sequence
 
 import joblib
+import numpy as np
 import pandas as pd
 
-from ml_rules_engine import infer_probable_condition
+from ml_rules_engine import RuleResult, infer_probable_conditions
+from model_cache import file_signature, load_cached
 
 
 _MODEL_PATH = os.path.join("models", "risk_model.joblib")
-_model_lock = threading.Lock()
-_cached_pipeline: Any | None = None
 
+# Accepted payload keys: snake_case aliases -> dataset column names
+_FEATURE_ALIASES = {
+    "age": "Age",
+    "gender": "Gender",
+    "bmi": "BMI",
+    "screen_time_hours": "Screen_Time_Hours",
+    "sleep_hours": "Sleep_Hours",
+    "smoker": "Smoker",
+    "alcohol_use": "Alcohol_Use",
+    "diabetes": "Diabetes",
+    "hypertension": "Hypertension",
+    "family_history_eye_disease": "Family_History_Eye_Disease",
+    "outdoor_exposure_hours": "Outdoor_Exposure_Hours",
+    "diet_score": "Diet_Score",
+    "water_intake_liters": "Water_Intake_Liters",
+    "glasses_usage": "Glasses_Usage",
+    "previous_eye_surgery": "Previous_Eye_Surgery",
+    "physical_activity_level": "Physical_Activity_Level",
+}
 
-def load_risk_pipeline() -> Any:
-    global _cached_pipeline
-    if _cached_pipeline is not None:
-        return _cached_pipeline
 
-    with _model_lock:
-        if _cached_pipeline is not None:
-            return _cached_pipeline
-        if not os.path.exists(_MODEL_PATH):
-            raise FileNotFoundError(
-                f"Risk model not found at {_MODEL_PATH}. Run train_risk_model.py first."
-            )
-        _cached_pipeline = joblib.load(_MODEL_PATH)
-        return _cached_pipeline
+def load_risk_pipeline() -> Any:
+    """The risk pipeline, reloaded when the model file is replaced (e.g. by a retrain)."""
+    try:
+        return load_cached(_MODEL_PATH, joblib.load)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Risk model not found at {_MODEL_PATH}. Run train_risk_model.py first."
+        ) from None
+
+
+def risk_model_signature() -> str:
+    """Identifies the model file `load_risk_pipeline` serves; changes whenever it is replaced."""
+    try:
+        mtime_ns, size = file_signature(_MODEL_PATH)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Risk model not found at {_MODEL_PATH}. Run train_risk_model.py first."
+        ) from None
+    return f"{mtime_ns}-{size}"
 
 
 def _normalize_features(input_data: Mapping[str, Any]) -> dict[str, Any]:
     """Normalize incoming payload keys to the dataset column names."""
 
-    # Accept both snake_case and exact dataset-style names.
-    mapping = {
-        "age": "Age",
-        "gender": "Gender",
-        "bmi": "BMI",
-        "screen_time_hours": "Screen_Time_Hours",
-        "sleep_hours": "Sleep_Hours",
-        "smoker": "Smoker",
-        "alcohol_use": "Alcohol_Use",
-        "diabetes": "Diabetes",
-        "hypertension": "Hypertension",
-        "family_history_eye_disease": "Family_History_Eye_Disease",
-        "outdoor_exposure_hours": "Outdoor_Exposure_Hours",
-        "diet_score": "Diet_Score",
-        "water_intake_liters": "Water_Intake_Liters",
-        "glasses_usage": "Glasses_Usage",
-        "previous_eye_surgery": "Previous_Eye_Surgery",
-        "physical_activity_level": "Physical_Activity_Level",
-    }
-
     out: dict[str, Any] = {}
 
     for k, v in input_data.items():
@@ -69,13 +74,13 @@ def _normalize_features(input_data: Mapping[str, Any]) -> dict[str, Any]:
             continue
 
         # If the key already matches a dataset column, preserve it.
-        if k in mapping.values():
+        if k in _FEATURE_ALIASES.values():
             out[k] = v
             continue
 
         k_norm = str(k).strip().lower()
-        if k_norm in mapping:
-            out[mapping[k_norm]] = v
+        if k_norm in _FEATURE_ALIASES:
+            out[_FEATURE_ALIASES[k_norm]] = v
 
     # Normalize gender formatting if provided.
     g = out.get("Gender")
@@ -105,22 +110,7 @@ def _condition_risk_flag(probable_condition: str) -> str:
     return "N/A"
 
 
-def predict_risk_two_stage(input_data: Mapping[str, Any]) -> dict[str, Any]:
-    pipeline = load_risk_pipeline()
-
-    normalized = _normalize_features(input_data)
-
-    # Align to model expected feature order.
-    if not hasattr(pipeline, "feature_names_in_"):
-        raise RuntimeError("Loaded pipeline is missing feature_names_in_. Re-train with sklearn.")
-
-    feature_names = list(getattr(pipeline, "feature_names_in_"))
-
-    row = {name: normalized.get(name, None) for name in feature_names}
-    X = pd.DataFrame([row], columns=feature_names)
-
-    proba = float(pipeline.predict_proba(X)[0][1])
-
+def _two_stage_result(proba: float, rr: RuleResult | None) -> dict[str, Any]:
     # Stage-1 risk label for rule triggering.
     risk_label = "HIGH" if proba >= 0.5 else "LOW"
 
@@ -136,8 +126,7 @@ def predict_risk_two_stage(input_data: Mapping[str, Any]) -> dict[str, Any]:
     triggered_rules: list[str] = []
     confidence_level = "N/A"
 
-    if risk_label == "HIGH":
-        rr = infer_probable_condition(normalized)
+    if rr is not None:
         probable_condition = rr.probable_condition
         triggered_rules = rr.triggered_rules
         confidence_level = rr.confidence_level
@@ -163,3 +152,205 @@ def predict_risk_two_stage(input_data: Mapping[str, Any]) -> dict[str, Any]:
             "LOW_RISK": 1.0 - proba,
         },
     }
+
+
+# pipeline -> (transformed column -> original feature matrix, original feature names)
+_contribution_groups_cache: "weakref.WeakKeyDictionary[Any, tuple[np.ndarray, list[str]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _contribution_groups(pipeline: Any) -> tuple[np.ndarray, list[str]]:
+    """0/1 matrix summing preprocessed columns back onto the input features.
+
+    The preprocessor's one-hot encoder turns `Gender` into `Gender_Female`,
+    `Gender_Male`, ...; their contributions add up to Gender's.
+    """
+    groups = _contribution_groups_cache.get(pipeline)
+    if groups is not None:
+        return groups
+
+    preprocessor = pipeline.named_steps["preprocessor"]
+    inputs = [str(name) for name in preprocessor.feature_names_in_]
+    owners: list[int] = []
+    for _, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, str) and transformer == "drop":
+            continue
+        columns = [inputs[c] if isinstance(c, (int, np.integer)) else str(c) for c in columns]
+        if isinstance(transformer, str):  # "passthrough"
+            outputs = columns
+        else:
+            outputs = [str(name) for name in transformer.get_feature_names_out(columns)]
+        for output in outputs:
+            # One-hot outputs are named "<column>_<category>"; prefer the longest match
+            matches = [c for c in columns if output == c or output.startswith(f"{c}_")]
+            owners.append(inputs.index(max(matches, key=len)))
+
+    matrix = np.zeros((len(owners), len(inputs)))
+    matrix[np.arange(len(owners)), owners] = 1.0
+    groups = (matrix, inputs)
+    _contribution_groups_cache[pipeline] = groups
+    return groups
+
+
+def _contributions(pipeline: Any, X: pd.DataFrame) -> pd.DataFrame:
+    """Native LightGBM contributions (log-odds of HIGH risk) per input feature.
+
+    Columns are the pipeline's input features plus `base_value`; each row sums
+    to the model's raw score for that row.
+    """
+    matrix, names = _contribution_groups(pipeline)
+    transformed = pipeline.named_steps["preprocessor"].transform(X)
+    contrib = pipeline.named_steps["model"].predict(transformed, pred_contrib=True)
+    out = pd.DataFrame(contrib[:, :-1] @ matrix, columns=names, index=X.index)
+    out["base_value"] = contrib[:, -1]
+    return out
+
+
+def _explanations(contributions: pd.DataFrame) -> list[dict[str, Any]]:
+    """Rows of `_contributions` as dicts, features sorted by |contribution|."""
+    names = np.asarray([c for c in contributions.columns if c != "base_value"])
+    values = contributions[names].to_numpy()
+    order = np.argsort(-np.abs(values), axis=1, kind="stable")
+    return [
+        {
+            "base_value": float(base),
+            "contributions": dict(zip(names[idx].tolist(), row[idx].tolist())),
+        }
+        for base, row, idx in zip(contributions["base_value"].to_numpy(), values, order)
+    ]
+
+
+def predict_risk_two_stage_batch(
+    inputs: Sequence[Mapping[str, Any]],
+    pipeline: Any | None = None,
+    explain: bool = False,
+) -> list[dict[str, Any]]:
+    """Two-stage predictions for many payloads.
+
+    One `predict_proba` call for the whole batch; Stage-2 rules run only for
+    the rows predicted HIGH. With `explain`, each result also carries an
+    `explanation`: per-feature contributions to the HIGH-risk log-odds,
+    largest first (see `explain_risk_batch`).
+    """
+    if pipeline is None:
+        pipeline = load_risk_pipeline()
+    if not inputs:
+        return []
+
+    # Align to model expected feature order.
+    if not hasattr(pipeline, "feature_names_in_"):
+        raise RuntimeError("Loaded pipeline is missing feature_names_in_. Re-train with sklearn.")
+
+    feature_names = list(getattr(pipeline, "feature_names_in_"))
+    normalized = [_normalize_features(row) for row in inputs]
+    X = pd.DataFrame.from_records(
+        [{name: row.get(name, None) for name in feature_names} for row in normalized],
+        columns=feature_names,
+    )
+    probas = pipeline.predict_proba(X)[:, 1]
+
+    high = [i for i, proba in enumerate(probas) if proba >= 0.5]
+    rules = dict(zip(high, infer_probable_conditions([normalized[i] for i in high])))
+    results = [
+        _two_stage_result(float(proba), rules.get(i))
+        for i, proba in enumerate(probas)
+    ]
+    if explain:
+        for result, explanation in zip(results, _explanations(_contributions(pipeline, X))):
+            result["explanation"] = explanation
+    return results
+
+
+def explain_risk_batch(
+    inputs: Sequence[Mapping[str, Any]],
+    pipeline: Any | None = None,
+) -> list[dict[str, Any]]:
+    """Why each payload scored as it did, from LightGBM's native `pred_contrib`.
+
+    Returns one {"base_value", "contributions"} dict per input. Contributions
+    are in log-odds of HIGH risk, keyed by original feature name (one-hot
+    columns summed back) and sorted by magnitude; base_value plus all
+    contributions is the row's log-odds.
+    """
+    if pipeline is None:
+        pipeline = load_risk_pipeline()
+    if not inputs:
+        return []
+    feature_names = list(getattr(pipeline, "feature_names_in_"))
+    X = pd.DataFrame.from_records(
+        [{name: row.get(name, None) for name in feature_names} for row in map(_normalize_features, inputs)],
+        columns=feature_names,
+    )
+    return _explanations(_contributions(pipeline, X))
+
+
+def normalize_feature_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Column-wise `_normalize_features` for a table of payloads (e.g. a CSV chunk)."""
+    renames = {}
+    for col in frame.columns:
+        if col in _FEATURE_ALIASES.values():
+            continue
+        target = _FEATURE_ALIASES.get(str(col).strip().lower())
+        if target is not None and target not in frame.columns and target not in renames.values():
+            renames[col] = target
+    out = frame.rename(columns=renames)
+
+    if "Gender" in out.columns:
+        lowered = out["Gender"].astype("string").str.strip().str.lower()
+        out["Gender"] = (
+            out["Gender"]
+            .mask(lowered.isin(["male", "m"]).fillna(False), "Male")
+            .mask(lowered.isin(["female", "f"]).fillna(False), "Female")
+        )
+    return out
+
+
+def _risk_probabilities(pipeline: Any, normalized: pd.DataFrame) -> np.ndarray:
+    if not hasattr(pipeline, "feature_names_in_"):
+        raise RuntimeError("Loaded pipeline is missing feature_names_in_. Re-train with sklearn.")
+    if normalized.empty:
+        return np.empty(0)
+    feature_names = list(getattr(pipeline, "feature_names_in_"))
+    return pipeline.predict_proba(normalized.reindex(columns=feature_names))[:, 1]
+
+
+def predict_risk_probabilities(frame: pd.DataFrame, pipeline: Any | None = None) -> np.ndarray:
+    """Stage-1 HIGH-risk probability for each row of a DataFrame of payloads (no rules)."""
+    if pipeline is None:
+        pipeline = load_risk_pipeline()
+    return _risk_probabilities(pipeline, normalize_feature_frame(frame))
+
+
+def predict_risk_frame(frame: pd.DataFrame, pipeline: Any | None = None) -> pd.DataFrame:
+    """Two-stage predictions for a DataFrame of payloads, one output row per input row.
+
+    Same values as `predict_risk_two_stage_batch`, as columns: risk_probability,
+    risk_label, risk_level, probable_condition, confidence_level,
+    condition_risk_flag. The index of `frame` is kept.
+    """
+    if pipeline is None:
+        pipeline = load_risk_pipeline()
+    normalized = normalize_feature_frame(frame)
+    probas = _risk_probabilities(pipeline, normalized)
+
+    out = pd.DataFrame(index=frame.index)
+    out["risk_probability"] = probas
+    out["risk_label"] = np.where(probas >= 0.5, "HIGH", "LOW")
+    out["risk_level"] = np.select([probas >= 0.66, probas >= 0.33], ["High", "Moderate"], "Low")
+    out["probable_condition"] = "N/A"
+    out["confidence_level"] = "N/A"
+
+    high = np.flatnonzero(probas >= 0.5)
+    if len(high):
+        # Rules read dict payloads; missing cells are None, as in a JSON payload
+        rows = normalized.iloc[high].astype(object)
+        rules = infer_probable_conditions(rows.where(rows.notna(), None).to_dict("records"))
+        out.iloc[high, out.columns.get_loc("probable_condition")] = [rr.probable_condition for rr in rules]
+        out.iloc[high, out.columns.get_loc("confidence_level")] = [rr.confidence_level for rr in rules]
+    out["condition_risk_flag"] = out["probable_condition"].map(_condition_risk_flag)
+    return out
+
+
+def predict_risk_two_stage(input_data: Mapping[str, Any], explain: bool = False) -> dict[str, Any]:
+    return predict_risk_two_stage_batch([input_data], explain=explain)[0]
@@ -8,7 +8,7 @@ IMPORTANT:
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Mapping
+from typing import Any, Iterable, Mapping
 
 
 @dataclass(frozen=True)
@@ -103,3 +103,8 @@ def infer_probable_condition(features: Mapping[str, Any]) -> RuleResult:
         return RuleResult("Astigmatism", triggered, "low")
 
     return RuleResult("Unspecified High Risk", triggered, "low")
+
+
+def infer_probable_conditions(rows: Iterable[Mapping[str, Any]]) -> list[RuleResult]:
+    """Batch form of `infer_probable_condition` (one result per row, in order)."""
+    return [infer_probable_condition(features) for features in rows]
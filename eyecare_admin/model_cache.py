@@ -0,0 +1,80 @@
+"""In-process cache of model files.
+
+Model artifacts are loaded once per process and kept until the file on disk
+changes: every lookup stats the file and reloads it when its (mtime, size)
+signature differs from the cached copy. Retraining replaces model files with
+an atomic rename, so a web worker picks up a new model on its next request
+without a restart, and never sees a half-written file.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+
+LEGACY_MODEL_PATH = os.path.join("models", "eyecare_lightgbm_model.pkl")
+
+_lock = threading.Lock()
+# path -> (file signature, loaded object)
+_entries: dict[str, tuple[tuple[int, int], Any]] = {}
+
+
+def file_signature(path: str) -> tuple[int, int]:
+    """(mtime_ns, size) of `path`; raises FileNotFoundError when it is missing."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load_cached(path: str, loader: Callable[[str], Any]) -> Any:
+    """`loader(path)`, reused until the file at `path` changes."""
+    key = os.path.abspath(path)
+    signature = file_signature(path)
+    entry = _entries.get(key)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        value = loader(path)
+        _entries[key] = (signature, value)
+        return value
+
+
+def clear_model_cache() -> None:
+    with _lock:
+        _entries.clear()
+
+
+@dataclass(frozen=True)
+class LegacyModelBundle:
+    """The legacy multi-class disease model (`train_lightgbm.py`) with decoded labels."""
+
+    model: Any
+    label_encoder: Any
+    feature_names: list[str]
+    class_names: np.ndarray  # class_names[i] = disease for predict_proba column i
+
+
+def _read_legacy_bundle(path: str) -> LegacyModelBundle:
+    with open(path, "rb") as f:
+        model_data = pickle.load(f)
+    model, label_encoder = model_data["model"], model_data["label_encoder"]
+    # Decode every predict_proba column once instead of per request
+    encoded = getattr(model, "classes_", np.arange(len(label_encoder.classes_)))
+    return LegacyModelBundle(
+        model=model,
+        label_encoder=label_encoder,
+        feature_names=list(model_data["feature_names"]),
+        class_names=label_encoder.inverse_transform(encoded),
+    )
+
+
+def load_legacy_bundle(path: str = LEGACY_MODEL_PATH) -> LegacyModelBundle:
+    return load_cached(path, _read_legacy_bundle)
@@ -0,0 +1,360 @@
+"""Offline re-scoring of historical assessments with the current risk model.
+
+After a new model ships, older `assessment_results` rows still carry the
+previous model's scores. `rescore_assessments` walks the table in keyset
+order (assessment_id), in chunks:
+
+- the reader streams `assessment_data` for rows whose model_version differs
+  from the target version;
+- worker processes (spawned, each loading the pipeline once) score a chunk
+  with one batched `predict_proba`;
+- the writer applies each chunk's results with a single executemany UPDATE,
+  in chunk order, then advances the checkpoint to the chunk's last id.
+
+Rows are written by the mobile backend, which also shows them to users, so
+only the columns derived from the risk probability are rewritten, in that
+backend's shape (risk_level High/Low at 0.5, confidence = probability, see
+`app_risk_columns`), plus model_version. predicted_disease and
+per_disease_scores (the per-condition distribution the app displays) are
+left as stored.
+
+A run interrupted for any reason resumes from the checkpoint file (it is
+only reused for the same model version, and removed once a run finishes;
+the model_version filter alone keeps a rerun from redoing finished rows).
+`max_rows_per_sec` throttles the writer to protect the live database.
+Progress and rows/sec are reported via the progress callback and the log.
+Cached views over risk levels are invalidated in all web workers at most
+every INVALIDATE_INTERVAL seconds while the run writes, and once at the end.
+
+Runs as a TrainingJob with mode 'rescore' (POST /api/ml/retrain, see
+utils/training_jobs) or from the command line:
+`python rescoring.py --workers 4 --max-rows-per-sec 500`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Callable, Iterator
+
+import joblib
+import pandas as pd
+from sqlalchemy import bindparam, func, or_, select, update
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+MODEL_PATH_DEFAULT = os.path.join("models", "risk_model.joblib")
+CHECKPOINT_PATH_DEFAULT = os.path.join("models", "rescore_checkpoint.json")
+# Cached views (utils.cache tags) built from the columns a rescore rewrites
+RESCORED_TAGS = (
+    "assessment_stats",
+    "count:assessment_results",
+    "assessment_risk_trend",
+    "risk_factors_analysis",
+    "dashboard_stats",
+    "assessment_trends",
+)
+# Minimum seconds between cache invalidations during a run
+INVALIDATE_INTERVAL = 30.0
+
+ProgressCallback = Callable[[str, float], None]
+
+
+@dataclass
+class RescoreResult:
+    model_version: str
+    rows: int = 0  # rows updated by this run
+    skipped: int = 0  # rows whose assessment_data could not be parsed
+    total_rows: int = 0  # rows updated including earlier runs of the same version
+    seconds: float = 0.0
+    rows_per_sec: float = 0.0
+    last_id: str | None = None
+    resumed: bool = False
+
+    def summary(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def read_checkpoint(path: str) -> dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as fileobj:
+            return json.load(fileobj)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_checkpoint(path: str, checkpoint: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fileobj:
+        json.dump(checkpoint, fileobj, indent=2)
+    os.replace(tmp, path)
+
+
+def _pending_filter(table, model_version: str):
+    return or_(table.c.model_version.is_(None), table.c.model_version != model_version)
+
+
+def iter_assessment_chunks(
+    engine,
+    model_version: str,
+    after_id: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[list[tuple[str, str | None]]]:
+    """Yield [(assessment_id, assessment_data), ...] not yet scored by `model_version`."""
+    from database import Assessment
+
+    table = Assessment.__table__
+    while True:
+        stmt = (
+            select(table.c.assessment_id, table.c.assessment_data)
+            .where(_pending_filter(table, model_version))
+            .order_by(table.c.assessment_id)
+            .limit(chunk_size)
+        )
+        if after_id is not None:
+            stmt = stmt.where(table.c.assessment_id > after_id)
+        with engine.connect() as conn:
+            rows = [tuple(row) for row in conn.execute(stmt)]
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+        if len(rows) < chunk_size:
+            return
+
+
+def app_risk_columns(probability: float) -> dict[str, Any]:
+    """assessment_results columns for a risk probability, as the mobile backend stores them."""
+    return {
+        "risk_level": "High" if probability >= 0.5 else "Low",
+        "risk_score": round(probability * 100.0, 2),
+        "confidence_score": probability * 100,
+    }
+
+
+def score_chunk(pipeline, rows: list[tuple[str, str | None]], model_version: str) -> tuple[list[dict], int, str]:
+    """Score one chunk; returns (UPDATE parameter rows, skipped count, last id)."""
+    from ml_risk_predict import predict_risk_probabilities
+
+    ids, payloads, skipped = [], [], 0
+    for assessment_id, raw in rows:
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            skipped += 1
+            continue
+        ids.append(assessment_id)
+        payloads.append(data)
+
+    probas = predict_risk_probabilities(pd.DataFrame.from_records(payloads), pipeline) if payloads else []
+    params = [
+        {"b_id": assessment_id, **app_risk_columns(float(proba)), "model_version": model_version}
+        for assessment_id, proba in zip(ids, probas)
+    ]
+    return params, skipped, rows[-1][0]
+
+
+# Worker-process state: the pipeline is loaded once per worker
+_worker_pipeline = None
+
+
+def _init_worker(model_path: str) -> None:
+    global _worker_pipeline
+    _worker_pipeline = joblib.load(model_path)
+
+
+def _score_in_worker(rows, model_version):
+    return score_chunk(_worker_pipeline, rows, model_version)
+
+
+def _write_chunk(engine, params: list[dict]) -> None:
+    if not params:
+        return
+    from database import Assessment
+
+    table = Assessment.__table__
+    stmt = (
+        update(table)
+        .where(table.c.assessment_id == bindparam("b_id"))
+        .values(
+            risk_level=bindparam("risk_level"),
+            risk_score=bindparam("risk_score"),
+            confidence_score=bindparam("confidence_score"),
+            model_version=bindparam("model_version"),
+        )
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt, params)
+
+
+def rescore_assessments(
+    engine,
+    model_version: str,
+    model_path: str = MODEL_PATH_DEFAULT,
+    workers: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    max_rows_per_sec: float | None = None,
+    checkpoint_path: str = CHECKPOINT_PATH_DEFAULT,
+    progress: ProgressCallback | None = None,
+) -> RescoreResult:
+    """Re-score every assessment not yet scored by `model_version`.
+
+    `workers` > 0 scores chunks in that many spawned processes; 0 scores
+    inline. An exception from `progress` (e.g. job cancellation) stops the
+    run after the current chunk's checkpoint is written.
+    """
+    from database import Assessment
+    from utils.cache import invalidate_tags
+
+    report = progress or (lambda stage, fraction: None)
+    checkpoint = read_checkpoint(checkpoint_path)
+    if checkpoint.get("model_version") != model_version:
+        checkpoint = {"model_version": model_version, "last_id": None, "rows": 0}
+    result = RescoreResult(
+        model_version=model_version,
+        total_rows=checkpoint["rows"],
+        last_id=checkpoint["last_id"],
+        resumed=checkpoint["last_id"] is not None,
+    )
+
+    table = Assessment.__table__
+    pending = select(func.count()).select_from(table).where(_pending_filter(table, model_version))
+    if checkpoint["last_id"] is not None:
+        pending = pending.where(table.c.assessment_id > checkpoint["last_id"])
+    with engine.connect() as conn:
+        to_score = conn.execute(pending).scalar() or 0
+
+    report("scoring", 0.0)
+    started = time.perf_counter()
+    invalidation = {"at": started, "pending": False}
+
+    def invalidate(force=False):
+        if invalidation["pending"] and (force or time.perf_counter() - invalidation["at"] >= INVALIDATE_INTERVAL):
+            invalidate_tags(*RESCORED_TAGS)
+            invalidation.update(at=time.perf_counter(), pending=False)
+
+    def commit(params, skipped, last_id):
+        _write_chunk(engine, params)
+        invalidation["pending"] = invalidation["pending"] or bool(params)
+        invalidate()
+        result.rows += len(params)
+        result.skipped += skipped
+        result.total_rows += len(params)
+        result.last_id = last_id
+        checkpoint.update(last_id=last_id, rows=result.total_rows, updated_at=datetime.utcnow().isoformat())
+        write_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        if max_rows_per_sec:
+            # Throttle: do not get ahead of the allowed write rate
+            ahead = (result.rows + result.skipped) / max_rows_per_sec - elapsed
+            if ahead > 0:
+                time.sleep(ahead)
+                elapsed += ahead
+        result.seconds = round(elapsed, 2)
+        result.rows_per_sec = round(result.rows / elapsed, 1) if elapsed else 0.0
+        logger.info(f"Rescored {result.rows}/{to_score} rows ({result.rows_per_sec} rows/sec), last id {last_id}")
+        report("scoring", min((result.rows + result.skipped) / to_score, 1.0) if to_score else 1.0)
+
+    chunks = iter_assessment_chunks(engine, model_version, checkpoint["last_id"], chunk_size)
+    try:
+        if workers <= 0:
+            pipeline = joblib.load(model_path)
+            for rows in chunks:
+                commit(*score_chunk(pipeline, rows, model_version))
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+                # Bounded read-ahead; results are written in chunk order so the
+                # checkpoint never skips an unwritten chunk
+                in_flight: deque = deque()
+                for rows in chunks:
+                    in_flight.append(pool.apply_async(_score_in_worker, (rows, model_version)))
+                    if len(in_flight) >= workers * 2:
+                        commit(*in_flight.popleft().get())
+                while in_flight:
+                    commit(*in_flight.popleft().get())
+    finally:
+        # Written rows are committed even if the run stops early
+        invalidate(force=True)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    result.seconds = round(time.perf_counter() - started, 2)
+    if result.seconds:
+        result.rows_per_sec = round(result.rows / result.seconds, 1)
+    report("done", 1.0)
+    return result
+
+
+def latest_model_version(engine) -> str:
+    """Model version of the newest MLMetrics row (what /api/ml/predict reports)."""
+    from database import MLMetrics
+
+    table = MLMetrics.__table__
+    with engine.connect() as conn:
+        version = conn.execute(
+            select(table.c.model_version).order_by(table.c.training_date.desc()).limit(1)
+        ).scalar()
+    return version or "RiskModel-Unknown"
+
+
+def rescore_job_options(engine, model_path: str) -> dict[str, Any]:
+    """Settings for a 'rescore' TrainingJob (env RESCORE_WORKERS / RESCORE_MAX_ROWS_PER_SEC)."""
+    max_rate = os.environ.get("RESCORE_MAX_ROWS_PER_SEC")
+    return {
+        "model_version": latest_model_version(engine),
+        "workers": int(os.environ.get("RESCORE_WORKERS", os.cpu_count() or 1)),
+        "max_rows_per_sec": float(max_rate) if max_rate else None,
+        "checkpoint_path": os.path.join(os.path.dirname(model_path), "rescore_checkpoint.json"),
+    }
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-score historical assessments with the current risk model.")
+    parser.add_argument("--model-version", help="version to stamp (default: latest ml_metrics row)")
+    parser.add_argument("--model-path", default=MODEL_PATH_DEFAULT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes (0 = inline)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--max-rows-per-sec", type=float, default=None, help="throttle writes to the live DB")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH_DEFAULT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from app import app
+    from database import db
+    from utils.cache import start_invalidation_bus
+
+    # Lets the run invalidate the web workers' cached stats
+    start_invalidation_bus()
+
+    with app.app_context():
+        version = args.model_version or latest_model_version(db.engine)
+        res = rescore_assessments(
+            db.engine,
+            version,
+            model_path=args.model_path,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            max_rows_per_sec=args.max_rows_per_sec,
+            checkpoint_path=args.checkpoint,
+        )
+    print(f"Rescored {res.rows} rows with {version} in {res.seconds}s ({res.rows_per_sec} rows/sec)")
+    if res.skipped:
+        print(f"Skipped {res.skipped} rows with unreadable assessment_data")
+
+
+if __name__ == "__main__":
+    main()
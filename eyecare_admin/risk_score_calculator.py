@@ -1,7 +1,25 @@
 """
 Risk Score Calculator based on Excel formula
 Maps Excel columns to assessment data fields
+
+calculate_risk_score() scores one assessment dict; calculate_risk_scores()
+computes the same formula column-wise for a whole DataFrame (reports over
+the full assessment table), and get_risk_levels() bands the result.
 """
+import numpy as np
+import pandas as pd
+
+# Marks a cell calculate_risk_scores() cannot parse the way the scalar version does
+_UNPARSEABLE = object()
+
+# Fields calculate_risk_score() needs; a row missing any of them has no score
+REQUIRED_FIELDS = [
+    'Age', 'Diabetes', 'Hypertension', 'Blurry_Vision_Score',
+    'Eye_Pain_Frequency', 'Eye_Strains_Per_Day', 'Outdoor_Exposure_Hours',
+    'Glasses_Usage', 'Family_History_Eye_Disease', 'Screen_Time_Hours',
+    'Smoker', 'Alcohol_Use'
+]
+
 
 def calculate_risk_score(data):
     """
@@ -29,16 +47,8 @@ def calculate_risk_score(data):
         int: Calculated risk score (0-20+ range)
     """
     
-    # Check if all required fields are present
-    required_fields = [
-        'Age', 'Diabetes', 'Hypertension', 'Blurry_Vision_Score',
-        'Eye_Pain_Frequency', 'Eye_Strains_Per_Day', 'Outdoor_Exposure_Hours',
-        'Glasses_Usage', 'Family_History_Eye_Disease', 'Screen_Time_Hours',
-        'Smoker', 'Alcohol_Use'
-    ]
-    
     # If any required field is missing or None, return None
-    for field in required_fields:
+    for field in REQUIRED_FIELDS:
         if field not in data or data[field] is None:
             return None
     
@@ -131,6 +141,103 @@ def get_risk_level(risk_score):
         return 'High'
 
 
+def calculate_risk_scores(frame):
+    """
+    Vectorized calculate_risk_score() for many assessments at once
+    
+    Gives the same score as calling calculate_risk_score() on each row's
+    dict, column-wise. Cells are read as the scalar version reads them:
+    flags compare the raw value (`== 1`, so the string '1' is not set),
+    and int()/float() steps parse text cells with int()/float(). A row the
+    scalar version would raise on (e.g. Age 'abc', or '3.5' where int() is
+    applied) gets no score instead of failing the whole frame.
+    
+    Args:
+        frame: DataFrame with one assessment per row, columns named like
+            the assessment data fields
+        
+    Returns:
+        pandas.Series: Int64 scores aligned with frame.index, <NA> where a
+        required field is missing or a value cannot be parsed
+    """
+    invalid = pd.Series(False, index=frame.index)
+    
+    def number(name, parse, default=np.nan):
+        # parse() (int or float) of each cell as float, NaN where missing
+        nonlocal invalid
+        if name not in frame.columns:
+            return pd.Series(default, index=frame.index, dtype=float)
+        values = frame[name]
+        if pd.api.types.is_numeric_dtype(values):
+            out = values.astype(float)
+            if parse is int:
+                invalid |= np.isinf(out)  # int(inf) raises
+                out = np.trunc(out)
+            return out
+        
+        def convert(value):
+            if pd.isna(value):
+                return np.nan
+            try:
+                return float(parse(value))
+            except (TypeError, ValueError, OverflowError):
+                return _UNPARSEABLE
+        converted = values.map(convert)
+        bad = converted.map(lambda value: value is _UNPARSEABLE).astype(bool)
+        invalid |= bad
+        return converted.mask(bad, np.nan).astype(float)
+    
+    def flag(name, value):
+        # Raw `cell == value`, as the scalar comparison
+        if name not in frame.columns:
+            return pd.Series(False, index=frame.index)
+        return (frame[name] == value).fillna(False).astype(bool)
+    
+    complete = pd.Series(True, index=frame.index)
+    for field in REQUIRED_FIELDS:
+        complete &= frame[field].notna() if field in frame.columns else False
+    
+    age = number('Age', int)
+    blurry_vision = number('Blurry_Vision_Score', int)
+    screen_time = number('Screen_Time_Hours', float)
+    
+    score = (
+        np.select([age < 40, age < 60, age < 70], [0, 1, 2], 3)
+        + 3 * flag('Diabetes', 1)
+        + 2 * flag('Hypertension', 1)
+        + 2 * flag('Family_History_Eye_Disease', 1)
+        + np.minimum(4, blurry_vision)
+        + (number('Eye_Pain_Frequency', int) >= 3)
+        + (number('Light_Sensitivity', int, 0).fillna(0) >= 3)
+        + (number('Eye_Strains_Per_Day', int) >= 3)
+        + np.select([screen_time >= 10, screen_time >= 6], [2, 1], 0)
+        + (number('Outdoor_Exposure_Hours', float) <= 2)
+        + (flag('Glasses_Usage', 0) & (blurry_vision >= 2))
+        + flag('Smoker', 1)
+        + (number('Alcohol_Use', int) >= 1)
+    )
+    return score.where(complete & ~invalid).astype('Int64')
+
+
+def get_risk_levels(risk_scores):
+    """
+    Vectorized get_risk_level()
+    
+    Args:
+        risk_scores: Series of scores (e.g. from calculate_risk_scores())
+        
+    Returns:
+        pandas.Series: 'Low', 'Moderate', 'High', or 'Unknown' for missing scores
+    """
+    scores = pd.Series(risk_scores).astype(float)
+    levels = np.select(
+        [scores.isna(), scores <= 5, scores <= 10],
+        ['Unknown', 'Low', 'Moderate'],
+        'High',
+    )
+    return pd.Series(levels, index=scores.index)
+
+
 if __name__ == '__main__':
     # Test the function
     test_data = {
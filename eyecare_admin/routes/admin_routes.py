@@ -5,6 +5,7 @@ from marshmallow import ValidationError
 from schemas import AdminCreateSchema, AdminUpdateSchema, PasswordChangeSchema
 from utils import validate_password
 from utils.archive import archive_entity
+from utils.pagination import Pagination, InvalidCursorError
 from sqlalchemy import cast, Integer
 
 admin_bp = Blueprint('admin', __name__)
@@ -64,7 +65,12 @@ def get_admins():
         
         query = query.order_by(Admin.created_at.desc())
         
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        paginated = Pagination(
+            query,
+            page=page,
+            per_page=per_page,
+            keyset=(Admin.created_at, Admin.id),
+        )
 
         admins_out = []
         if status == 'archived':
@@ -94,10 +100,14 @@ def get_admins():
             'admins': admins_out,
             'total': paginated.total,
             'page': page,
-            'per_page': per_page,
-            'pages': paginated.pages
+            'per_page': paginated.per_page,
+            'pages': paginated.pages,
+            'next_cursor': paginated.next_cursor,
+            'prev_cursor': paginated.prev_cursor
         }), 200
         
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify, session
-from database import db, Assessment, User, ActivityLog
+from database import db, Assessment, User, ActivityLog, ASSESSMENT_FIELDS
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import func
-from utils.cache import cached, invalidate_cache
+from utils.cache import cached, invalidate_tags
 from utils.date_range import parse_request_date_range
 from utils.archive import archive_entity
+from utils.search import parse_fields_param
+from utils.pagination import Pagination, InvalidCursorError
+from utils.export import iter_serialized, stream_csv, stream_excel, stream_json
+from utils.export_jobs import ExportSource, enqueue_export_job, register_export_source, wants_async_export
 
 assessments_bp = Blueprint('assessments', __name__)
 
@@ -69,21 +73,25 @@ def get_assessments():
             query = query.filter(Assessment.assessed_at <= end_dt)
         
         query = query.order_by(Assessment.assessed_at.desc())
-        
-        # Paginate
-        total = query.count()
-        assessments = query.offset((page - 1) * per_page).limit(per_page).all()
+        fields = parse_fields_param(ASSESSMENT_FIELDS)
+        
+        # Paginate (page numbers by default, keyset when ?cursor= is given)
+        pagination = Pagination(
+            Assessment.with_user_names(query, fields),
+            page=page,
+            per_page=per_page,
+            keyset=(Assessment.assessed_at, Assessment.assessment_id),
+            count='estimate',
+            count_query=query,
+        )
         
         return jsonify({
-            'assessments': [a.to_dict() for a in assessments],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total,
-                'pages': (total + per_page - 1) // per_page
-            }
+            'assessments': Assessment.serialize_with_user_names(pagination.items, fields),
+            'pagination': pagination.to_dict()
         }), 200
         
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -124,8 +132,8 @@ def create_assessment():
         db.session.add(assessment)
         db.session.commit()
         
-        # Invalidate assessment stats cache
-        invalidate_cache('assessment_stats')
+        # Invalidate assessment stats and cached counts
+        invalidate_tags('assessment_stats', 'count:assessment_results')
         
         return jsonify({
             'message': 'Assessment created successfully',
@@ -184,7 +192,7 @@ def delete_assessment(assessment_id):
         db.session.delete(assessment)
         db.session.commit()
 
-        invalidate_cache('assessment_stats')
+        invalidate_tags('assessment_stats', 'count:assessment_results')
         
         # Log activity
         log = ActivityLog(
@@ -433,96 +441,86 @@ def analyze_risk_factors():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _assessments_export_source():
+    """Assessments export: request filters, user names joined in the same query"""
+    query = Assessment.query
+    
+    # Apply filters
+    risk_level = request.args.get('risk_level', '').strip()
+    if risk_level:
+        query = query.filter(Assessment.risk_level == risk_level)
+    
+    user_id = request.args.get('user_id', '').strip()
+    if user_id:
+        query = query.filter(Assessment.user_id == user_id)
+    
+    start_date = request.args.get('start_date', '').strip()
+    if start_date:
+        query = query.filter(Assessment.assessed_at >= start_date)
+    
+    end_date = request.args.get('end_date', '').strip()
+    if end_date:
+        query = query.filter(Assessment.assessed_at <= end_date)
+    
+    # Define columns for export
+    columns = {
+        'Assessment ID': 'id',
+        'User Name': 'user_name',
+        'Age': 'age',
+        'BMI': 'bmi',
+        'Blood Pressure': 'blood_pressure',
+        'Blood Sugar': 'blood_sugar',
+        'Smoking': 'smoking',
+        'Alcohol': 'alcohol',
+        'Screen Time (hrs)': 'screen_time',
+        'Sleep Hours': 'sleep_hours',
+        'Exercise Frequency': 'exercise_frequency',
+        'Risk Level': 'risk_level',
+        'Risk Score': 'risk_score',
+        'Predicted Disease': 'predicted_disease',
+        'Confidence': 'confidence',
+        'Assessment Date': 'created_at'
+    }
+    fields = list(columns.values())
+    
+    def serialize_batch(rows):
+        return Assessment.serialize_with_user_names(rows, fields)
+    
+    return ExportSource(
+        query=Assessment.with_user_names(query.order_by(Assessment.assessed_at.desc()), fields),
+        serialize_batch=serialize_batch,
+        columns=columns,
+    )
+
+
+register_export_source('assessments', _assessments_export_source)
+
+
 @assessments_bp.route('/export', methods=['GET'])
 def export_assessments():
     """Export assessments with filtering support in CSV, JSON, or Excel format"""
     try:
-        from flask import send_file
-        from io import BytesIO
-        from utils.export import export_to_csv, export_to_json, export_to_excel
-        
         format_type = request.args.get('format', 'csv').lower()
         
         if format_type not in ['csv', 'json', 'excel']:
             return jsonify({'error': 'Invalid format. Use csv, json, or excel'}), 400
         
-        # Build filtered query
-        query = Assessment.query
-        
-        # Apply filters
-        risk_level = request.args.get('risk_level', '').strip()
-        if risk_level:
-            query = query.filter(Assessment.risk_level == risk_level)
-        
-        user_id = request.args.get('user_id', '').strip()
-        if user_id:
-            query = query.filter(Assessment.user_id == user_id)
-        
-        start_date = request.args.get('start_date', '').strip()
-        if start_date:
-            query = query.filter(Assessment.assessed_at >= start_date)
-        
-        end_date = request.args.get('end_date', '').strip()
-        if end_date:
-            query = query.filter(Assessment.assessed_at <= end_date)
-        
-        # Get assessments
-        assessments = query.order_by(Assessment.assessed_at.desc()).all()
-        
-        # Convert to dict
-        assessments_data = [a.to_dict() for a in assessments]
-        
-        # Define columns for export
-        columns = {
-            'Assessment ID': 'id',
-            'User Name': 'user_name',
-            'Age': 'age',
-            'BMI': 'bmi',
-            'Blood Pressure': 'blood_pressure',
-            'Blood Sugar': 'blood_sugar',
-            'Smoking': 'smoking',
-            'Alcohol': 'alcohol',
-            'Screen Time (hrs)': 'screen_time',
-            'Sleep Hours': 'sleep_hours',
-            'Exercise Frequency': 'exercise_frequency',
-            'Risk Level': 'risk_level',
-            'Risk Score': 'risk_score',
-            'Predicted Disease': 'predicted_disease',
-            'Confidence': 'confidence',
-            'Assessment Date': 'created_at'
-        }
-        
         # Generate filename with timestamp
         timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
         filename = f'assessments_export_{timestamp}'
         
-        # Export based on format
+        if wants_async_export():
+            job = enqueue_export_job('assessments', format_type, filename)
+            return jsonify({'message': 'Export queued', 'job': job.to_dict()}), 202
+        
+        # Stream rows from a server-side cursor
+        source = _assessments_export_source()
+        assessments_data = iter_serialized(source.query, source.serialize_batch)
         if format_type == 'csv':
-            file_content = export_to_csv(assessments_data, columns, filename)
-            return send_file(
-                BytesIO(file_content.encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{filename}.csv'
-            )
+            return stream_csv(assessments_data, source.columns, f'{filename}.csv')
         elif format_type == 'json':
-            file_content = export_to_json(assessments_data, filename)
-            return send_file(
-                BytesIO(file_content.encode('utf-8')),
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f'{filename}.json'
-            )
-        elif format_type == 'excel':
-            file_content = export_to_excel(assessments_data, columns, filename)
-            return send_file(
-                file_content,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'{filename}.xlsx'
-            )
-        
-        return jsonify({'error': 'Unsupported format'}), 400
+            return stream_json(assessments_data, f'{filename}.json')
+        return stream_excel(assessments_data, source.columns, f'{filename}.xlsx')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
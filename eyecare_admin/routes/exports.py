@@ -0,0 +1,94 @@
+from flask import Blueprint, request, jsonify, session, send_file
+from database import db, Admin, ExportJob
+from utils.export_jobs import EXPORT_FORMATS, dispatch_export_jobs
+import os
+
+exports_bp = Blueprint('exports', __name__)
+
+
+def _require_admin_or_super():
+    if 'admin_id' not in session:
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    admin = Admin.query.get(session.get('admin_id'))
+    if not admin:
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    if admin.role not in ['admin', 'super_admin']:
+        return None, (jsonify({'error': 'Forbidden'}), 403)
+    return admin, None
+
+
+def _get_visible_job(admin, job_id):
+    """Return (job, error) - admins only see their own jobs, super admins see all"""
+    job = db.session.get(ExportJob, job_id)
+    if not job or (admin.role != 'super_admin' and job.requested_by != admin.id):
+        return None, (jsonify({'error': 'Export job not found'}), 404)
+    return job, None
+
+
+@exports_bp.route('/', methods=['GET'])
+def get_export_jobs():
+    """List the current admin's export jobs, newest first"""
+    try:
+        admin, auth_error = _require_admin_or_super()
+        if auth_error:
+            return auth_error
+
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        status = request.args.get('status', '')
+
+        query = ExportJob.query.filter_by(requested_by=admin.id)
+        if status:
+            query = query.filter_by(status=status)
+        jobs = query.order_by(ExportJob.created_at.desc()).limit(limit).all()
+
+        return jsonify({'jobs': [job.to_dict() for job in jobs]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@exports_bp.route('/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Poll the status/progress of an export job"""
+    try:
+        admin, auth_error = _require_admin_or_super()
+        if auth_error:
+            return auth_error
+
+        # Start queued jobs / fail orphaned ones before reporting status
+        dispatch_export_jobs()
+        job, error = _get_visible_job(admin, job_id)
+        if error:
+            return error
+
+        return jsonify({'job': job.to_dict()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@exports_bp.route('/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    """Download a finished export artifact (supports Range requests for resuming)"""
+    try:
+        admin, auth_error = _require_admin_or_super()
+        if auth_error:
+            return auth_error
+
+        job, error = _get_visible_job(admin, job_id)
+        if error:
+            return error
+
+        if job.status != 'completed':
+            return jsonify({'error': f'Export job is {job.status}', 'job': job.to_dict()}), 409
+        if not job.file_path or not os.path.exists(job.file_path):
+            return jsonify({'error': 'Export file has expired'}), 410
+
+        extension, mimetype = EXPORT_FORMATS[job.format]
+        return send_file(
+            job.file_path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f'{job.filename}{extension}',
+            conditional=True,
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
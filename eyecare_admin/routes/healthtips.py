@@ -4,6 +4,7 @@ from datetime import datetime
 from marshmallow import ValidationError
 from schemas import HealthTipCreateSchema, HealthTipUpdateSchema
 from utils.archive import archive_entity
+from utils.pagination import Pagination, InvalidCursorError
 
 healthtips_bp = Blueprint('healthtips', __name__)
 
@@ -36,21 +37,21 @@ def get_healthtips():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
 
-        # Simple pagination
         query = HealthTip.query.order_by(HealthTip.created_at.desc())
-        total = query.count()
-        tips = query.offset((page - 1) * per_page).limit(per_page).all()
+        pagination = Pagination(
+            query,
+            page=page,
+            per_page=per_page,
+            keyset=(HealthTip.created_at, HealthTip.tip_id),
+        )
         
         return jsonify({
-            'healthtips': [tip.to_dict() for tip in tips],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total,
-                'pages': (total + per_page - 1) // per_page
-            }
+            'healthtips': [tip.to_dict() for tip in pagination.items],
+            'pagination': pagination.to_dict()
         }), 200
         
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
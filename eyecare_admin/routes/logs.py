@@ -2,6 +2,9 @@ from flask import Blueprint, request, jsonify, session
 from database import db, ActivityLog, Admin
 from datetime import datetime, timedelta, timezone
 from utils.date_range import parse_request_date_range
+from utils.export import iter_serialized, stream_csv, stream_excel, stream_json
+from utils.pagination import Pagination, InvalidCursorError
+from utils.export_jobs import ExportSource, enqueue_export_job, register_export_source, wants_async_export
 
 logs_bp = Blueprint('logs', __name__)
 
@@ -52,16 +55,27 @@ def get_logs():
         
         query = query.order_by(ActivityLog.created_at.desc())
         
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        paginated = Pagination(
+            query,
+            page=page,
+            per_page=per_page,
+            keyset=(ActivityLog.created_at, ActivityLog.id),
+            count='estimate',
+        )
         
         return jsonify({
             'logs': [log.to_dict() for log in paginated.items],
             'total': paginated.total,
             'page': page,
-            'per_page': per_page,
-            'pages': paginated.pages
+            'per_page': paginated.per_page,
+            'pages': paginated.pages,
+            'total_is_estimate': paginated.total_is_estimate,
+            'next_cursor': paginated.next_cursor,
+            'prev_cursor': paginated.prev_cursor
         }), 200
         
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -128,6 +142,45 @@ def get_log_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _serialize_log_rows(rows):
+    return [
+        {
+            'id': log.id,
+            'admin': admin_name or 'System',
+            'action': log.action,
+            'entity_type': log.entity_type,
+            'entity_id': log.entity_id,
+            'details': log.details,
+            'ip_address': log.ip_address,
+            'timestamp': log.created_at.strftime('%Y-%m-%d %H:%M:%S') if log.created_at else None,
+        }
+        for log, admin_name in rows
+    ]
+
+
+def _logs_export_source():
+    """Activity log export: admin names joined in the same query"""
+    query = (
+        db.session.query(ActivityLog, Admin.full_name)
+        .outerjoin(Admin, Admin.id == ActivityLog.admin_id)
+        .order_by(ActivityLog.created_at.desc())
+    )
+    columns = {
+        'ID': 'id',
+        'Admin': 'admin',
+        'Action': 'action',
+        'Entity Type': 'entity_type',
+        'Entity ID': 'entity_id',
+        'Details': 'details',
+        'IP Address': 'ip_address',
+        'Timestamp': 'timestamp'
+    }
+    return ExportSource(query=query, serialize_batch=_serialize_log_rows, columns=columns)
+
+
+register_export_source('logs', _logs_export_source)
+
+
 @logs_bp.route('/export', methods=['GET'])
 def export_logs():
     try:
@@ -135,38 +188,23 @@ def export_logs():
         if auth_error:
             return auth_error
 
-        import csv
-        import io
-        
-        logs = ActivityLog.query.order_by(ActivityLog.created_at.desc()).all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'ID', 'Admin', 'Action', 'Entity Type', 'Entity ID', 
-            'Details', 'IP Address', 'Timestamp'
-        ])
-        
-        # Write data
-        for log in logs:
-            writer.writerow([
-                log.id,
-                log.admin.full_name if log.admin else 'System',
-                log.action,
-                log.entity_type,
-                log.entity_id,
-                log.details,
-                log.ip_address,
-                log.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        output.seek(0)
-        return output.getvalue(), 200, {
-            'Content-Type': 'text/csv',
-            'Content-Disposition': 'attachment; filename=activity_logs.csv'
-        }
+        format_type = request.args.get('format', 'csv').lower()
+        if format_type not in ['csv', 'json', 'excel']:
+            return jsonify({'error': 'Invalid format. Use csv, json, or excel'}), 400
+
+        if wants_async_export():
+            timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
+            job = enqueue_export_job('logs', format_type, f'activity_logs_{timestamp}')
+            return jsonify({'message': 'Export queued', 'job': job.to_dict()}), 202
+
+        # Stream rows from a server-side cursor instead of loading the whole table
+        source = _logs_export_source()
+        logs = iter_serialized(source.query, source.serialize_batch)
+        if format_type == 'json':
+            return stream_json(logs, 'activity_logs.json')
+        elif format_type == 'excel':
+            return stream_excel(logs, source.columns, 'activity_logs.xlsx')
+        return stream_csv(logs, source.columns, 'activity_logs.csv')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
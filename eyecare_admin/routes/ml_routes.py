@@ -1,36 +1,68 @@
 from flask import Blueprint, request, jsonify, session
-from database import db, MLMetrics, ActivityLog, get_app_db_connection
+from database import db, MLMetrics, ActivityLog, TrainingJob, get_app_db_connection
+from utils.training_jobs import (
+    INCREMENTAL_MODES,
+    RESCORE_MODE,
+    TrainingJobConflict,
+    cancel_training_job,
+    enqueue_training_job,
+    fail_stale_training_jobs,
+)
 import json
 import os
-import pickle
 import sys
 
 # Add parent directory to path for risk score calculator
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from risk_score_calculator import calculate_risk_score, get_risk_level
 
+from model_cache import LEGACY_MODEL_PATH, load_legacy_bundle
+from utils.cache import cache
+
 try:
-    from ml_risk_predict import predict_risk_two_stage
+    from ml_risk_predict import explain_risk_batch, predict_risk_two_stage, risk_model_signature
 except Exception:
-    predict_risk_two_stage = None
+    explain_risk_batch = predict_risk_two_stage = risk_model_signature = None
 
 ml_bp = Blueprint('ml', __name__)
 
+# Latest MLMetrics.model_version, cached under the 'ml_metrics' tag (invalidated
+# when a training job records new metrics; the TTL covers other writers)
+MODEL_VERSION_CACHE_KEY = 'ml_metrics:latest_version'
+MODEL_VERSION_TTL = 60
+# Per-assessment explanations, keyed by model version (see /explanations)
+EXPLANATION_TTL = 3600
+MAX_EXPLANATION_IDS = 500
+
+
+def _latest_model_version(default):
+    version = cache.get(MODEL_VERSION_CACHE_KEY)
+    if version is None:
+        latest = (
+            db.session.query(MLMetrics.model_version)
+            .order_by(MLMetrics.training_date.desc())
+            .first()
+        )
+        version = (latest[0] if latest else None) or ''
+        cache.set(MODEL_VERSION_CACHE_KEY, version, MODEL_VERSION_TTL, tags=('ml_metrics',))
+    return version or default
+
+
 @ml_bp.route('/predict', methods=['POST'])
 def predict_assessment():
     """Real-time prediction using trained LightGBM model"""
     try:
         data = request.json
+        # ?explain=true adds per-feature contributions to the two-stage result
+        explain = request.args.get('explain', 'false').lower() == 'true'
 
         # Prefer the new two-stage risk model if available.
         if predict_risk_two_stage is not None:
             try:
-                result = predict_risk_two_stage(data or {})
+                result = predict_risk_two_stage(data or {}, explain=explain)
 
                 # Use latest model version from database if available.
-                latest_metrics = MLMetrics.query.order_by(MLMetrics.training_date.desc()).first()
-                model_version = latest_metrics.model_version if latest_metrics else "RiskModel-Unknown"
-                result["model_version"] = model_version
+                result["model_version"] = _latest_model_version("RiskModel-Unknown")
 
                 return jsonify(result), 200
             except FileNotFoundError:
@@ -44,20 +76,15 @@ def predict_assessment():
         risk_score = calculate_risk_score(data)
         risk_level_from_score = get_risk_level(risk_score)
         
-        # Load the actual trained model
-        model_path = 'models/eyecare_lightgbm_model.pkl'
-        
-        if not os.path.exists(model_path):
+        # Load the actual trained model (cached; reloaded when the file changes)
+        if not os.path.exists(LEGACY_MODEL_PATH):
             return jsonify({
                 'error': 'Model not found. Please train the model first using train_lightgbm.py'
             }), 404
         
-        # Load model
-        with open(model_path, 'rb') as f:
-            model_data = pickle.load(f)
-            model = model_data['model']
-            label_encoder = model_data['label_encoder']
-            feature_names = model_data['feature_names']
+        bundle = load_legacy_bundle(LEGACY_MODEL_PATH)
+        model = bundle.model
+        feature_names = bundle.feature_names
         
         # Prepare input features in the correct order
         import pandas as pd
@@ -78,12 +105,12 @@ def predict_assessment():
         # Create DataFrame with features in correct order
         X = pd.DataFrame([input_features], columns=feature_names)
         
-        # Make prediction
-        prediction = model.predict(X)[0]
+        # Make prediction (predict() is the argmax of predict_proba)
         prediction_proba = model.predict_proba(X)[0]
+        prediction = int(prediction_proba.argmax())
         
         # Decode prediction
-        predicted_disease = label_encoder.inverse_transform([prediction])[0]
+        predicted_disease = str(bundle.class_names[prediction])
         confidence = float(prediction_proba[prediction])
         
         # Keratitis is out of scope; never surface it in API responses
@@ -102,8 +129,7 @@ def predict_assessment():
             risk_level = 'Low'
         
         # Get latest model version from database
-        latest_metrics = MLMetrics.query.order_by(MLMetrics.training_date.desc()).first()
-        model_version = latest_metrics.model_version if latest_metrics else 'LightGBM-Unknown'
+        model_version = _latest_model_version('LightGBM-Unknown')
         
         result = {
             'risk_level': risk_level,
@@ -117,9 +143,9 @@ def predict_assessment():
                 'predicted_risk_level': risk_level
             },
             'all_predictions': {
-                label_encoder.inverse_transform([i])[0]: float(prob)
-                for i, prob in enumerate(prediction_proba)
-                if label_encoder.inverse_transform([i])[0] != 'Keratitis'
+                str(name): float(prob)
+                for name, prob in zip(bundle.class_names, prediction_proba)
+                if name != 'Keratitis'
             }
         }
         
@@ -130,6 +156,54 @@ def predict_assessment():
         print(traceback.format_exc())
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+@ml_bp.route('/explanations', methods=['POST'])
+def explain_assessments():
+    """Feature contributions behind stored assessments' risk predictions"""
+    try:
+        from database import Assessment
+        
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        if explain_risk_batch is None:
+            return jsonify({'error': 'Risk model unavailable'}), 503
+        
+        ids = (request.json or {}).get('assessment_ids') or []
+        if not isinstance(ids, list) or not ids:
+            return jsonify({'error': 'assessment_ids must be a non-empty list'}), 400
+        if len(ids) > MAX_EXPLANATION_IDS:
+            return jsonify({'error': f'At most {MAX_EXPLANATION_IDS} assessment_ids per request'}), 400
+        ids = list(dict.fromkeys(str(i) for i in ids))
+        
+        model_version = _latest_model_version('RiskModel-Unknown')
+        # Keyed on the model file actually loaded: MLMetrics can lag behind or
+        # run ahead of the file on disk (failed saves, copied-in models)
+        signature = risk_model_signature()
+        explanations = {}
+        for assessment_id in ids:
+            cached = cache.get(f'ml_explanation:{signature}:{assessment_id}')
+            if cached is not None:
+                explanations[assessment_id] = cached
+        
+        # Everything not cached is explained in one batched model call
+        pending = [i for i in ids if i not in explanations]
+        if pending:
+            assessments = Assessment.query.filter(Assessment.assessment_id.in_(pending)).all()
+            payloads = [a.parsed_assessment_data for a in assessments]
+            for assessment, explanation in zip(assessments, explain_risk_batch(payloads)):
+                cache.set(f'ml_explanation:{signature}:{assessment.assessment_id}', explanation,
+                          EXPLANATION_TTL, tags=('ml_explanations',))
+                explanations[assessment.assessment_id] = explanation
+        
+        return jsonify({
+            'model_version': model_version,
+            'explanations': explanations,
+            'missing': [i for i in ids if i not in explanations],
+        }), 200
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @ml_bp.route('/metrics', methods=['GET'])
 def get_metrics():
     try:
@@ -195,7 +269,7 @@ def get_metrics_history():
 
 @ml_bp.route('/retrain', methods=['POST'])
 def retrain_model():
-    """Trigger actual model retraining using train_lightgbm.py"""
+    """Start model retraining as a background job (poll /retrain/jobs/<id>)"""
     try:
         from database import Admin, PendingAction
         
@@ -207,6 +281,14 @@ def retrain_model():
         
         data = request.json or {}
         dataset_file = data.get('dataset_file') or os.path.join('models', 'dataset', 'EyeConditions_CLEAN_RISK.csv')
+        # 'full' retrains from the dataset; 'continue'/'refit' update the current
+        # model from labeled assessments since the last update; 'rescore'
+        # re-scores stored assessments with the current model
+        mode = data.get('mode', 'full')
+        if mode not in ('full', RESCORE_MODE) + INCREMENTAL_MODES:
+            return jsonify({'error': f'Unknown training mode: {mode}'}), 400
+        if mode != 'full':
+            dataset_file = 'assessment_results'
 
         # If not Super Admin, queue for approval
         if current_admin.role != 'super_admin':
@@ -218,7 +300,7 @@ def retrain_model():
                 action_type='retrain_model',
                 entity_type='ml',
                 entity_id=None,
-                entity_data=json.dumps({'dataset_file': dataset_file}),
+                entity_data=json.dumps({'dataset_file': dataset_file, 'mode': mode}),
                 status='pending',
                 requested_by=current_admin.id,
                 approved_by=None,
@@ -230,58 +312,92 @@ def retrain_model():
 
             return jsonify({'message': 'Retraining request queued for approval', 'pending_action_id': pending.id}), 202
 
-        # If Super Admin, proceed directly
-        dataset_file = dataset_file
+        # If Super Admin, start a background training job
+        resolved_dataset = dataset_file
+        if mode == 'full':
+            from train_risk_model import resolve_dataset_path
+            try:
+                resolved_dataset = resolve_dataset_path(dataset_file)
+            except FileNotFoundError as not_found:
+                return jsonify({'error': str(not_found)}), 400
+
+        try:
+            job = enqueue_training_job(resolved_dataset, current_admin.id, mode=mode)
+        except TrainingJobConflict as conflict:
+            return jsonify({'error': str(conflict), 'job': conflict.job.to_dict()}), 409
         
         # Log activity
         log = ActivityLog(
             admin_id=session.get('admin_id'),
             action='Retrain Model',
             entity_type='ml',
-            details=f'Initiated model retraining with dataset: {dataset_file}',
+            details=f'Started model retraining job {job.id} ({mode}) with dataset: {dataset_file}',
             ip_address=request.remote_addr
         )
         db.session.add(log)
         db.session.commit()
         
-        # Import and run the training function
-        import sys
-        import os
-        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return jsonify({
+            'message': 'Retraining started',
+            'job': job.to_dict()
+        }), 202
         
-        try:
-            from train_risk_model import train_risk_model, resolve_dataset_path
-
-            resolved_dataset = resolve_dataset_path(dataset_file)
-
-            # Run training (Stage-1 overall risk only)
-            result = train_risk_model(dataset_path=resolved_dataset)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
-            # Get the newly created metrics
-            new_metrics = MLMetrics.query.order_by(MLMetrics.training_date.desc()).first()
+@ml_bp.route('/retrain/jobs', methods=['GET'])
+def get_training_jobs():
+    """List recent training jobs, newest first"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        fail_stale_training_jobs()
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        jobs = TrainingJob.query.order_by(TrainingJob.created_at.desc()).limit(limit).all()
+        
+        return jsonify({'jobs': [job.to_dict() for job in jobs]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-            return jsonify({
-                'message': 'Risk model retrained successfully',
-                'metrics': new_metrics.to_dict() if new_metrics else {},
-                'training_result': {
-                    'accuracy': result.accuracy,
-                    'precision': result.precision,
-                    'recall': result.recall,
-                    'f1': result.f1,
-                    'roc_auc': result.roc_auc,
-                    'model_path': result.model_path,
-                    'dataset_path': result.dataset_path,
-                }
-            }), 200
+@ml_bp.route('/retrain/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """Poll the status/progress of a training job"""
+    try:
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        fail_stale_training_jobs()
+        job = db.session.get(TrainingJob, job_id)
+        if not job:
+            return jsonify({'error': 'Training job not found'}), 404
+        
+        return jsonify({'job': job.to_dict()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        except Exception as train_error:
-            db.session.rollback()
-            return jsonify({
-                'error': f'Training failed: {str(train_error)}'
-            }), 500
+@ml_bp.route('/retrain/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training(job_id):
+    """Cancel a queued or running training job (super admin only)"""
+    try:
+        from database import Admin
+        
+        if 'admin_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        current_admin = Admin.query.get(session['admin_id'])
+        if not current_admin or current_admin.role != 'super_admin':
+            return jsonify({'error': 'Unauthorized role for this action'}), 403
         
+        job = db.session.get(TrainingJob, job_id)
+        if not job:
+            return jsonify({'error': 'Training job not found'}), 404
+        if job.status not in ('queued', 'running'):
+            return jsonify({'error': f'Training job is {job.status}', 'job': job.to_dict()}), 409
+        
+        job = cancel_training_job(job)
+        return jsonify({'message': 'Cancellation requested', 'job': job.to_dict()}), 202
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @ml_bp.route('/upload-dataset', methods=['POST'])
@@ -300,19 +416,40 @@ def upload_dataset():
         
         # Save file
         import os
+        import shutil
+        import tempfile
         from werkzeug.utils import secure_filename
         
+        from dataset_cache import DatasetValidationError, ingest_dataset
+        
         filename = secure_filename(file.filename)
         filepath = os.path.join('ml', 'datasets', filename)
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        file.save(filepath)
+        
+        # Stage the upload next to its destination and only replace an existing
+        # dataset of the same name once the new one is valid
+        staging = tempfile.mkdtemp(prefix='.upload-', dir=os.path.dirname(filepath))
+        try:
+            staged = os.path.join(staging, filename)
+            file.save(staged)
+            
+            # Validate against the training schema now (not at retrain time) and
+            # convert once to the typed columnar cache that training reads
+            try:
+                dataset = ingest_dataset(staged)
+            except DatasetValidationError as invalid:
+                return jsonify({'error': 'Dataset does not match the expected schema', 'details': invalid.errors}), 400
+            os.replace(staged, filepath)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        ingest_dataset(filepath, dataset.content_hash)  # index the final path (already cached)
         
         # Log activity
         log = ActivityLog(
             admin_id=session.get('admin_id'),
             action='Upload Dataset',
             entity_type='ml',
-            details=f'Uploaded dataset: {filename}',
+            details=f'Uploaded dataset: {filename} ({dataset.rows} rows, sha256 {dataset.content_hash[:12]})',
             ip_address=request.remote_addr
         )
         db.session.add(log)
@@ -321,7 +458,10 @@ def upload_dataset():
         return jsonify({
             'message': 'Dataset uploaded successfully',
             'filename': filename,
-            'filepath': filepath
+            'filepath': filepath,
+            'rows': dataset.rows,
+            'content_hash': dataset.content_hash,
+            'stats': dataset.stats
         }), 200
         
     except Exception as e:
@@ -1,10 +1,10 @@
-from flask import Blueprint, request, jsonify, session, current_app, send_file
+from flask import Blueprint, request, jsonify, session, current_app
 from database import db, User, Assessment, ActivityLog, Admin, HealthTip
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, or_
 from utils.cache import cached, invalidate_cache
 from utils.export import export_to_csv, export_to_excel, export_to_json
-from io import BytesIO
+from utils.export_jobs import ExportSource, enqueue_export_job, register_export_source, wants_async_export
 
 reports_bp = Blueprint('reports', __name__)
 
@@ -350,6 +350,107 @@ def get_top_users():
         current_app.logger.error(f'Top users error: {str(e)}', exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+_COMPREHENSIVE_COLUMNS = {
+    'Date': 'date',
+    'New Users': 'new_users',
+    'Assessments': 'assessments',
+    'High Risk': 'high_risk_assessments'
+}
+
+
+def _build_comprehensive_report():
+    """Compute the comprehensive report for the request's date range"""
+    # Date range
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+    
+    if start_date_str:
+        start_date = datetime.fromisoformat(start_date_str)
+    else:
+        start_date = datetime.now() - timedelta(days=30)
+    
+    if end_date_str:
+        end_date = datetime.fromisoformat(end_date_str)
+    else:
+        end_date = datetime.now()
+    
+    # Summary statistics
+    total_users = User.query.filter(
+        User.created_at >= start_date,
+        User.created_at <= end_date
+    ).count()
+    
+    total_assessments = Assessment.query.filter(
+        Assessment.assessed_at >= start_date,
+        Assessment.assessed_at <= end_date
+    ).count()
+    
+    high_risk = Assessment.query.filter(
+        Assessment.risk_level == 'high',
+        Assessment.assessed_at >= start_date,
+        Assessment.assessed_at <= end_date
+    ).count()
+    
+    # Daily breakdown
+    daily_stats = []
+    current = start_date
+    while current <= end_date:
+        day_start = datetime.combine(current.date(), datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        
+        users_count = User.query.filter(
+            User.created_at >= day_start,
+            User.created_at < day_end
+        ).count()
+        
+        assessments_count = Assessment.query.filter(
+            Assessment.assessed_at >= day_start,
+            Assessment.assessed_at < day_end
+        ).count()
+        
+        high_risk_count = Assessment.query.filter(
+            Assessment.risk_level == 'high',
+            Assessment.assessed_at >= day_start,
+            Assessment.assessed_at < day_end
+        ).count()
+        
+        daily_stats.append({
+            'date': current.strftime('%Y-%m-%d'),
+            'new_users': users_count,
+            'assessments': assessments_count,
+            'high_risk_assessments': high_risk_count
+        })
+        
+        current += timedelta(days=1)
+    
+    report_data = {
+        'report_period': {
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d')
+        },
+        'summary': {
+            'total_users': total_users,
+            'total_assessments': total_assessments,
+            'high_risk_assessments': high_risk,
+            'high_risk_percentage': round((high_risk / total_assessments * 100) if total_assessments > 0 else 0, 1)
+        },
+        'daily_breakdown': daily_stats
+    }
+    return report_data
+
+
+def _comprehensive_export_source():
+    report_data = _build_comprehensive_report()
+    return ExportSource(
+        columns=_COMPREHENSIVE_COLUMNS,
+        rows=report_data['daily_breakdown'],
+        document=report_data,
+    )
+
+
+register_export_source('comprehensive', _comprehensive_export_source)
+
+
 @reports_bp.route('/comprehensive', methods=['GET'])
 def generate_comprehensive_report():
     """Generate a comprehensive report combining all metrics"""
@@ -363,125 +464,21 @@ def generate_comprehensive_report():
         if format_type not in ['json', 'csv', 'excel']:
             return jsonify({'error': 'Invalid format. Use json, csv, or excel'}), 400
         
-        # Date range
-        start_date_str = request.args.get('start_date')
-        end_date_str = request.args.get('end_date')
-        
-        if start_date_str:
-            start_date = datetime.fromisoformat(start_date_str)
-        else:
-            start_date = datetime.now() - timedelta(days=30)
-        
-        if end_date_str:
-            end_date = datetime.fromisoformat(end_date_str)
-        else:
-            end_date = datetime.now()
-        
-        # Summary statistics
-        total_users = User.query.filter(
-            User.created_at >= start_date,
-            User.created_at <= end_date
-        ).count()
-        
-        total_assessments = Assessment.query.filter(
-            Assessment.assessed_at >= start_date,
-            Assessment.assessed_at <= end_date
-        ).count()
-        
-        high_risk = Assessment.query.filter(
-            Assessment.risk_level == 'high',
-            Assessment.assessed_at >= start_date,
-            Assessment.assessed_at <= end_date
-        ).count()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f'comprehensive_report_{timestamp}'
         
-        # Daily breakdown
-        daily_stats = []
-        current = start_date
-        while current <= end_date:
-            day_start = datetime.combine(current.date(), datetime.min.time())
-            day_end = day_start + timedelta(days=1)
-            
-            users_count = User.query.filter(
-                User.created_at >= day_start,
-                User.created_at < day_end
-            ).count()
-            
-            assessments_count = Assessment.query.filter(
-                Assessment.assessed_at >= day_start,
-                Assessment.assessed_at < day_end
-            ).count()
-            
-            high_risk_count = Assessment.query.filter(
-                Assessment.risk_level == 'high',
-                Assessment.assessed_at >= day_start,
-                Assessment.assessed_at < day_end
-            ).count()
-            
-            daily_stats.append({
-                'date': current.strftime('%Y-%m-%d'),
-                'new_users': users_count,
-                'assessments': assessments_count,
-                'high_risk_assessments': high_risk_count
-            })
-            
-            current += timedelta(days=1)
-        
-        report_data = {
-            'report_period': {
-                'start_date': start_date.strftime('%Y-%m-%d'),
-                'end_date': end_date.strftime('%Y-%m-%d')
-            },
-            'summary': {
-                'total_users': total_users,
-                'total_assessments': total_assessments,
-                'high_risk_assessments': high_risk,
-                'high_risk_percentage': round((high_risk / total_assessments * 100) if total_assessments > 0 else 0, 1)
-            },
-            'daily_breakdown': daily_stats
-        }
+        if wants_async_export():
+            job = enqueue_export_job('comprehensive', format_type, filename)
+            return jsonify({'message': 'Export queued', 'job': job.to_dict()}), 202
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        report_data = _build_comprehensive_report()
         
         if format_type == 'json':
-            filename = f'comprehensive_report_{timestamp}'
-            json_content = export_to_json(report_data, filename)
-            return send_file(
-                BytesIO(json_content.encode('utf-8')),
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f'{filename}.json'
-            )
+            return export_to_json(report_data, f'{filename}.json')
         elif format_type == 'csv':
             # For CSV, flatten the daily breakdown
-            filename = f'comprehensive_report_{timestamp}'
-            columns = {
-                'Date': 'date',
-                'New Users': 'new_users',
-                'Assessments': 'assessments',
-                'High Risk': 'high_risk_assessments'
-            }
-            csv_content = export_to_csv(daily_stats, columns, filename)
-            return send_file(
-                BytesIO(csv_content.encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{filename}.csv'
-            )
-        elif format_type == 'excel':
-            filename = f'comprehensive_report_{timestamp}'
-            columns = {
-                'Date': 'date',
-                'New Users': 'new_users',
-                'Assessments': 'assessments',
-                'High Risk': 'high_risk_assessments'
-            }
-            excel_content = export_to_excel(daily_stats, columns, filename)
-            return send_file(
-                excel_content,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'{filename}.xlsx'
-            )
+            return export_to_csv(report_data['daily_breakdown'], _COMPREHENSIVE_COLUMNS, f'{filename}.csv')
+        return export_to_excel(report_data['daily_breakdown'], _COMPREHENSIVE_COLUMNS, f'{filename}.xlsx')
         
     except Exception as e:
         current_app.logger.error(f'Comprehensive report error: {str(e)}', exc_info=True)
@@ -1,18 +1,18 @@
-from flask import Blueprint, request, jsonify, session, current_app, send_file
-from database import db, User, Assessment, ActivityLog, Admin
+from flask import Blueprint, request, jsonify, session, current_app
+from database import db, User, Assessment, ActivityLog, Admin, ASSESSMENT_FIELDS
 from datetime import datetime, timedelta
 from flask_mail import Message
 from marshmallow import ValidationError
 from schemas import UserCreateSchema, UserUpdateSchema
 from utils import validate_password
 from utils.pagination import Pagination
-from utils.search import SearchFilter, parse_sort_params, apply_sorting
-from utils.export import export_to_csv, export_to_json, export_to_excel
-from utils.cache import cached, invalidate_cache
+from utils.search import SearchFilter, parse_sort_params, apply_sorting, parse_fields_param
+from utils.export import iter_serialized, stream_csv, stream_excel, stream_json
+from utils.export_jobs import ExportSource, enqueue_export_job, register_export_source, wants_async_export
+from utils.cache import cached, invalidate_tags
 import string
 import random
 from werkzeug.security import generate_password_hash
-from io import BytesIO
 from utils.date_range import parse_request_date_range
 from utils.archive import archive_entity
 
@@ -48,6 +48,52 @@ def _require_super_admin():
         return jsonify({'error': 'Forbidden: requires super_admin (submit via approvals)'}), 403
     return None
 
+def _build_users_query():
+    """Build the filtered/sorted User query shared by the list and export endpoints."""
+    search = request.args.get('search', '').strip()
+    query = (
+        SearchFilter(User)
+        .add_text_search([User.email, User.full_name, User.username], search)
+        .build(User.query)
+    )
+
+    # Status filter (legacy-safe):
+    # - treat NULL status as active
+    # - compare status case-insensitively
+    status = request.args.get('status', '').strip().lower()
+    normalized_status = db.func.lower(db.func.coalesce(User.status, 'active'))
+    if status:
+        query = query.filter(normalized_status == status)
+    else:
+        # Default: hide archived users from the main list
+        query = query.filter(normalized_status != 'archived')
+
+    # Date range filter
+    start_date = request.args.get('start_date', '')
+    end_date = request.args.get('end_date', '')
+    if start_date:
+        start = datetime.fromisoformat(start_date)
+        query = query.filter(User.created_at >= start)
+    if end_date:
+        end = datetime.fromisoformat(end_date)
+        query = query.filter(User.created_at <= end)
+
+    # Apply sorting
+    allowed_sort_columns = {
+        'created_at': User.created_at,
+        'username': User.username,
+        'email': User.email,
+        'full_name': User.full_name,
+        'status': User.status
+    }
+    column, sort_order = parse_sort_params(
+        allowed_sort_columns,
+        'created_at',
+        'desc'
+    )
+    return apply_sorting(query, column, sort_order)
+
+
 @users_bp.route('/', methods=['GET'])
 def get_users():
     try:
@@ -55,64 +101,12 @@ def get_users():
         if auth_error:
             return auth_error
 
-        # Build search filter
-        search_filter = SearchFilter(User.query)
-        
-        # Simple search implementation
-        query = User.query
-        search = request.args.get('search', '').strip()
-        if search:
-            query = query.filter(
-                db.or_(
-                    User.email.ilike(f'%{search}%'),
-                    User.full_name.ilike(f'%{search}%'),
-                    User.username.ilike(f'%{search}%')
-                )
-            )
-        
-        # Status filter (legacy-safe):
-        # - treat NULL status as active
-        # - compare status case-insensitively
-        status = request.args.get('status', '').strip().lower()
-        normalized_status = db.func.lower(db.func.coalesce(User.status, 'active'))
-        if status:
-            query = query.filter(normalized_status == status)
-        else:
-            # Default: hide archived users from the main list
-            query = query.filter(normalized_status != 'archived')
-        
-        # Date range filter
-        start_date = request.args.get('start_date', '')
-        end_date = request.args.get('end_date', '')
-        if start_date:
-            from datetime import datetime as dt
-            start = dt.fromisoformat(start_date)
-            query = query.filter(User.created_at >= start)
-        if end_date:
-            from datetime import datetime as dt
-            end = dt.fromisoformat(end_date)
-            query = query.filter(User.created_at <= end)
-        
-        # Apply sorting
-        allowed_sort_columns = {
-            'created_at': User.created_at,
-            'username': User.username,
-            'email': User.email,
-            'full_name': User.full_name,
-            'status': User.status
-        }
-        column, sort_order = parse_sort_params(
-            allowed_sort_columns,
-            'created_at',
-            'desc'
-        )
-        query = query.order_by(column.desc() if sort_order == 'desc' else column.asc())
-        
-        # Paginate results
-        pagination = Pagination(query)
-        
-        # Convert users to dict
-        users = [user.to_dict() for user in pagination.items]
+        query = _build_users_query()
+
+        pagination = Pagination(query, count='cached')
+
+        # Assessment counts for this page's users only
+        users = User.serialize_page(pagination.items)
         
         return jsonify({
             'users': users,
@@ -217,8 +211,8 @@ def create_user():
         db.session.add(log)
         db.session.commit()
         
-        # Invalidate user stats cache
-        invalidate_cache('user_stats')
+        # Invalidate user stats and cached counts
+        invalidate_tags('user_stats', 'count:users')
         
         return jsonify({
             'message': 'User created successfully. Email sent.',
@@ -288,6 +282,7 @@ def delete_user(user_id):
 
         user.status = 'archived'
         db.session.commit()
+        invalidate_tags('user_stats', 'count:users')
         
         # Log activity
         log = ActivityLog(
@@ -315,9 +310,9 @@ def get_archived_users():
             return auth_error
 
         query = User.query.filter_by(status='archived').order_by(User.created_at.desc())
-        pagination = Pagination(query)
+        pagination = Pagination(query, count='cached')
 
-        users = [user.to_dict() for user in pagination.items]
+        users = User.serialize_page(pagination.items)
 
         return jsonify({
             'users': users,
@@ -337,6 +332,7 @@ def restore_user(user_id):
         user = User.query.get_or_404(user_id)
         user.status = 'active'
         db.session.commit()
+        invalidate_tags('user_stats', 'count:users')
         
         # Log activity
         log = ActivityLog(
@@ -378,6 +374,7 @@ def delete_user_permanently(user_id):
         Assessment.query.filter_by(user_id=user_id).delete(synchronize_session=False)
         db.session.delete(user)
         db.session.commit()
+        invalidate_tags('user_stats', 'count:users', 'assessment_stats', 'count:assessment_results')
         
         # Log activity
         log = ActivityLog(
@@ -407,6 +404,7 @@ def block_user(user_id):
         user = User.query.get_or_404(user_id)
         user.status = 'blocked'
         db.session.commit()
+        invalidate_tags('user_stats', 'count:users')
         
         # Log activity
         log = ActivityLog(
@@ -436,6 +434,7 @@ def unblock_user(user_id):
         user = User.query.get_or_404(user_id)
         user.status = 'active'
         db.session.commit()
+        invalidate_tags('user_stats', 'count:users')
         
         # Log activity
         log = ActivityLog(
@@ -459,11 +458,13 @@ def unblock_user(user_id):
 def get_user_assessments(user_id):
     try:
         user = User.query.get_or_404(user_id)
-        assessments = Assessment.query.filter_by(user_id=user_id).order_by(Assessment.created_at.desc()).all()
+        fields = parse_fields_param(ASSESSMENT_FIELDS)
+        query = Assessment.query.filter_by(user_id=user_id).order_by(Assessment.assessed_at.desc())
+        rows = Assessment.with_user_names(query, fields).all()
         
         return jsonify({
-            'user': user.to_dict(),
-            'assessments': [assessment.to_dict() for assessment in assessments]
+            'user': user.to_dict(total_assessments=len(rows)),
+            'assessments': Assessment.serialize_with_user_names(rows, fields)
         }), 200
         
     except Exception as e:
@@ -522,14 +523,13 @@ def get_recent_users():
     try:
         date_range = parse_request_date_range(default_days=30)
         limit = request.args.get('limit', 5, type=int)
-        users = (
+        query = (
             User.query.filter(User.status != 'archived')
             .filter(User.created_at >= date_range.start, User.created_at < date_range.end_exclusive)
             .order_by(User.created_at.desc())
-            .limit(limit)
-            .all()
         )
-        return jsonify({'users': [user.to_dict() for user in users]}), 200
+        users = query.limit(limit).all()
+        return jsonify({'users': User.serialize_page(users)}), 200
         
     except Exception as e:
         error_msg = str(e)
@@ -537,6 +537,26 @@ def get_recent_users():
             return jsonify({'error': error_msg}), 400
         return jsonify({'error': error_msg}), 500
 
+def _users_export_source():
+    """Users export: same filters/sorting as get_users, counts from one grouped subquery"""
+    return ExportSource(
+        query=User.with_assessment_counts(_build_users_query()),
+        serialize_batch=User.serialize_with_counts,
+        columns={
+            'User ID': 'id',
+            'Full Name': 'full_name',
+            'Email': 'email',
+            'Phone': 'phone',
+            'Status': 'status',
+            'Total Assessments': 'total_assessments',
+            'Created At': 'created_at'
+        },
+    )
+
+
+register_export_source('users', _users_export_source)
+
+
 @users_bp.route('/export', methods=['GET'])
 def export_users():
     """Export users data in various formats (CSV, JSON, Excel)"""
@@ -551,93 +571,34 @@ def export_users():
         if format_type not in ['csv', 'json', 'excel']:
             return jsonify({'error': 'Invalid format. Use csv, json, or excel'}), 400
         
-        # Build search filter (same as get_users)
-        search_filter = SearchFilter(User.query)
-        
-        search = request.args.get('search', '').strip()
-        if search:
-            search_filter.add_text_search(search, ['email', 'first_name', 'last_name'])
-        
-        status = request.args.get('status', '').strip()
-        if status:
-            search_filter.add_exact_match('status', status)
-        
-        gender = request.args.get('gender', '').strip()
-        if gender:
-            search_filter.add_exact_match('gender', gender)
-        
-        min_age = request.args.get('min_age', type=int)
-        max_age = request.args.get('max_age', type=int)
-        if min_age is not None or max_age is not None:
-            search_filter.add_range_filter('age', min_age, max_age)
-        
-        start_date = request.args.get('start_date', '')
-        end_date = request.args.get('end_date', '')
-        if start_date or end_date:
-            search_filter.add_date_range('created_at', start_date, end_date)
-        
-        query = search_filter.build()
-        
-        # Apply sorting
-        sort_by, sort_order = parse_sort_params(
-            request.args.get('sort_by', 'created_at'),
-            request.args.get('sort_order', 'desc')
-        )
-        query = apply_sorting(query, User, sort_by, sort_order)
-        
-        # Get all users (no pagination for export)
-        users = query.all()
-        
-        # Convert to dict
-        users_data = [user.to_dict() for user in users]
-        
-        # Define columns for export
-        columns = [
-            'user_id', 'email', 'first_name', 'last_name', 'age', 'gender',
-            'status', 'created_at', 'updated_at'
-        ]
-        
         # Generate filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'users_export_{timestamp}'
         
-        # Export based on format
-        if format_type == 'csv':
-            file_content = export_to_csv(users_data, columns, filename)
-            return send_file(
-                BytesIO(file_content.encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{filename}.csv'
-            )
-        elif format_type == 'json':
-            file_content = export_to_json(users_data, filename)
-            return send_file(
-                BytesIO(file_content.encode('utf-8')),
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f'{filename}.json'
-            )
-        elif format_type == 'excel':
-            file_content = export_to_excel(users_data, columns, filename)
-            return send_file(
-                file_content,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'{filename}.xlsx'
-            )
-        
         # Log export activity
         log = ActivityLog(
             admin_id=session.get('admin_id'),
             action='Export Users',
             entity_type='user',
-            details=f'Exported {len(users_data)} users as {format_type}',
+            details=f'Exported users as {format_type}',
             ip_address=request.remote_addr
         )
         db.session.add(log)
         db.session.commit()
         
+        if wants_async_export():
+            job = enqueue_export_job('users', format_type, filename)
+            return jsonify({'message': 'Export queued', 'job': job.to_dict()}), 202
+        
+        # Stream rows from a server-side cursor
+        source = _users_export_source()
+        users_data = iter_serialized(source.query, source.serialize_batch)
+        if format_type == 'csv':
+            return stream_csv(users_data, source.columns, f'{filename}.csv')
+        elif format_type == 'json':
+            return stream_json(users_data, f'{filename}.json')
+        return stream_excel(users_data, source.columns, f'{filename}.xlsx')
+        
     except Exception as e:
         current_app.logger.error(f'Export users error: {str(e)}', exc_info=True)
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
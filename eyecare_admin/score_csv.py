@@ -0,0 +1,211 @@
+"""Score a partner CSV file with the risk model.
+
+`sanity_predict.py` scores a single row. Partner clinics send files with
+hundreds of thousands of rows, so this CLI streams the input instead:
+
+- the input CSV (plain or .gz) is read in chunks of --chunk-size rows;
+- chunks are scored in --workers spawned processes that load the model once
+  (`predict_risk_frame`: one predict_proba call per chunk, Stage-2 rules only
+  for HIGH rows); read-ahead is bounded so memory stays flat;
+- results are appended to the output in input order: every input column
+  followed by the prediction columns. The output is CSV (gzipped when the
+  path ends in .gz) or Parquet when the path ends in .parquet (needs
+  pyarrow).
+
+Throughput (rows/sec) goes to stderr while scoring and at the end.
+
+    python score_csv.py partner.csv.gz scored.csv.gz --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Callable, Iterator
+
+import joblib
+import pandas as pd
+
+from ml_risk_predict import _FEATURE_ALIASES, normalize_feature_frame, predict_risk_frame
+
+CHUNK_SIZE = 20000
+MODEL_PATH_DEFAULT = os.path.join("models", "risk_model.joblib")
+REPORT_INTERVAL = 5.0  # seconds between throughput lines
+
+
+def read_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Input CSV in chunks (compression inferred from the extension)."""
+    # Rows stay strings until scoring: pandas would otherwise infer dtypes per
+    # chunk, and the output should echo the partner's values unchanged
+    yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+
+
+def numeric_features(pipeline) -> list[str]:
+    """Model features read as numbers: every training column except Gender."""
+    names = getattr(pipeline, "feature_names_in_", None)
+    if names is None:
+        names = _FEATURE_ALIASES.values()
+    return [c for c in names if c.lower() != "gender"]
+
+
+def _model_input(chunk: pd.DataFrame, numeric: list[str]) -> pd.DataFrame:
+    """String cells -> model input: numeric features parsed, unparseable cells ("NA", "N/A", ...) -> NaN."""
+    X = normalize_feature_frame(chunk.replace("", None))
+    for col in X.columns.intersection(numeric):
+        X[col] = pd.to_numeric(X[col], errors="coerce")
+    return X
+
+
+def score_chunk(pipeline, chunk: pd.DataFrame) -> pd.DataFrame:
+    X = _model_input(chunk, numeric_features(pipeline))
+    return pd.concat([chunk, predict_risk_frame(X, pipeline)], axis=1)
+
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self._file = gzip.open(path, "wt", newline="") if path.endswith(".gz") else open(path, "w", newline="")
+        self._header = True
+
+    def write(self, frame: pd.DataFrame) -> None:
+        frame.to_csv(self._file, index=False, header=self._header)
+        self._header = False
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)") from e
+        self._path = path
+        self._writer = None
+
+    def write(self, frame: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_writer(path: str):
+    if path.endswith(".parquet"):
+        return _ParquetWriter(path)
+    return _CsvWriter(path)
+
+
+# Worker-process state: the pipeline is loaded once per worker
+_worker_pipeline = None
+
+
+def _init_worker(model_path: str) -> None:
+    global _worker_pipeline
+    _worker_pipeline = joblib.load(model_path)
+
+
+def _score_in_worker(chunk: pd.DataFrame) -> pd.DataFrame:
+    return score_chunk(_worker_pipeline, chunk)
+
+
+def score_csv(
+    input_path: str,
+    output_path: str,
+    model_path: str = MODEL_PATH_DEFAULT,
+    workers: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    report: Callable[[int, float], None] | None = None,
+) -> dict[str, Any]:
+    """Score `input_path` into `output_path`; returns {'rows', 'seconds', 'rows_per_sec'}.
+
+    `workers` > 0 scores chunks in that many spawned processes; 0 scores
+    inline. `report(rows, seconds)` is called after each written chunk.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Risk model not found at {model_path}. Run train_risk_model.py first.")
+
+    started = time.perf_counter()
+    rows = 0
+    writer = open_writer(output_path)
+
+    def write(scored: pd.DataFrame) -> None:
+        nonlocal rows
+        writer.write(scored)
+        rows += len(scored)
+        if report is not None:
+            report(rows, time.perf_counter() - started)
+
+    try:
+        chunks = read_chunks(input_path, chunk_size)
+        if workers <= 0:
+            pipeline = joblib.load(model_path)
+            for chunk in chunks:
+                write(score_chunk(pipeline, chunk))
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+                # Bounded read-ahead; chunks are written in submission (= input) order
+                in_flight: deque = deque()
+                for chunk in chunks:
+                    in_flight.append(pool.apply_async(_score_in_worker, (chunk,)))
+                    if len(in_flight) >= workers * 2:
+                        write(in_flight.popleft().get())
+                while in_flight:
+                    write(in_flight.popleft().get())
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 2),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score a CSV of patient rows with the risk model.")
+    parser.add_argument("input", help="input CSV (.csv or .csv.gz)")
+    parser.add_argument("output", help="output file (.csv, .csv.gz or .parquet)")
+    parser.add_argument("--model-path", default=MODEL_PATH_DEFAULT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes (0 = inline)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    last = 0.0
+
+    def report(rows: int, seconds: float) -> None:
+        nonlocal last
+        if seconds - last >= REPORT_INTERVAL:
+            last = seconds
+            print(f"{rows} rows, {rows / seconds:.0f} rows/sec", file=sys.stderr)
+
+    stats = score_csv(
+        args.input,
+        args.output,
+        model_path=args.model_path,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        report=report,
+    )
+    print(
+        f"Scored {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec) -> {args.output}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
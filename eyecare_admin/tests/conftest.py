@@ -14,6 +14,7 @@ os.environ['TESTING'] = 'true'
 
 from app import app as flask_app
 from database import db, Admin, ActivityLog, HealthTip, User
+from utils.cache import invalidate_cache
 
 
 @pytest.fixture(scope='session')
@@ -61,6 +62,8 @@ def db_session(app):
         for table in reversed(db.metadata.sorted_tables):
             db.session.execute(table.delete())
         db.session.commit()
+        # Drop cached views/counts that refer to the deleted rows
+        invalidate_cache()
 
 
 @pytest.fixture(scope='function')
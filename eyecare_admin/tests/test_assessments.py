@@ -20,3 +20,89 @@ def test_assessments_stats_growth(authenticated_client):
     hr = data["high_risk_growth"]
     assert isinstance(hr, (int, float))
     assert not math.isnan(float(hr))
+
+
+def _add_assessment(db_session, user_id, assessment_id='a-1'):
+    import json
+    from database import Assessment
+
+    assessment = Assessment(
+        assessment_id=assessment_id,
+        user_id=user_id,
+        risk_level='High',
+        risk_score=72.5,
+        assessment_data=json.dumps({'age': 41, 'screen_time_hours': 9, 'smoking': True}),
+    )
+    db_session.add(assessment)
+    db_session.commit()
+    return assessment
+
+
+def test_assessments_list_joins_user_name(authenticated_client, mobile_user, db_session):
+    _add_assessment(db_session, mobile_user.user_id)
+
+    resp = authenticated_client.get("/api/assessments/?page=1&per_page=5")
+    assert resp.status_code == 200
+    row = resp.get_json()["assessments"][0]
+    assert row["user_name"] == "Test User"
+    assert row["age"] == 41
+    assert row["screen_time"] == 9
+    assert row["smoking"] is True
+    assert row["risk_level"] == "high"
+
+
+def test_assessments_list_field_projection(authenticated_client, mobile_user, db_session):
+    _add_assessment(db_session, mobile_user.user_id)
+
+    resp = authenticated_client.get("/api/assessments/?fields=id,risk_score,bogus")
+    assert resp.status_code == 200
+    assert resp.get_json()["assessments"] == [{"id": "a-1", "risk_score": 72.5}]
+
+
+def test_assessment_to_dict_matches_bulk_serializer(mobile_user, db_session):
+    from database import Assessment
+
+    assessment = _add_assessment(db_session, mobile_user.user_id)
+    rows = Assessment.with_user_names(Assessment.query).all()
+    assert Assessment.serialize_with_user_names(rows) == [assessment.to_dict()]
+
+
+def test_user_assessments_endpoint(authenticated_client, mobile_user, db_session):
+    _add_assessment(db_session, mobile_user.user_id)
+
+    resp = authenticated_client.get(f"/api/users/{mobile_user.user_id}/assessments?fields=id,user_name")
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["user"]["total_assessments"] == 1
+    assert data["assessments"] == [{"id": "a-1", "user_name": "Test User"}]
+
+
+def test_assessments_export_csv(authenticated_client, mobile_user, db_session):
+    _add_assessment(db_session, mobile_user.user_id)
+
+    resp = authenticated_client.get("/api/assessments/export?format=csv")
+    assert resp.status_code == 200
+    lines = resp.get_data(as_text=True).strip().splitlines()
+    assert lines[0].startswith("Assessment ID,User Name,Age")
+    assert lines[1].startswith("a-1,Test User,41")
+
+
+def test_assessments_list_cursor_mode(authenticated_client, mobile_user, db_session):
+    from datetime import datetime
+
+    for i in range(3):
+        assessment = _add_assessment(db_session, mobile_user.user_id, assessment_id=f'a-{i}')
+        assessment.assessed_at = datetime(2026, 1, 1 + i)
+    db_session.commit()
+
+    first = authenticated_client.get("/api/assessments/?per_page=2&cursor=").get_json()
+    assert [a['id'] for a in first['assessments']] == ['a-2', 'a-1']
+    assert first['assessments'][0]['user_name'] == mobile_user.full_name
+    assert first['pagination']['total'] == 3
+
+    second = authenticated_client.get(
+        f"/api/assessments/?per_page=2&cursor={first['pagination']['next_cursor']}"
+    ).get_json()
+    assert [a['id'] for a in second['assessments']] == ['a-0']
+    assert second['pagination']['has_next'] is False
+    assert second['pagination']['has_prev'] is True
@@ -0,0 +1,488 @@
+"""
+Tests for the view cache, Redis cache and cache invalidation
+"""
+import pytest
+
+
+class TestSimpleCache:
+    """Test the bounded LRU+TTL cache"""
+    
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        import utils.cache as cache_module
+        now = [1000.0]
+        monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+        return now
+    
+    def test_lru_eviction_by_entries(self):
+        """Test the least recently used entry is evicted first"""
+        from utils.cache import SimpleCache
+        cache = SimpleCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # 'b' is now least recently used
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+        assert cache.get_stats()['evictions'] == 1
+    
+    def test_byte_budget(self):
+        """Test entries are evicted to stay within the byte budget"""
+        from utils.cache import SimpleCache
+        cache = SimpleCache(max_bytes=3000)
+        for i in range(5):
+            cache.set(f'k{i}', 'x' * 1000)
+        stats = cache.get_stats()
+        assert stats['total_entries'] < 5
+        assert stats['memory_estimate_kb'] * 1024 <= 3000
+        assert cache.get('k4') is not None
+        cache.set('huge', 'x' * 10000)
+        assert cache.get('huge') is None
+        # An oversized update must not leave the old value behind
+        assert cache.set('k4', 'x' * 10000) is None
+        assert cache.get('k4') is None
+    
+    def test_ttl_uses_monotonic_clock(self, clock):
+        """Test entries expire after their timeout"""
+        from utils.cache import SimpleCache
+        cache = SimpleCache()
+        cache.set('a', 1, timeout=10)
+        cache.set('forever', 2, timeout=0)
+        clock[0] += 9
+        assert cache.get('a') == 1
+        clock[0] += 1
+        assert cache.get('a') is None
+        assert cache.get('forever') == 2
+        assert cache.get_stats()['expirations'] == 1
+    
+    def test_periodic_sweep(self, clock):
+        """Test expired entries are dropped without being read"""
+        from utils.cache import SimpleCache
+        cache = SimpleCache(sweep_interval=60)
+        for i in range(3):
+            cache.set(f'k{i}', i, timeout=5)
+        clock[0] += 61
+        cache.set('fresh', 1)
+        assert cache.keys() == ['fresh']
+    
+    def test_stats_counters(self):
+        """Test hit/miss counters and hot keys"""
+        from utils.cache import SimpleCache
+        cache = SimpleCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        for _ in range(3):
+            cache.get('a')
+        cache.get('b')
+        cache.get('missing')
+        stats = cache.get_stats()
+        assert stats['hits'] == 4 and stats['misses'] == 1
+        assert stats['hit_rate'] == 80.0
+        assert stats['hot_keys'][0] == {'key': 'a', 'hits': 3}
+    
+    def test_concurrent_access(self):
+        """Test the cache stays consistent under concurrent writers"""
+        import threading
+        from utils.cache import SimpleCache
+        cache = SimpleCache(max_entries=50)
+        
+        def worker(n):
+            for i in range(500):
+                cache.set(f'{n}:{i}', i)
+                cache.get(f'{n}:{i - 1}')
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = cache.get_stats()
+        assert stats['total_entries'] == 50
+        assert stats['sets'] == 4000
+
+
+class TestCacheTags:
+    """Test tag-based cache invalidation"""
+    
+    def test_delete_tag_removes_only_tagged_keys(self):
+        """Test a tag drops exactly its keys and the index stays consistent"""
+        from utils.cache import SimpleCache
+        cache = SimpleCache(max_entries=3)
+        cache.set('a', 1, tags=('stats', 'user:1'))
+        cache.set('b', 2, tags=('stats',))
+        cache.set('c', 3, tags=('user:2',))
+        assert cache.delete_tag('user:1') == 1
+        assert cache.keys() == ['b', 'c']
+        # Evicted/overwritten entries leave the tag index too
+        cache.set('d', 4)
+        cache.set('e', 5)
+        cache.set('f', 6)
+        assert cache.delete_tag('stats', 'user:2') == 0
+        assert cache.get_stats()['total_tags'] == 0
+    
+    def test_cached_view_with_computed_tags(self, app):
+        """Test @cached registers key_prefix and per-call tags"""
+        from utils.cache import cached, invalidate_cache
+        calls = []
+        
+        @cached(timeout=60, key_prefix='tagged_view', tags=lambda user_id: [f'assessments:user:{user_id}'])
+        def view(user_id):
+            calls.append(user_id)
+            return len(calls)
+        
+        with app.test_request_context('/'):
+            assert view('u1') == 1 and view('u1') == 1
+            assert view('u2') == 2
+            invalidate_cache('assessments:user:u1')
+            assert view('u1') == 3 and view('u2') == 2
+            invalidate_cache('tagged_view')
+            assert view('u2') == 4
+    
+    def test_redis_cache_generations(self, monkeypatch):
+        """Test Redis-backed @cached invalidates by generation bump"""
+        import utils.redis_cache as redis_cache
+        # No server in tests: RedisCache falls back to its in-memory client
+        backend = redis_cache.RedisCache(host='127.0.0.1', port=1)
+        monkeypatch.setattr(redis_cache, '_cache_instance', backend)
+        calls = []
+        
+        @redis_cache.cached(timeout=60, key_prefix='gen_test')
+        def compute(x):
+            calls.append(x)
+            return len(calls)
+        
+        assert compute(1) == 1 and compute(1) == 1
+        redis_cache.invalidate_cache('gen_test')
+        assert backend.tag_generations(['gen_test']) == [1]
+        assert compute(1) == 2
+        
+        # A hit is a single round trip (one MGET of the entry and its generations)
+        round_trips = []
+        real_call = backend._call
+        monkeypatch.setattr(backend, '_call', lambda op: round_trips.append(op) or real_call(op))
+        assert compute(1) == 2
+        assert len(round_trips) == 1
+
+
+    def test_clear_endpoint_deletes_by_key_prefix(self, authenticated_client, super_admin_user):
+        """Test /api/cache/clear with a prefix removes every key starting with it"""
+        from utils.cache import cache
+        cache.set('assessment_stats:a', 1, tags=('assessment_stats',))
+        cache.set('assessment:b', 2, tags=('assessment',))
+        cache.set('user_stats:c', 3, tags=('user_stats',))
+        response = authenticated_client.post('/api/cache/clear', json={'prefix': 'assessment'})
+        assert response.status_code == 200
+        assert response.get_json()['entries_removed'] == 2
+        assert cache.keys() == ['user_stats:c']
+
+
+class TestCacheBus:
+    """Test cross-worker cache invalidation"""
+    
+    def test_unix_socket_bus_delivers_to_peers(self, tmp_path):
+        """Test a published invalidation reaches other workers but not the sender"""
+        import threading
+        from utils.cache_bus import UnixSocketInvalidationBus
+        received = {'a': [], 'b': []}
+        done = threading.Event()
+        
+        def handler(name):
+            def handle(message):
+                received[name].append(message)
+                done.set()
+            return handle
+        
+        a = UnixSocketInvalidationBus(str(tmp_path))
+        b = UnixSocketInvalidationBus(str(tmp_path))
+        a.start(handler('a'))
+        b.start(handler('b'))
+        try:
+            a.publish({'tags': ['user_stats']})
+            assert done.wait(2)
+            assert received['b'][0]['tags'] == ['user_stats']
+            assert received['a'] == []
+        finally:
+            a.close()
+            b.close()
+    
+    def test_stale_peer_socket_is_removed(self, tmp_path):
+        """Test sockets left behind by dead workers are cleaned up"""
+        import os
+        import socket
+        from utils.cache_bus import UnixSocketInvalidationBus
+        stale = tmp_path / 'dead.sock'
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead.bind(str(stale))
+        dead.close()
+        bus = UnixSocketInvalidationBus(str(tmp_path))
+        bus.publish({'clear': True})
+        assert not os.path.exists(stale)
+    
+    def test_invalidation_is_broadcast_and_applied(self, monkeypatch):
+        """Test utils.cache publishes local invalidations and applies remote ones"""
+        import utils.cache as cache_module
+        
+        class RecordingBus:
+            def __init__(self):
+                self.published = []
+                self.handler = None
+            
+            def start(self, handler):
+                self.handler = handler
+            
+            def publish(self, message):
+                self.published.append(message)
+        
+        bus = RecordingBus()
+        monkeypatch.setattr(cache_module, '_bus_pid', None)
+        monkeypatch.setattr(cache_module, '_bus', None)
+        assert cache_module.start_invalidation_bus(bus) is bus
+        assert cache_module.start_invalidation_bus() is bus  # idempotent per process
+        
+        cache_module.invalidate_tags('user_stats')
+        assert bus.published == [{'tags': ['user_stats']}]
+        
+        cache_module.cache.set('report:1', 'data', tags=('dashboard_stats',))
+        bus.handler({'o': 'other-worker', 'tags': ['dashboard_stats']})
+        assert cache_module.cache.get('report:1') is None
+        
+        cache_module.invalidate_prefix('assessment')
+        assert bus.published[-1] == {'prefix': 'assessment'}
+        cache_module.cache.set('assessment_stats:1', 'data')
+        bus.handler({'o': 'other-worker', 'prefix': 'assessment'})
+        assert cache_module.cache.get('assessment_stats:1') is None
+
+
+class TestCachedRefresh:
+    """Test single-flight and refresh-ahead in @cached"""
+    
+    def test_concurrent_misses_compute_once(self, app):
+        """Test concurrent misses coalesce into one computation"""
+        import threading
+        import time
+        from utils.cache import cached
+        calls = []
+        
+        @cached(timeout=60, key_prefix='single_flight')
+        def slow_view():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'value': len(calls)}
+        
+        results = []
+        
+        def request_it():
+            with app.test_request_context('/slow'):
+                results.append(slow_view())
+        threads = [threading.Thread(target=request_it) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1
+        assert results == [{'value': 1}] * 5
+    
+    def test_refresh_ahead_serves_stale_and_recomputes(self, app, monkeypatch):
+        """Test a hit past the refresh point returns the cached value and refreshes it"""
+        import utils.cache as cache_module
+        now = [1000.0]
+        monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+        
+        class InlineExecutor:
+            def submit(self, fn):
+                fn()
+        monkeypatch.setattr(cache_module, '_get_refresh_executor', lambda: InlineExecutor())
+        seen_sessions = []
+        
+        @cache_module.cached(timeout=100, key_prefix='refresh_ahead', refresh_ahead=0.8)
+        def view():
+            from flask import session
+            seen_sessions.append(session.get('admin_id'))
+            return {'version': len(seen_sessions)}
+        
+        with app.test_request_context('/stats?days=30'):
+            from flask import session
+            session['admin_id'] = 7
+            assert view() == {'version': 1}
+            now[0] += 50
+            assert view() == {'version': 1}  # fresh, no refresh
+            now[0] += 35
+            assert view() == {'version': 1}  # stale: served, refreshed behind it
+            assert view() == {'version': 2}
+        assert seen_sessions == [7, 7]
+    
+    def test_error_results_not_cached(self, app):
+        """Test non-2xx view results are recomputed every time"""
+        from utils.cache import cached
+        calls = []
+        
+        @cached(timeout=60, key_prefix='errors')
+        def failing_view():
+            calls.append(1)
+            return {'error': 'Unauthorized'}, 401
+        
+        with app.test_request_context('/x'):
+            failing_view()
+            failing_view()
+        assert len(calls) == 2
+    
+    def test_warm_cache_prefills_dashboard_ranges(self, app, client, db_session):
+        """Test the warmer fills the same keys browser requests use"""
+        from database import Admin
+        from utils.cache import cache
+        from utils.cache_warmer import warm_cache
+        admin = Admin(username='root', email='root@test.com', full_name='Root',
+                      role='super_admin', status='active')
+        admin.set_password('RootPass123!')
+        db_session.add(admin)
+        db_session.commit()
+        
+        assert warm_cache(app) > 0
+        with client.session_transaction() as sess:
+            sess['admin_id'] = admin.id
+        hits_before = cache.get_stats()['hits']
+        response = client.get('/api/users/stats?days=90')
+        assert response.status_code == 200
+        assert cache.get_stats()['hits'] == hits_before + 1
+    
+    def test_warmer_replays_only_requested_views(self, app):
+        """Test a warming pass only covers dashboard requests made since the last one"""
+        from flask import g
+        from utils import cache_warmer
+        cache_warmer._take_demanded()
+        for path in ('/api/users/stats?days=30', '/api/users/stats?days=30',
+                     '/api/users/stats?days=12', '/api/users/', '/api/reports/dashboard-stats'):
+            with app.test_request_context(path):
+                cache_warmer.note_request()
+        with app.test_request_context('/api/assessments/stats?days=7'):
+            g.cache_warming = True
+            cache_warmer.note_request()
+        
+        assert cache_warmer._take_demanded() == [
+            ('/api/reports/dashboard-stats', ''),
+            ('/api/users/stats', 'days=30'),
+        ]
+        assert cache_warmer._take_demanded() == []
+
+
+class TestRedisCacheSerialization:
+    """Test binary cache values and batched operations"""
+    
+    @pytest.mark.parametrize('codec', ['json', 'orjson'])
+    def test_serializer_round_trip(self, codec):
+        """Test values survive encoding, with and without compression"""
+        from utils.cache_serializer import CacheSerializer, CODECS
+        if not CODECS[codec][3]:
+            pytest.skip(f'{codec} not installed')
+        serializer = CacheSerializer(codec=codec, compress_threshold=100)
+        small = {'total': 3, 'by_level': {'low': 1, 'high': 2}}
+        large = {'rows': [{'id': i, 'name': f'user {i}'} for i in range(50)]}
+        assert serializer.loads(serializer.dumps(small)) == small
+        assert serializer.dumps(small)[2:3] == b'-'
+        assert serializer.dumps(large)[2:3] == b'z'
+        assert serializer.loads(serializer.dumps(large)) == large
+    
+    def test_serializer_reads_legacy_json(self):
+        """Test entries written as JSON text before the binary format still load"""
+        from utils.cache_serializer import CacheSerializer
+        assert CacheSerializer().loads('{"total": 5}') == {'total': 5}
+    
+    def test_get_many_set_many(self):
+        """Test batched get/set (in-memory fallback when Redis is down)"""
+        from utils.redis_cache import RedisCache
+        backend = RedisCache(host='127.0.0.1', port=1)
+        assert backend.set_many({'a': 1, 'b': {'x': [1, 2]}}, timeout=60)
+        assert backend.get_many(['a', 'b', 'missing']) == {'a': 1, 'b': {'x': [1, 2]}}
+        assert backend.get_many([]) == {}
+
+
+class TestRedisCircuitBreaker:
+    """Test the Redis circuit breaker falls back to memory and recovers"""
+    
+    def test_open_circuit_uses_fallback_and_replays_invalidations(self, monkeypatch):
+        """Test Redis is skipped while open and pending invalidations are replayed"""
+        import redis
+        import utils.redis_cache as redis_cache
+        from utils.circuit_breaker import CircuitBreaker
+        
+        backend = redis_cache.RedisCache(host='127.0.0.1', port=1)
+        healthy = redis_cache.SimpleCache()
+        
+        class DownRedis:
+            calls = 0
+            
+            def __getattr__(self, name):
+                def command(*args, **kwargs):
+                    DownRedis.calls += 1
+                    raise redis.ConnectionError('connection refused')
+                return command
+        
+        backend.redis_client = True
+        backend.client = DownRedis()
+        backend.breaker = CircuitBreaker('test', failure_threshold=2, recovery_timeout=30)
+        
+        backend.set('k', {'v': 1}, timeout=60)
+        assert backend.get('k') == {'v': 1}  # served by the fallback
+        assert backend.breaker.state == 'open'
+        calls = DownRedis.calls
+        backend.invalidate_tags('user_stats')
+        assert backend.tag_generations(['user_stats']) == [1]
+        assert DownRedis.calls == calls
+        
+        # Redis comes back: the half-open probe closes the circuit and the
+        # outage's invalidations reach Redis
+        backend.client = healthy
+        now = redis_cache.time.monotonic()
+        monkeypatch.setattr('utils.circuit_breaker.time.monotonic', lambda: now + 31)
+        assert backend.get('missing') is None
+        assert backend.breaker.state == 'closed'
+        assert healthy.get('cache:gen:user_stats') == '1'
+    
+    def test_health_reports_open_circuit(self, client, monkeypatch):
+        """Test /health reports a degraded (not failed) status while the circuit is open"""
+        import utils.redis_cache as redis_cache
+        monkeypatch.setattr(redis_cache, 'circuit_state', lambda: {'state': 'open'})
+        response = client.get('/health')
+        assert response.status_code == 200
+        assert response.get_json()['status'] == 'degraded'
+        assert response.get_json()['redis_circuit']['state'] == 'open'
+
+
+class TestCacheMetrics:
+    """Test per-namespace metrics recorded by @cached"""
+    
+    def test_stats_endpoint_reports_namespaces(self, authenticated_client):
+        """Test /api/cache/stats breaks hits/misses/fills down by key_prefix"""
+        from utils.cache_metrics import cache_metrics
+        cache_metrics.reset()
+        authenticated_client.get('/api/users/stats?days=30')
+        authenticated_client.get('/api/users/stats?days=30')
+        
+        response = authenticated_client.get('/api/cache/stats')
+        assert response.status_code == 200
+        user_stats = response.get_json()['namespaces']['user_stats']
+        assert user_stats['misses'] == 1
+        assert user_stats['hits'] == 1
+        assert user_stats['fills'] == 1
+        assert user_stats['hit_rate'] == 50.0
+        assert user_stats['max_size_bytes'] > 0
+    
+    def test_errors_and_uncacheable_results(self, app):
+        """Test failures and error responses are counted, not filled"""
+        from utils.cache import cached
+        from utils.cache_metrics import cache_metrics
+        cache_metrics.reset()
+        
+        @cached(timeout=60, key_prefix='metrics_errors')
+        def view(fail):
+            if fail:
+                raise RuntimeError('boom')
+            return {'error': 'Forbidden'}, 403
+        
+        with app.test_request_context('/x'):
+            with pytest.raises(RuntimeError):
+                view(True)
+            view(False)
+        ns = cache_metrics.snapshot()['metrics_errors']
+        assert ns['errors'] == 1
+        assert ns['uncacheable'] == 1
+        assert ns['fills'] == 0
@@ -0,0 +1,206 @@
+"""
+Tests for data exports (streaming and background export jobs)
+"""
+from types import SimpleNamespace
+
+import pytest
+
+
+class TestStreamingExport:
+    """Test streaming CSV/JSON exporters"""
+    
+    def test_stream_csv_chunks(self, app, monkeypatch):
+        """Test CSV is emitted in several chunks and reassembles correctly"""
+        import utils.export as export
+        monkeypatch.setattr(export, 'STREAM_CHUNK_SIZE', 64)
+        rows = ({'id': i, 'name': f'user{i}', 'note': None} for i in range(50))
+        with app.test_request_context():
+            response = export.stream_csv(rows, {'ID': 'id', 'Name': 'name', 'Note': 'note'}, 'x.csv')
+            chunks = list(response.response)
+        assert response.is_streamed
+        assert len(chunks) > 2
+        lines = b''.join(chunks).decode('utf-8').splitlines()
+        assert lines[0] == 'ID,Name,Note'
+        assert lines[50] == '49,user49,'
+        assert len(lines) == 51
+    
+    def test_stream_json_is_valid_array(self, app, monkeypatch):
+        """Test streamed JSON parses back to the original rows"""
+        import json
+        import utils.export as export
+        monkeypatch.setattr(export, 'STREAM_CHUNK_SIZE', 32)
+        rows = [{'id': i} for i in range(20)]
+        with app.test_request_context():
+            response = export.stream_json(iter(rows))
+            body = b''.join(response.response)
+        assert json.loads(body) == rows
+    
+    def test_stream_json_empty(self, app):
+        """Test streaming an empty iterable yields an empty array"""
+        import json
+        from utils.export import stream_json
+        with app.test_request_context():
+            body = b''.join(stream_json(iter([])).response)
+        assert json.loads(body) == []
+    
+    def test_iter_query_batches(self, db_session):
+        """Test queries are consumed in fixed-size batches"""
+        from database import HealthTip
+        from utils.export import iter_query_batches
+        for i in range(5):
+            db_session.add(HealthTip(title=f'Tip {i}', description='d'))
+        db_session.commit()
+        batches = list(iter_query_batches(HealthTip.query.order_by(HealthTip.tip_id), batch_size=2))
+        assert [len(b) for b in batches] == [2, 2, 1]
+    
+    def test_logs_export_streams_csv(self, authenticated_client, admin_user, db_session):
+        """Test activity log export joins admin names and streams CSV"""
+        from database import ActivityLog
+        db_session.add(ActivityLog(admin_id=admin_user.id, action='Login'))
+        db_session.add(ActivityLog(admin_id=None, action='Cleanup'))
+        db_session.commit()
+        response = authenticated_client.get('/api/logs/export')
+        assert response.status_code == 200
+        assert response.is_streamed
+        body = response.get_data(as_text=True)
+        assert body.splitlines()[0].startswith('ID,Admin,Action')
+        assert 'Test Admin,Login' in body
+        assert 'System,Cleanup' in body
+    
+    def test_stream_excel_splits_sheets(self, app):
+        """Test write-only Excel export starts a new sheet at the row limit"""
+        import io
+        from openpyxl import load_workbook
+        from utils.export import stream_excel
+        rows = ({'id': i, 'name': f'user{i}'} for i in range(7))
+        with app.test_request_context():
+            response = stream_excel(rows, {'ID': 'id', 'Name': 'name'}, 'x.xlsx', max_rows_per_sheet=4)
+            body = b''.join(response.response)
+        assert int(response.headers['Content-Length']) == len(body)
+        wb = load_workbook(io.BytesIO(body), read_only=True)
+        assert wb.sheetnames == ['Export', 'Export (2)', 'Export (3)']
+        sheets = [list(ws.values) for ws in wb.worksheets]
+        assert [len(rows) for rows in sheets] == [4, 4, 2]
+        assert all(rows[0] == ('ID', 'Name') for rows in sheets)
+        assert sheets[2][1] == (6, 'user6')
+    
+    def test_users_export_excel(self, authenticated_client, mobile_user):
+        """Test user export in Excel format"""
+        import io
+        from openpyxl import load_workbook
+        response = authenticated_client.get('/api/users/export?format=excel')
+        assert response.status_code == 200
+        wb = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+        rows = list(wb.active.values)
+        assert rows[0][0] == 'User ID'
+        assert rows[1][2] == mobile_user.email
+
+
+class TestExportJobs:
+    """Test background export jobs"""
+    
+    @pytest.fixture
+    def sync_jobs(self, app, tmp_path, monkeypatch):
+        monkeypatch.setitem(app.config, 'EXPORT_JOBS_SYNC', True)
+        monkeypatch.setitem(app.config, 'EXPORT_FOLDER', str(tmp_path))
+        return tmp_path
+    
+    def test_async_users_export_completes(self, sync_jobs, authenticated_client, mobile_user):
+        """Test async export returns 202 and a downloadable gzip artifact"""
+        import gzip
+        response = authenticated_client.get('/api/users/export?format=csv&async=true')
+        assert response.status_code == 202
+        job = response.get_json()['job']
+        assert job['status'] == 'completed'
+        assert job['rows_written'] == 1
+        assert job['progress'] == 100.0
+        
+        status = authenticated_client.get(f"/api/exports/{job['id']}")
+        assert status.status_code == 200
+        assert status.get_json()['job']['status'] == 'completed'
+        
+        download = authenticated_client.get(f"/api/exports/{job['id']}/download")
+        assert download.status_code == 200
+        assert download.headers['Content-Disposition'].endswith('.csv.gz')
+        body = gzip.decompress(download.get_data()).decode('utf-8')
+        assert body.splitlines()[0].startswith('User ID')
+        assert mobile_user.email in body
+    
+    def test_download_supports_range(self, sync_jobs, authenticated_client, mobile_user):
+        """Test artifacts can be fetched in ranges to resume a download"""
+        job = authenticated_client.get('/api/users/export?format=json&async=true').get_json()['job']
+        full = authenticated_client.get(f"/api/exports/{job['id']}/download").get_data()
+        partial = authenticated_client.get(
+            f"/api/exports/{job['id']}/download", headers={'Range': 'bytes=10-'}
+        )
+        assert partial.status_code == 206
+        assert partial.get_data() == full[10:]
+    
+    def test_failed_job_is_recorded(self, sync_jobs, authenticated_client, monkeypatch):
+        """Test a failing export marks the job failed and refuses download"""
+        import utils.export_jobs as export_jobs
+        
+        def broken():
+            raise RuntimeError('boom')
+        monkeypatch.setitem(export_jobs._sources, 'users', broken)
+        job = authenticated_client.get('/api/users/export?async=true').get_json()['job']
+        assert job['status'] == 'failed'
+        assert 'boom' in job['error']
+        download = authenticated_client.get(f"/api/exports/{job['id']}/download")
+        assert download.status_code == 409
+    
+    def test_job_list_only_shows_own_jobs(self, sync_jobs, authenticated_client, db_session):
+        """Test admins only see their own export jobs"""
+        from database import ExportJob
+        db_session.add(ExportJob(id='other-job', export_type='users', format='csv',
+                                 filename='x', status='completed', requested_by=None))
+        db_session.commit()
+        assert authenticated_client.get('/api/exports/').get_json()['jobs'] == []
+        assert authenticated_client.get('/api/exports/other-job').status_code == 404
+    
+    def test_async_jobs_start_in_exporter_processes(self, app, authenticated_client, monkeypatch):
+        """Test async exports are dispatched to exporter processes, capped per worker"""
+        import utils.export_jobs as export_jobs
+        started = []
+        
+        def fake_start(job_id):
+            started.append(job_id)
+            export_jobs._processes[job_id] = SimpleNamespace(is_alive=lambda: True)
+        monkeypatch.setattr(export_jobs, '_start_exporter', fake_start)
+        monkeypatch.setattr(export_jobs, '_processes', {})
+        monkeypatch.setitem(app.config, 'EXPORT_JOB_WORKERS', 1)
+        
+        first = authenticated_client.get('/api/users/export?async=true').get_json()['job']
+        second = authenticated_client.get('/api/users/export?async=true').get_json()['job']
+        assert first['status'] == second['status'] == 'queued'
+        assert started == [first['id']]
+        
+        # The first exporter finishes; polling starts the next queued job
+        export_jobs._update_job(first['id'], status='completed')
+        export_jobs._processes[first['id']] = SimpleNamespace(is_alive=lambda: False, join=lambda: None, exitcode=0)
+        authenticated_client.get(f"/api/exports/{second['id']}")
+        assert started == [first['id'], second['id']]
+    
+    def test_orphaned_jobs_are_failed_and_purged(self, sync_jobs, db_session):
+        """Test jobs left queued/running by a dead worker are failed, then purged"""
+        from datetime import datetime, timedelta
+        from database import ExportJob
+        from utils.export_jobs import fail_stale_export_jobs, purge_expired_export_jobs
+        now = datetime.utcnow()
+        db_session.add_all([
+            ExportJob(id='stale-running', export_type='users', format='csv', filename='x', status='running',
+                      created_at=now - timedelta(hours=2), updated_at=now - timedelta(hours=1)),
+            ExportJob(id='stale-queued', export_type='users', format='csv', filename='x', status='queued',
+                      created_at=now - timedelta(hours=2)),
+            ExportJob(id='live-running', export_type='users', format='csv', filename='x', status='running',
+                      created_at=now - timedelta(hours=2), updated_at=now),
+        ])
+        db_session.commit()
+        
+        assert fail_stale_export_jobs() == 2
+        db_session.expire_all()
+        statuses = {job.id: job.status for job in ExportJob.query.all()}
+        assert statuses == {'stale-running': 'failed', 'stale-queued': 'failed', 'live-running': 'running'}
+        
+        purge_expired_export_jobs(retention_hours=1)
+        assert {job.id for job in ExportJob.query.all()} == {'live-running'}
@@ -0,0 +1,683 @@
+"""
+Tests for model training, scoring and the ML routes
+"""
+import pytest
+
+
+class TestTrainingJobs:
+    """Test background model retraining jobs"""
+    
+    @pytest.fixture
+    def sync_training(self, app, tmp_path, monkeypatch):
+        import numpy as np
+        import pandas as pd
+        rng = np.random.default_rng(0)
+        n = 200
+        frame = pd.DataFrame({
+            'Age': rng.integers(18, 80, n),
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'BMI': rng.normal(25, 4, n).round(1),
+            'Screen_Time_Hours': rng.integers(1, 12, n),
+        })
+        frame['Eye_Disease_Risk'] = ((frame['Age'] > 50) | (frame['Screen_Time_Hours'] > 8)).astype(int)
+        dataset = tmp_path / 'train.csv'
+        frame.to_csv(dataset, index=False)
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        monkeypatch.setitem(app.config, 'TRAINING_JOBS_SYNC', True)
+        monkeypatch.setitem(app.config, 'RISK_MODEL_PATH', str(tmp_path / 'risk_model.joblib'))
+        return dataset
+    
+    @pytest.fixture
+    def super_client(self, client, super_admin_user):
+        with client.session_transaction() as sess:
+            sess['admin_id'] = super_admin_user.id
+            sess['admin_role'] = super_admin_user.role
+        return client
+    
+    def test_retrain_runs_as_job(self, sync_training, super_client, tmp_path):
+        """Test retraining returns a job that records progress and metrics"""
+        from database import MLMetrics
+        response = super_client.post('/api/ml/retrain', json={'dataset_file': str(sync_training)})
+        assert response.status_code == 202
+        job = response.get_json()['job']
+        assert job['status'] == 'completed', job['error']
+        assert job['progress'] == 100.0
+        assert job['result']['n_rows'] == 200
+        assert (tmp_path / 'risk_model.joblib').exists()
+        assert MLMetrics.query.get(job['metrics_id']) is not None
+        
+        status = super_client.get(f"/api/ml/retrain/jobs/{job['id']}")
+        assert status.status_code == 200
+        assert status.get_json()['job']['stage'] == 'done'
+    
+    def test_one_job_at_a_time(self, sync_training, super_client, db_session):
+        """Test a second retrain is refused while one is running"""
+        from datetime import datetime
+        from database import TrainingJob
+        db_session.add(TrainingJob(id='running-job', dataset_path='x.csv', status='running',
+                                   updated_at=datetime.utcnow()))
+        db_session.commit()
+        response = super_client.post('/api/ml/retrain', json={'dataset_file': str(sync_training)})
+        assert response.status_code == 409
+        assert response.get_json()['job']['id'] == 'running-job'
+    
+    def test_active_job_slot_is_enforced_by_database(self, sync_training, super_client, db_session):
+        """Test the active-job guard holds even without the application-level check"""
+        from sqlalchemy.exc import IntegrityError
+        from database import TrainingJob
+        job = super_client.post('/api/ml/retrain', json={'dataset_file': str(sync_training)}).get_json()['job']
+        assert job['status'] == 'completed'
+        assert db_session.get(TrainingJob, job['id']).active_slot is None  # finished jobs free the slot
+        
+        db_session.add(TrainingJob(id='first', dataset_path='x.csv', status='queued'))
+        db_session.commit()
+        db_session.add(TrainingJob(id='second', dataset_path='x.csv', status='running'))
+        with pytest.raises(IntegrityError):
+            db_session.commit()
+        db_session.rollback()
+    
+    def test_cancel_stops_running_training(self, app, sync_training, db_session, monkeypatch):
+        """Test the cancel flag aborts training at the next progress report"""
+        import train_risk_model
+        from database import TrainingJob, db
+        from utils.training_jobs import cancel_training_job, run_training_job
+        
+        job = TrainingJob(id='cancel-me', dataset_path=str(sync_training), status='queued')
+        db_session.add(job)
+        db_session.commit()
+        
+        def fake_train(dataset_path, progress, **kwargs):
+            progress('loading', 0.0)
+            cancel_training_job(db_session.get(TrainingJob, 'cancel-me'))
+            progress('fitting', 0.5)
+            raise AssertionError('training should have been cancelled')
+        monkeypatch.setattr(train_risk_model, 'train_risk_model', fake_train)
+        
+        run_training_job('cancel-me', db.engine)
+        db_session.expire_all()
+        assert db_session.get(TrainingJob, 'cancel-me').status == 'cancelled'
+    
+    def test_incremental_update_from_assessments(self, sync_training, super_client, db_session, mobile_user):
+        """Test labeled assessments since the watermark update and promote the model"""
+        import json
+        from datetime import datetime, timedelta
+        import numpy as np
+        from database import Assessment
+        response = super_client.post('/api/ml/retrain', json={'dataset_file': str(sync_training)})
+        assert response.get_json()['job']['status'] == 'completed'
+        
+        rng = np.random.default_rng(3)
+        start = datetime(2026, 1, 1)
+        for i in range(160):
+            age, screen = int(rng.integers(18, 80)), int(rng.integers(1, 12))
+            data = {'Age': age, 'Gender': 'Male' if i % 2 else 'Female',
+                    'BMI': 24.0, 'Screen_Time_Hours': screen}
+            if i % 8:  # every 8th assessment has no confirmed label
+                data['Eye_Disease_Risk'] = int(age > 50 or screen > 8)
+            db_session.add(Assessment(assessment_id=f'inc-{i:03d}', user_id=mobile_user.user_id,
+                                      risk_level='Low', risk_score=10.0, assessment_data=json.dumps(data),
+                                      assessed_at=start + timedelta(minutes=i)))
+        db_session.commit()
+        
+        job = super_client.post('/api/ml/retrain', json={'mode': 'continue'}).get_json()['job']
+        assert job['status'] == 'completed', job['error']
+        assert job['mode'] == 'continue'
+        result = job['result']
+        assert result['n_rows'] == 140
+        assert result['n_train'] + result['n_holdout'] > 140  # holdout includes the base test split
+        assert result['promoted'], result['reason']
+        assert result['watermark']['assessment_id'] == 'inc-159'
+        assert job['metrics_id'] is not None
+        
+        again = super_client.post('/api/ml/retrain', json={'mode': 'refit'}).get_json()['job']
+        assert again['result']['promoted'] is False
+        assert again['result']['n_rows'] == 0
+        assert again['metrics_id'] is None
+        
+        assert super_client.post('/api/ml/retrain', json={'mode': 'bogus'}).status_code == 400
+    
+    def test_labeled_rows_without_timestamp_are_skipped(self, app, db_session, mobile_user):
+        """Test rows with a NULL assessed_at neither break the watermark nor get read"""
+        import json
+        from datetime import datetime
+        from database import Assessment, db
+        from incremental_training import iter_labeled_assessments
+        for i in range(3):
+            db_session.add(Assessment(assessment_id=f'wm-{i}', user_id=mobile_user.user_id,
+                                      risk_level='Low', risk_score=0.0,
+                                      assessment_data=json.dumps({'Age': 40, 'Eye_Disease_Risk': 1}),
+                                      assessed_at=datetime(2026, 1, 1, i)))
+        db_session.commit()
+        Assessment.query.filter_by(assessment_id='wm-1').update({'assessed_at': None})
+        db_session.commit()
+        
+        chunks = list(iter_labeled_assessments(db.engine, None, ['Age'], chunk_size=1))
+        assert [frame['assessment_id'].tolist() for frame, _ in chunks] == [['wm-0'], ['wm-2']]
+        assert chunks[-1][1] == {'assessed_at': '2026-01-01T02:00:00', 'assessment_id': 'wm-2'}
+    
+    def test_rescore_assessments_resumes_from_checkpoint(self, app, sync_training, super_client, db_session,
+                                                          mobile_user, tmp_path, monkeypatch):
+        """Test re-scoring stamps the model version and resumes after an interruption"""
+        import json
+        from database import Assessment, MLMetrics, db
+        from rescoring import read_checkpoint, rescore_assessments
+        response = super_client.post('/api/ml/retrain', json={'dataset_file': str(sync_training)})
+        version = MLMetrics.query.get(response.get_json()['job']['metrics_id']).model_version
+
+        for i in range(25):
+            data = {'Age': 20 + 2 * i, 'Gender': 'Female', 'BMI': 24.0, 'Screen_Time_Hours': i % 12}
+            db_session.add(Assessment(assessment_id=f'rs-{i:03d}', user_id=mobile_user.user_id,
+                                      risk_level='Low', risk_score=0.0, model_version='old',
+                                      predicted_disease='N/A', per_disease_scores='{"Dry Eye": 0.1}',
+                                      assessment_data='not json' if i == 7 else json.dumps(data)))
+        db_session.commit()
+
+        checkpoint = str(tmp_path / 'rescore_checkpoint.json')
+        model_path = str(tmp_path / 'risk_model.joblib')
+
+        def interrupt(stage, fraction):
+            if fraction > 0.3:
+                raise KeyboardInterrupt
+        with pytest.raises(KeyboardInterrupt):
+            rescore_assessments(db.engine, version, model_path=model_path, chunk_size=10,
+                                checkpoint_path=checkpoint, progress=interrupt)
+        saved = read_checkpoint(checkpoint)
+        assert (saved['model_version'], saved['last_id'], saved['rows']) == (version, 'rs-009', 9)
+
+        import utils.cache
+        from utils.cache import cache
+        cache.set('assessment_stats:view', {'high': 0}, tags=('assessment_stats',))
+        invalidations = []
+        real_invalidate = utils.cache.invalidate_tags
+        monkeypatch.setattr(utils.cache, 'invalidate_tags',
+                            lambda *tags: invalidations.append(tags) or real_invalidate(*tags))
+        result = rescore_assessments(db.engine, version, model_path=model_path, chunk_size=10, workers=1,
+                                     checkpoint_path=checkpoint)
+        assert result.resumed and result.rows == 15 and result.total_rows == 24
+        assert cache.get('assessment_stats:view') is None  # cached stats invalidated
+        assert len(invalidations) == 1  # once per run, not per chunk
+        assert result.last_id == 'rs-024'
+        assert not (tmp_path / 'rescore_checkpoint.json').exists()
+
+        db_session.expire_all()
+        rescored = Assessment.query.filter_by(model_version=version).all()
+        assert len(rescored) == 24
+        for a in rescored:
+            # Mobile backend's shape: High/Low at 0.5, confidence is the probability
+            assert a.risk_level == ('High' if a.risk_score >= 50 else 'Low')
+            assert float(a.confidence_score) == pytest.approx(float(a.risk_score), abs=0.01)
+            # Per-condition results the app displays are left alone
+            assert (a.predicted_disease, a.per_disease_scores) == ('N/A', '{"Dry Eye": 0.1}')
+        assert Assessment.query.get('rs-007').model_version == 'old'
+
+        monkeypatch.setenv('RESCORE_WORKERS', '0')
+        job = super_client.post('/api/ml/retrain', json={'mode': 'rescore'}).get_json()['job']
+        assert job['status'] == 'completed', job['error']
+        assert job['result']['rows'] == 0 and job['result']['skipped'] == 1
+        assert job['metrics_id'] is None
+
+    def test_stale_running_job_reported_failed(self, super_client, db_session):
+        """Test a job whose trainer stopped heartbeating is marked failed"""
+        from datetime import datetime, timedelta
+        from database import TrainingJob
+        db_session.add(TrainingJob(id='stale-job', dataset_path='x.csv', status='running',
+                                   updated_at=datetime.utcnow() - timedelta(hours=1)))
+        db_session.commit()
+        job = super_client.get('/api/ml/retrain/jobs/stale-job').get_json()['job']
+        assert job['status'] == 'failed'
+
+
+class TestDatasetCache:
+    """Test dataset upload validation and the columnar training cache"""
+    
+    CSV = (
+        'Age,Gender,BMI,Screen_Time_Hours,Eye_Disease_Risk\n'
+        '56,Male,24.4,8,1\n'
+        '23,Female,,3,0\n'
+        '41, Female,30.1,6,1\n'
+    )
+    
+    @pytest.fixture
+    def cache_dir(self, tmp_path, monkeypatch, app):
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        monkeypatch.chdir(tmp_path)
+        return tmp_path / 'cache'
+    
+    def _upload(self, client, content, filename='risk.csv'):
+        import io
+        return client.post('/api/ml/upload-dataset', content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(content.encode()), filename)})
+    
+    def test_upload_builds_typed_cache(self, authenticated_client, cache_dir):
+        """Test a valid upload is cached once, with summary statistics"""
+        response = self._upload(authenticated_client, self.CSV)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['rows'] == 3
+        assert body['stats']['BMI']['missing'] == 1
+        assert body['stats']['Gender']['counts'] == {'Male': 1, 'Female': 2, 'Other': 0}
+        assert (cache_dir / body['content_hash'] / 'meta.json').exists()
+    
+    def test_invalid_upload_rejected(self, authenticated_client, cache_dir):
+        """Test schema violations are reported at upload time and the file is discarded"""
+        bad = 'Age,Gender,Eye_Disease_Risk\n200,Male,1\n30,Robot,2\n'
+        response = self._upload(authenticated_client, bad)
+        assert response.status_code == 400
+        details = response.get_json()['details']
+        assert len(details) == 3
+        assert any('Gender' in error for error in details)
+        assert not (cache_dir.parent / 'ml' / 'datasets' / 'risk.csv').exists()
+        
+        response = self._upload(authenticated_client, 'Age,Gender\n30,Male\n')
+        assert response.status_code == 400
+        assert 'Missing columns: Eye_Disease_Risk' in response.get_json()['details']
+    
+    def test_invalid_upload_keeps_previous_dataset(self, authenticated_client, cache_dir):
+        """Test a rejected upload does not overwrite or delete the dataset of the same name"""
+        from dataset_cache import dataset_hash
+        first = self._upload(authenticated_client, self.CSV).get_json()
+        response = self._upload(authenticated_client, 'Age,Gender,Eye_Disease_Risk\n200,Robot,2\n')
+        assert response.status_code == 400
+        
+        datasets = cache_dir.parent / 'ml' / 'datasets'
+        assert (datasets / 'risk.csv').read_text() == self.CSV
+        assert sorted(p.name for p in datasets.iterdir()) == ['risk.csv']
+        assert dataset_hash(first['filepath']) == first['content_hash']
+    
+    def test_load_dataset_matches_csv(self, cache_dir, tmp_path):
+        """Test training reads the same values from the cache as from the CSV"""
+        import numpy as np
+        import pandas as pd
+        from dataset_cache import load_dataset
+        path = tmp_path / 'risk.csv'
+        path.write_text(self.CSV)
+        
+        first = load_dataset(str(path))
+        second = load_dataset(str(path))  # served from the cache
+        expected = pd.read_csv(path, skipinitialspace=True)
+        for frame in (first, second):
+            assert list(frame.columns) == list(expected.columns)
+            assert list(frame['Gender']) == ['Male', 'Female', 'Female']
+            np.testing.assert_allclose(frame['BMI'].astype(float), expected['BMI'], rtol=1e-6)
+            assert frame['Eye_Disease_Risk'].tolist() == [1, 0, 1]
+        assert len([p for p in cache_dir.iterdir() if p.is_dir()]) == 1
+
+
+class TestTrainingCache:
+    """Test reuse of preprocessed data and LightGBM binary datasets across retrains"""
+    
+    def test_retrain_reuses_binned_dataset(self, tmp_path, monkeypatch):
+        """Test a second run hits the cache and trains an identical model"""
+        import joblib
+        import numpy as np
+        import pandas as pd
+        import train_risk_model
+        import training_cache
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        rng = np.random.default_rng(1)
+        n = 300
+        frame = pd.DataFrame({
+            'Age': rng.integers(18, 80, n),
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'Screen_Time_Hours': rng.integers(1, 12, n),
+        })
+        frame['Eye_Disease_Risk'] = ((frame['Age'] > 50) | (frame['Screen_Time_Hours'] > 8)).astype(int)
+        dataset = tmp_path / 'train.csv'
+        frame.to_csv(dataset, index=False)
+        
+        builds = []
+        original = training_cache._write
+        monkeypatch.setattr(training_cache, '_write', lambda *args: builds.append(1) or original(*args))
+        
+        results = [
+            train_risk_model.train_risk_model(str(dataset), str(tmp_path / f'model{i}.joblib'),
+                                              save_metrics_to_db=False)
+            for i in range(2)
+        ]
+        assert len(builds) == 1
+        assert len(list((tmp_path / 'cache' / 'prep').glob('*/train.bin'))) == 1
+        assert results[0].accuracy == results[1].accuracy
+        
+        sample = frame.drop(columns=['Eye_Disease_Risk']).head(20)
+        first, second = (joblib.load(r.model_path) for r in results)
+        np.testing.assert_array_equal(first.predict_proba(sample), second.predict_proba(sample))
+    
+    @pytest.mark.parametrize('n_classes', [2, 3])
+    def test_cached_fit_matches_regular_fit(self, tmp_path, n_classes):
+        """Test fit_classifier leaves the same model state as LGBMClassifier.fit (pinned LightGBM internals)"""
+        import numpy as np
+        import pandas as pd
+        from lightgbm import LGBMClassifier
+        from training_cache import DATASET_PARAMS, fit_classifier, prepare_training_data
+        rng = np.random.default_rng(5)
+        X = pd.DataFrame(rng.normal(size=(400, 4)), columns=['a', 'b', 'c', 'd'])
+        X.iloc[::7, 1] = np.nan
+        y = ((X['a'] > 0).astype(int) + (n_classes == 3) * (X['c'] > 0.5)).to_numpy()
+        params = dict(n_estimators=30, num_leaves=8, min_child_samples=5, subsample=0.8,
+                      subsample_freq=1, random_state=3, verbose=-1)
+        
+        prepared = prepare_training_data(str(tmp_path), 'key', lambda: (None, X, y, X.head(50), y[:50], {}))
+        cached = fit_classifier(LGBMClassifier(**params), prepared)
+        regular = LGBMClassifier(**params, **DATASET_PARAMS).fit(X, y)
+        
+        np.testing.assert_array_equal(cached.predict_proba(X), regular.predict_proba(X))
+        np.testing.assert_array_equal(cached.predict(X), regular.predict(X))
+        np.testing.assert_array_equal(cached.feature_importances_, regular.feature_importances_)
+        for attr in ('classes_', 'n_classes_', 'n_features_in_', 'feature_name_', 'objective_', 'n_estimators_'):
+            assert np.all(getattr(cached, attr) == getattr(regular, attr)), attr
+    
+    def test_preprocessing_follows_config(self, tmp_path, monkeypatch):
+        """Test the preprocessing config drives both the pipeline and the cache key"""
+        import numpy as np
+        import pandas as pd
+        import joblib
+        import train_risk_model
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        rng = np.random.default_rng(6)
+        n = 200
+        frame = pd.DataFrame({
+            'Age': rng.integers(18, 80, n),
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'Screen_Time_Hours': rng.integers(1, 12, n),
+        })
+        frame['Eye_Disease_Risk'] = ((frame['Age'] > 50) | (frame['Screen_Time_Hours'] > 8)).astype(int)
+        frame.to_csv(tmp_path / 'train.csv', index=False)
+        
+        config = {**train_risk_model.PREPROCESSING_CONFIG, 'numeric_imputer': 'mean'}
+        monkeypatch.setattr(train_risk_model, 'PREPROCESSING_CONFIG', config)
+        result = train_risk_model.train_risk_model(str(tmp_path / 'train.csv'), str(tmp_path / 'model.joblib'),
+                                                   save_metrics_to_db=False)
+        preprocessor = joblib.load(result.model_path).named_steps['preprocessor']
+        assert preprocessor.named_transformers_['num'].named_steps['imputer'].strategy == 'mean'
+        assert len(list((tmp_path / 'cache' / 'prep').glob('*/meta.json'))) == 1
+
+
+class TestScoreCsv:
+    """Test chunked CSV scoring"""
+
+    def test_gzip_chunks_scored_in_input_order(self, tmp_path, monkeypatch):
+        """Test chunked scoring matches per-row predictions and keeps row order"""
+        import joblib
+        import numpy as np
+        import pandas as pd
+        import train_risk_model
+        from ml_risk_predict import predict_risk_two_stage_batch
+        from score_csv import score_csv
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        rng = np.random.default_rng(2)
+        n = 300
+        frame = pd.DataFrame({
+            'Age': rng.integers(18, 80, n),
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'Screen_Time_Hours': rng.integers(1, 12, n),
+        })
+        frame['Eye_Disease_Risk'] = ((frame['Age'] > 50) | (frame['Screen_Time_Hours'] > 8)).astype(int)
+        frame.to_csv(tmp_path / 'train.csv', index=False)
+        model_path = str(tmp_path / 'model.joblib')
+        train_risk_model.train_risk_model(str(tmp_path / 'train.csv'), model_path, save_metrics_to_db=False)
+
+        partner = frame.drop(columns=['Eye_Disease_Risk']).head(95).copy()
+        partner.insert(0, 'patient_ref', [f'p{i}' for i in range(95)])
+        partner.loc[3, 'Screen_Time_Hours'] = None
+        partner.to_csv(tmp_path / 'partner.csv.gz', index=False)
+
+        reports = []
+        stats = score_csv(str(tmp_path / 'partner.csv.gz'), str(tmp_path / 'scored.csv.gz'),
+                          model_path=model_path, chunk_size=20, report=lambda rows, s: reports.append(rows))
+        assert stats['rows'] == 95
+        assert reports == [20, 40, 60, 80, 95]
+
+        scored = pd.read_csv(tmp_path / 'scored.csv.gz', keep_default_na=False)
+        assert scored['patient_ref'].tolist() == partner['patient_ref'].tolist()
+        records = partner.drop(columns=['patient_ref']).astype(object)
+        expected = predict_risk_two_stage_batch(records.where(records.notna(), None).to_dict('records'),
+                                                joblib.load(model_path))
+        np.testing.assert_allclose(scored['risk_probability'], [r['risk_probability'] for r in expected])
+        assert scored['probable_condition'].tolist() == [r['probable_condition'] for r in expected]
+
+    def test_non_numeric_cells_are_missing_values(self, tmp_path, monkeypatch):
+        """Test NA / N/A / garbage cells in numeric columns score as missing instead of aborting"""
+        import numpy as np
+        import pandas as pd
+        import train_risk_model
+        from score_csv import score_csv
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        rng = np.random.default_rng(3)
+        n = 200
+        frame = pd.DataFrame({
+            'Age': rng.integers(18, 80, n),
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'Screen_Time_Hours': rng.integers(1, 12, n),
+        })
+        frame['Eye_Disease_Risk'] = ((frame['Age'] > 50) | (frame['Screen_Time_Hours'] > 8)).astype(int)
+        frame.to_csv(tmp_path / 'train.csv', index=False)
+        model_path = str(tmp_path / 'model.joblib')
+        train_risk_model.train_risk_model(str(tmp_path / 'train.csv'), model_path, save_metrics_to_db=False)
+
+        partner = pd.DataFrame({
+            'Age': ['64', 'NA', '31', 'unknown'],
+            'Gender': ['Male', 'Female', 'Male', 'Female'],
+            'Screen_Time_Hours': ['N/A', '3', '10', '2'],
+        })
+        partner.to_csv(tmp_path / 'partner.csv', index=False)
+        clean = partner.replace({'NA': None, 'N/A': None, 'unknown': None})
+        clean.to_csv(tmp_path / 'clean.csv', index=False)
+
+        score_csv(str(tmp_path / 'partner.csv'), str(tmp_path / 'scored.csv'), model_path=model_path)
+        score_csv(str(tmp_path / 'clean.csv'), str(tmp_path / 'expected.csv'), model_path=model_path)
+        scored = pd.read_csv(tmp_path / 'scored.csv', keep_default_na=False)
+        expected = pd.read_csv(tmp_path / 'expected.csv', keep_default_na=False)
+        # Partner values are echoed unchanged
+        assert scored['Age'].tolist() == ['64', 'NA', '31', 'unknown']
+        np.testing.assert_allclose(scored['risk_probability'], expected['risk_probability'])
+
+
+class TestRiskScoreCalculator:
+    """Test the vectorized Excel-formula risk score"""
+
+    def test_vectorized_matches_scalar(self):
+        """Test calculate_risk_scores/get_risk_levels agree with the scalar functions row by row"""
+        import numpy as np
+        import pandas as pd
+        from risk_score_calculator import (
+            calculate_risk_score, calculate_risk_scores, get_risk_level, get_risk_levels,
+        )
+        rng = np.random.default_rng(4)
+        n = 2000
+        frame = pd.DataFrame({
+            'Age': rng.integers(10, 90, n) + rng.random(n).round(1),
+            'Diabetes': rng.integers(0, 2, n),
+            'Hypertension': rng.integers(0, 2, n),
+            'Blurry_Vision_Score': rng.integers(0, 7, n),
+            'Eye_Pain_Frequency': rng.integers(0, 6, n),
+            'Light_Sensitivity': rng.integers(0, 6, n).astype(float),
+            'Eye_Strains_Per_Day': rng.integers(0, 6, n),
+            'Outdoor_Exposure_Hours': (rng.random(n) * 5).round(1),
+            'Glasses_Usage': rng.integers(0, 2, n),
+            'Family_History_Eye_Disease': rng.integers(0, 2, n),
+            'Screen_Time_Hours': (rng.random(n) * 14).round(1),
+            'Smoker': rng.integers(0, 2, n).astype(float),
+            'Alcohol_Use': rng.integers(0, 3, n),
+        })
+        frame.loc[::11, 'Smoker'] = np.nan  # required field missing -> no score
+        frame.loc[::7, 'Light_Sensitivity'] = np.nan  # optional field missing -> counts as 0
+
+        expected = [
+            calculate_risk_score({k: v for k, v in row.items() if not pd.isna(v)})
+            for row in frame.to_dict('records')
+        ]
+        scores = calculate_risk_scores(frame)
+        assert [None if pd.isna(s) else int(s) for s in scores] == expected
+        assert get_risk_levels(scores).tolist() == [get_risk_level(s) for s in expected]
+        assert scores.isna().sum() == len(frame.index[::11])
+
+    def test_vectorized_matches_scalar_for_text_cells(self):
+        """Test string-typed cells score like the scalar version, and unparseable rows get no score"""
+        import pandas as pd
+        from risk_score_calculator import calculate_risk_score, calculate_risk_scores
+        base = {
+            'Age': 65, 'Diabetes': 1, 'Hypertension': 0, 'Blurry_Vision_Score': 3,
+            'Eye_Pain_Frequency': 2, 'Eye_Strains_Per_Day': 4, 'Outdoor_Exposure_Hours': 1.5,
+            'Glasses_Usage': 0, 'Family_History_Eye_Disease': 1, 'Screen_Time_Hours': 7,
+            'Smoker': 0, 'Alcohol_Use': 1,
+        }
+        rows = [
+            base,
+            {**base, 'Diabetes': '1'},  # flags compare raw values: '1' != 1
+            {**base, 'Glasses_Usage': '0', 'Smoker': True},
+            {**base, 'Age': '45', 'Blurry_Vision_Score': '2', 'Screen_Time_Hours': '10.5'},
+            {**base, 'Outdoor_Exposure_Hours': ' 3 ', 'Light_Sensitivity': '4'},
+            {**base, 'Age': 71.9, 'Alcohol_Use': '0'},
+            {**base, 'Blurry_Vision_Score': '3.5'},  # int('3.5') raises
+            {**base, 'Age': 'unknown'},
+            {**base, 'Screen_Time_Hours': 'n/a'},
+        ]
+
+        def scalar(row):
+            try:
+                return calculate_risk_score(row)
+            except (TypeError, ValueError):
+                return None
+        expected = [scalar(row) for row in rows]
+        assert expected[1] == expected[0] - 3 and expected[-3:] == [None, None, None]
+
+        scores = calculate_risk_scores(pd.DataFrame(rows))
+        assert [None if pd.isna(s) else int(s) for s in scores] == expected
+
+
+class TestModelCache:
+    """Test cached model files and the legacy /api/ml/predict fallback"""
+
+    def test_reloads_when_file_changes(self, tmp_path):
+        """Test a cached model is reused until the file is replaced"""
+        import os
+        from model_cache import load_cached
+        path = tmp_path / 'model.bin'
+        path.write_text('v1')
+        loads = []
+
+        def loader(p):
+            loads.append(p)
+            return open(p).read()
+        assert load_cached(str(path), loader) == 'v1'
+        assert load_cached(str(path), loader) == 'v1'
+        assert len(loads) == 1
+
+        replacement = tmp_path / 'model.tmp'
+        replacement.write_text('v2!')
+        os.replace(replacement, path)
+        assert load_cached(str(path), loader) == 'v2!'
+        assert len(loads) == 2
+
+    def test_legacy_fallback_uses_cached_bundle_and_version(self, client, db_session, monkeypatch):
+        """Test the legacy path loads the model once and caches the latest model version"""
+        from datetime import datetime, timedelta
+        import model_cache
+        import routes.ml_routes as ml_routes
+        from database import MLMetrics
+        from utils.cache import invalidate_tags
+        monkeypatch.setattr(ml_routes, 'predict_risk_two_stage', None)
+        model_cache.clear_model_cache()
+        reads = []
+        original = model_cache._read_legacy_bundle
+        monkeypatch.setattr(model_cache, '_read_legacy_bundle', lambda p: reads.append(p) or original(p))
+        db_session.add(MLMetrics(model_version='LightGBM-v1', training_date=datetime(2026, 1, 1)))
+        db_session.commit()
+
+        payload = {'age': 50, 'gender': 'male', 'screen_time_hours': 9, 'sleep_hours': 5}
+        first = client.post('/api/ml/predict', json=payload)
+        assert first.status_code == 200
+        body = first.get_json()
+        assert body['model_version'] == 'LightGBM-v1'
+        assert body['predicted_disease'] in body['all_predictions']
+        assert body['confidence'] == max(body['all_predictions'].values())
+
+        db_session.add(MLMetrics(model_version='LightGBM-v2', training_date=datetime(2026, 1, 1) + timedelta(days=1)))
+        db_session.commit()
+        assert client.post('/api/ml/predict', json=payload).get_json()['model_version'] == 'LightGBM-v1'
+        assert len(reads) == 1
+
+        invalidate_tags('ml_metrics')
+        second = client.post('/api/ml/predict', json=payload).get_json()
+        assert second['model_version'] == 'LightGBM-v2'
+        assert second['all_predictions'] == body['all_predictions']
+
+
+class TestExplanations:
+    """Test per-prediction feature contributions"""
+
+    @pytest.fixture
+    def risk_model(self, tmp_path, monkeypatch):
+        import numpy as np
+        import pandas as pd
+        import ml_risk_predict
+        import train_risk_model
+        monkeypatch.setenv('DATASET_CACHE_DIR', str(tmp_path / 'cache'))
+        rng = np.random.default_rng(5)
+        n = 300
+        frame = pd.DataFrame({
+            'Age': rng.integers(18, 80, n),
+            'Gender': rng.choice(['Male', 'Female'], n),
+            'Screen_Time_Hours': rng.integers(1, 12, n),
+        })
+        frame['Eye_Disease_Risk'] = ((frame['Age'] > 50) | (frame['Screen_Time_Hours'] > 8)).astype(int)
+        frame.to_csv(tmp_path / 'train.csv', index=False)
+        model_path = str(tmp_path / 'model.joblib')
+        train_risk_model.train_risk_model(str(tmp_path / 'train.csv'), model_path, save_metrics_to_db=False)
+        monkeypatch.setattr(ml_risk_predict, '_MODEL_PATH', model_path)
+        return model_path
+
+    def test_contributions_sum_to_prediction(self, risk_model):
+        """Test contributions are per original feature and add up to the predicted log-odds"""
+        import math
+        from ml_risk_predict import explain_risk_batch, predict_risk_two_stage_batch
+        inputs = [{'age': 70, 'gender': 'f', 'screen_time_hours': 3},
+                  {'Age': 25, 'Gender': 'Male', 'Screen_Time_Hours': 11},
+                  {'age': 30}]
+        results = predict_risk_two_stage_batch(inputs, explain=True)
+        assert [r['explanation'] for r in results] == explain_risk_batch(inputs)
+        for result in results:
+            explanation = result['explanation']
+            assert set(explanation['contributions']) == {'Age', 'Gender', 'Screen_Time_Hours'}
+            magnitudes = [abs(v) for v in explanation['contributions'].values()]
+            assert magnitudes == sorted(magnitudes, reverse=True)
+            log_odds = explanation['base_value'] + sum(explanation['contributions'].values())
+            assert math.isclose(1 / (1 + math.exp(-log_odds)), result['risk_probability'], rel_tol=1e-9)
+
+    def test_explanations_endpoint_batches_and_caches(self, risk_model, authenticated_client,
+                                                      db_session, mobile_user, monkeypatch):
+        """Test stored assessments are explained in one batch and then served from cache"""
+        import json
+        import routes.ml_routes as ml_routes
+        from database import Assessment
+        for i, age in enumerate((70, 22)):
+            db_session.add(Assessment(assessment_id=f'ex-{i}', user_id=mobile_user.user_id, risk_level='Low',
+                                      risk_score=0.0, assessment_data=json.dumps({'Age': age, 'Gender': 'Male'})))
+        db_session.commit()
+        batches = []
+        original = ml_routes.explain_risk_batch
+        monkeypatch.setattr(ml_routes, 'explain_risk_batch', lambda rows: batches.append(len(rows)) or original(rows))
+
+        ids = ['ex-0', 'ex-1', 'missing-id']
+        first = authenticated_client.post('/api/ml/explanations', json={'assessment_ids': ids})
+        assert first.status_code == 200
+        body = first.get_json()
+        assert set(body['explanations']) == {'ex-0', 'ex-1'}
+        assert body['missing'] == ['missing-id']
+        assert body['explanations']['ex-0']['contributions']['Age'] > body['explanations']['ex-1']['contributions']['Age']
+
+        again = authenticated_client.post('/api/ml/explanations', json={'assessment_ids': ['ex-1', 'ex-0']})
+        assert again.get_json()['explanations'] == body['explanations']
+        assert batches == [2]
+
+        # Replacing the model file (even without new MLMetrics) recomputes
+        import os
+        stat = os.stat(risk_model)
+        os.utime(risk_model, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        authenticated_client.post('/api/ml/explanations', json={'assessment_ids': ['ex-0']})
+        assert batches == [2, 1]
+
+        assert authenticated_client.post('/api/ml/explanations', json={'assessment_ids': []}).status_code == 400
+
+        predicted = authenticated_client.post('/api/ml/predict?explain=true', json={'age': 70, 'gender': 'male'}).get_json()
+        assert set(predicted['explanation']['contributions']) == {'Age', 'Gender', 'Screen_Time_Hours'}
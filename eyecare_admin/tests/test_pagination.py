@@ -0,0 +1,152 @@
+"""
+Tests for pagination and count strategies
+"""
+import pytest
+
+
+class TestKeysetPagination:
+    """Test cursor (keyset) pagination mode"""
+    
+    def _add_logs(self, db_session, admin_user, count):
+        from datetime import datetime
+        from database import ActivityLog
+        # Pairs share a timestamp so the primary key has to break ties
+        for i in range(count):
+            db_session.add(ActivityLog(
+                admin_id=admin_user.id,
+                action=f'Action {i}',
+                created_at=datetime(2026, 1, 1, 12, i // 2)
+            ))
+        db_session.commit()
+    
+    def test_cursor_round_trip(self):
+        """Test cursor tokens decode back to their position"""
+        from datetime import datetime
+        from utils.pagination import decode_cursor, encode_cursor
+        when = datetime(2026, 3, 4, 5, 6, 7)
+        assert decode_cursor(encode_cursor(when, 'abc', 'prev')) == (when, 'abc', 'prev')
+    
+    def test_walks_forward_and_back(self, authenticated_client, admin_user, db_session):
+        """Test next/prev cursors visit every row exactly once, in order"""
+        self._add_logs(db_session, admin_user, 7)
+        expected = [f'Action {i}' for i in range(6, -1, -1)]
+        
+        seen, pages, cursor = [], [], ''
+        while cursor is not None:
+            data = authenticated_client.get(f'/api/logs/?per_page=3&cursor={cursor}').get_json()
+            pages.append(data)
+            seen.extend(log['action'] for log in data['logs'])
+            cursor = data['next_cursor']
+        assert seen == expected
+        assert [len(p['logs']) for p in pages] == [3, 3, 1]
+        assert pages[0]['prev_cursor'] is None
+        assert pages[0]['total'] == 7
+        
+        back = authenticated_client.get(f"/api/logs/?per_page=3&cursor={pages[2]['prev_cursor']}").get_json()
+        assert [log['action'] for log in back['logs']] == expected[3:6]
+        assert back['next_cursor'] is not None
+    
+    def test_null_sort_keys_come_last(self, authenticated_client, admin_user, db_session):
+        """Test rows with a NULL sort column are paged after the others, both ways"""
+        from database import ActivityLog
+        self._add_logs(db_session, admin_user, 4)
+        for i in range(4, 7):
+            log = ActivityLog(admin_id=admin_user.id, action=f'Action {i}')
+            db_session.add(log)
+            db_session.flush()
+            log.created_at = None
+        db_session.commit()
+        assert ActivityLog.query.filter(ActivityLog.created_at.is_(None)).count() == 3
+        expected = [f'Action {i}' for i in (3, 2, 1, 0, 6, 5, 4)]
+        
+        seen, pages, cursor = [], [], ''
+        while cursor is not None:
+            data = authenticated_client.get(f'/api/logs/?per_page=3&cursor={cursor}').get_json()
+            pages.append(data)
+            seen.extend(log['action'] for log in data['logs'])
+            cursor = data['next_cursor']
+        assert seen == expected
+        
+        back = authenticated_client.get(f"/api/logs/?per_page=3&cursor={pages[2]['prev_cursor']}").get_json()
+        assert [log['action'] for log in back['logs']] == expected[3:6]
+        back = authenticated_client.get(f"/api/logs/?per_page=3&cursor={back['prev_cursor']}").get_json()
+        assert [log['action'] for log in back['logs']] == expected[0:3]
+    
+    def test_per_page_clamped_in_both_modes(self, authenticated_client, admin_user, db_session):
+        """Test an explicit per_page above the limit is clamped with or without a cursor"""
+        from utils.pagination import MAX_PER_PAGE
+        for query in ('page=1', 'cursor='):
+            data = authenticated_client.get(f'/api/logs/?per_page=5000&{query}').get_json()
+            assert data['per_page'] == MAX_PER_PAGE
+    
+    def test_page_mode_unchanged(self, authenticated_client, admin_user, db_session):
+        """Test page numbers still work without a cursor"""
+        self._add_logs(db_session, admin_user, 5)
+        data = authenticated_client.get('/api/logs/?page=2&per_page=2').get_json()
+        assert data['page'] == 2 and data['pages'] == 3
+        assert len(data['logs']) == 2
+        assert data['next_cursor'] is None
+    
+    def test_invalid_cursor(self, authenticated_client):
+        """Test a malformed cursor is rejected"""
+        response = authenticated_client.get('/api/logs/?cursor=not-a-cursor')
+        assert response.status_code == 400
+
+
+class TestCountStrategies:
+    """Test pagination count strategies"""
+    
+    def _add_tips(self, db_session, count):
+        from database import HealthTip
+        for i in range(count):
+            db_session.add(HealthTip(title=f'Tip {i}', description='d'))
+        db_session.commit()
+    
+    def test_cached_count_reused_until_invalidated(self, app, db_session):
+        """Test cached counts are keyed by filters and survive new rows"""
+        from database import HealthTip
+        from utils.cache import invalidate_cache
+        from utils.pagination import Pagination
+        self._add_tips(db_session, 3)
+        with app.test_request_context('/?per_page=2'):
+            assert Pagination(HealthTip.query, count='cached').total == 3
+            filtered = HealthTip.query.filter(HealthTip.title == 'Tip 0')
+            assert Pagination(filtered, count='cached').total == 1
+            self._add_tips(db_session, 1)
+            assert Pagination(HealthTip.query, count='cached').total == 3
+            invalidate_cache('count:health_tips')
+            assert Pagination(HealthTip.query, count='cached').total == 4
+    
+    def test_estimate_falls_back_to_count(self, app, db_session):
+        """Test estimates are skipped for filtered queries and unsupported databases"""
+        from database import HealthTip
+        from utils.pagination import Pagination, estimate_count
+        self._add_tips(db_session, 2)
+        assert estimate_count(HealthTip.query.filter(HealthTip.title == 'x')) is None
+        assert estimate_count(HealthTip.query) is None  # SQLite has no planner stats
+        with app.test_request_context('/'):
+            pagination = Pagination(HealthTip.query, count='estimate')
+        assert pagination.total == 2
+        assert pagination.total_is_estimate is False
+    
+    def test_no_count_uses_lookahead(self, app, db_session):
+        """Test the has-more mode skips counting and peeks one row ahead"""
+        from database import HealthTip
+        from utils.pagination import Pagination
+        self._add_tips(db_session, 5)
+        query = HealthTip.query.order_by(HealthTip.tip_id)
+        with app.test_request_context('/'):
+            first = Pagination(query, page=2, per_page=2, count='none')
+            last = Pagination(query, page=3, per_page=2, count='none')
+        assert first.total is None and first.pages is None
+        assert len(first.items) == 2 and first.has_next
+        assert len(last.items) == 1 and not last.has_next
+        assert first.to_dict()['has_prev'] is True
+    
+    def test_unknown_strategy(self, app):
+        """Test an unknown strategy is rejected"""
+        from database import HealthTip
+        from utils.pagination import Pagination
+        with app.test_request_context('/'):
+            with pytest.raises(ValueError):
+                Pagination(HealthTip.query, count='guess')
@@ -1,4 +1,7 @@
 import math
+from types import SimpleNamespace
+
+import pytest
 
 
 def test_users_list(authenticated_client):
@@ -21,3 +24,199 @@ def test_users_stats_growth(authenticated_client):
     gp = data["growth_percentage"]
     assert isinstance(gp, (int, float))
     assert not math.isnan(float(gp))
+
+
+def _add_assessments(db_session, user_id, n):
+    from database import Assessment
+
+    for i in range(n):
+        db_session.add(Assessment(
+            assessment_id=f'{user_id[:-4]}a{i:03d}',
+            user_id=user_id,
+            risk_level='low',
+            risk_score=10.0,
+        ))
+    db_session.commit()
+
+
+def test_users_list_includes_assessment_counts(authenticated_client, mobile_user, db_session):
+    _add_assessments(db_session, mobile_user.user_id, 3)
+
+    resp = authenticated_client.get("/api/users/?page=1&per_page=5")
+    assert resp.status_code == 200
+    users = resp.get_json()["users"]
+    assert len(users) == 1
+    assert users[0]["id"] == mobile_user.user_id
+    assert users[0]["total_assessments"] == 3
+    assert resp.get_json()["pagination"]["total"] == 1
+
+
+def test_users_list_counts_only_page_users(app, authenticated_client, mobile_user, db_session):
+    from sqlalchemy import event
+    from database import db
+
+    _add_assessments(db_session, mobile_user.user_id, 2)
+    _add_user(db_session, 40)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        resp = authenticated_client.get("/api/users/?page=1&per_page=1")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    users = resp.get_json()["users"]
+    assert len(users) == 1
+    expected = 2 if users[0]["id"] == mobile_user.user_id else 0
+    assert users[0]["total_assessments"] == expected
+    grouped = [sql for sql in statements if 'GROUP BY' in sql and 'assessment_results' in sql]
+    assert len(grouped) == 1
+    assert ' IN (' in grouped[0]
+
+
+def test_user_to_dict_counts_without_loading_rows(mobile_user, db_session):
+    _add_assessments(db_session, mobile_user.user_id, 2)
+    assert mobile_user.to_dict()["total_assessments"] == 2
+    assert mobile_user.to_dict(total_assessments=7)["total_assessments"] == 7
+
+
+def test_users_export_csv(authenticated_client, mobile_user, db_session):
+    _add_assessments(db_session, mobile_user.user_id, 2)
+
+    resp = authenticated_client.get("/api/users/export?format=csv")
+    assert resp.status_code == 200
+    lines = resp.get_data(as_text=True).strip().splitlines()
+    assert lines[0].startswith("User ID,")
+    assert mobile_user.email in lines[1]
+    assert lines[1].split(",")[5] == "2"
+
+
+def _add_user(db_session, n, **fields):
+    from database import User
+
+    user = User(
+        user_id=f'00000000-0000-0000-0000-{n:012d}',
+        username=fields.get('username', f'user{n}'),
+        email=fields.get('email', f'user{n}@example.com'),
+        password_hash='x',
+        full_name=fields.get('full_name', f'User {n}'),
+        status='active',
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_users_search_is_case_insensitive(authenticated_client, db_session):
+    _add_user(db_session, 10, full_name='Maria Santos')
+    _add_user(db_session, 11, email='santosm@clinic.org')
+    _add_user(db_session, 12, full_name='John Doe')
+
+    resp = authenticated_client.get("/api/users/?search=SANTOS")
+    ids = sorted(u["id"][-2:] for u in resp.get_json()["users"])
+    assert ids == ["10", "11"]
+
+    _add_user(db_session, 13, username='dsantos')
+    resp = authenticated_client.get("/api/users/?search=santos")
+    assert len(resp.get_json()["users"]) == 3
+
+
+def test_users_search_matches_wildcards_literally(authenticated_client, db_session):
+    _add_user(db_session, 14, username='a_b')
+    _add_user(db_session, 15, username='axb')
+    _add_user(db_session, 16, username='100%')
+
+    resp = authenticated_client.get("/api/users/?search=a_b")
+    assert [u["id"][-2:] for u in resp.get_json()["users"]] == ["14"]
+    resp = authenticated_client.get("/api/users/?search=%25")
+    assert [u["id"][-2:] for u in resp.get_json()["users"]] == ["16"]
+
+
+def _ilike_scan(User, term):
+    return User.query.filter(
+        User.email.ilike(f'%{term}%')
+        | User.full_name.ilike(f'%{term}%')
+        | User.username.ilike(f'%{term}%')
+    ).all()
+
+
+def test_text_search_condition_matches_ilike(app, db_session):
+    from database import User
+    from utils.text_search import text_search_condition
+
+    _add_user(db_session, 20, full_name='Ana Li')
+    _add_user(db_session, 21, full_name='Ali Khan')
+    columns = [User.email, User.full_name, User.username]
+
+    for term in ('li', 'ali', 'khan', 'zzz', 'user2'):
+        indexed = User.query.filter(text_search_condition(User, columns, term)).all()
+        assert {u.user_id for u in indexed} == {u.user_id for u in _ilike_scan(User, term)}
+
+
+class _DialectSession:
+    """Session proxy reporting another dialect name; queries still run on SQLite"""
+
+    def __init__(self, session, dialect):
+        self._session = session
+        self._bind = SimpleNamespace(dialect=SimpleNamespace(name=dialect))
+
+    def get_bind(self):
+        return self._bind
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+def test_text_search_condition_postgresql_matches_ilike(app, db_session):
+    from database import User
+    from utils.text_search import text_search_condition
+
+    _add_user(db_session, 30, full_name='Ana Li')
+    _add_user(db_session, 31, full_name='Ali Khan', email='a.li@example.com')
+    columns = [User.email, User.full_name, User.username]
+    session = _DialectSession(db_session, 'postgresql')
+
+    for term in ('li', 'a.li@', 'khan', 'zzz', 'user3'):
+        indexed = User.query.filter(text_search_condition(User, columns, term, session=session)).all()
+        assert {u.user_id for u in indexed} == {u.user_id for u in _ilike_scan(User, term)}
+
+
+@pytest.mark.parametrize('term, phrase', [
+    ('santos', '"santos"'),
+    ('m.santos@clinics', '"clinics"'),
+    ('a_b', None),
+    ('x', None),
+    ('@.', None),
+])
+def test_text_search_condition_mysql_uses_fulltext(app, db_session, monkeypatch, term, phrase):
+    from database import User
+    from utils import text_search
+
+    columns = [User.email, User.full_name, User.username]
+    session = _DialectSession(db_session, 'mysql')
+    monkeypatch.setitem(text_search._fulltext_ready, ('users', ('email', 'full_name', 'username')), 2)
+
+    condition = text_search.text_search_condition(User, columns, term, session=session)
+    compiled = condition.compile()
+    if phrase is None:
+        assert 'MATCH' not in str(compiled)
+    else:
+        assert 'MATCH(email, full_name, username) AGAINST' in str(compiled)
+        assert compiled.params['fulltext_term'] == phrase
+    # the escaped substring check is always applied on top
+    assert 'LIKE' in str(compiled).upper()
+
+
+def test_text_search_condition_mysql_without_index_scans(app, db_session, monkeypatch):
+    from database import User
+    from utils import text_search
+
+    columns = [User.email, User.full_name, User.username]
+    session = _DialectSession(db_session, 'mysql')
+    monkeypatch.setitem(text_search._fulltext_ready, ('users', ('email', 'full_name', 'username')), None)
+
+    condition = text_search.text_search_condition(User, columns, 'santos', session=session)
+    assert 'MATCH' not in str(condition)
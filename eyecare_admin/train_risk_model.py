@@ -12,7 +12,7 @@ import json
 import os
 from dataclasses import asdict, dataclass
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable
 
 import joblib
 import numpy as np
@@ -32,10 +32,26 @@ from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
 
+from dataset_cache import cache_dir, dataset_hash, load_dataset
+from incremental_training import update_risk_model, write_model_state
+from training_cache import cache_key as training_cache_key
+from training_cache import fit_classifier, prepare_training_data
+
 
 DATASET_PATH_DEFAULT = os.path.join("models", "dataset", "EyeConditions_CLEAN_RISK.csv")
 MODEL_PATH_DEFAULT = os.path.join("models", "risk_model.joblib")
 
+# Everything that shapes the preprocessed training data (part of its cache key).
+PREPROCESSING_CONFIG: dict[str, Any] = {
+    "target": "Eye_Disease_Risk",
+    "categorical_columns": ["gender"],
+    "numeric_imputer": "median",
+    "categorical_imputer": "most_frequent",
+    "encoder": "onehot",
+    "test_size": 0.3,
+    "random_state": 42,
+}
+
 
 def resolve_dataset_path(dataset_path: str | None = None) -> str:
     """Resolve dataset path from common admin upload/storage locations.
@@ -100,19 +116,33 @@ class TrainResult:
     f1: float
     roc_auc: float
     confusion_matrix: list[list[int]]
+    feature_importance_json: str = "{}"
+
+
+# progress(stage, fraction) - called as training advances; may raise to abort
+ProgressCallback = Callable[[str, float], None]
+
+
+# PREPROCESSING_CONFIG["encoder"] -> categorical encoder
+_ENCODERS: dict[str, Callable[[], Any]] = {
+    "onehot": lambda: OneHotEncoder(handle_unknown="ignore", sparse_output=False),
+}
 
 
+# The preprocessing is built from PREPROCESSING_CONFIG, which is part of the
+# training-cache key. Any change here that the config does not capture must
+# bump training_cache.CACHE_VERSION, or retrains keep reusing the old cache.
 def _build_pipeline(numeric_features: list[str], categorical_features: list[str]) -> Pipeline:
     numeric_transformer = Pipeline(
         steps=[
-            ("imputer", SimpleImputer(strategy="median")),
+            ("imputer", SimpleImputer(strategy=PREPROCESSING_CONFIG["numeric_imputer"])),
         ]
     )
 
     categorical_transformer = Pipeline(
         steps=[
-            ("imputer", SimpleImputer(strategy="most_frequent")),
-            ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=False)),
+            ("imputer", SimpleImputer(strategy=PREPROCESSING_CONFIG["categorical_imputer"])),
+            ("onehot", _ENCODERS[PREPROCESSING_CONFIG["encoder"]]()),
         ]
     )
 
@@ -124,8 +154,20 @@ def _build_pipeline(numeric_features: list[str], categorical_features: list[str]
         remainder="drop",
     )
 
+    pipe = Pipeline(steps=[("preprocessor", preprocessor), ("model", _build_model())])
+
+    # Helpful for feature importance extraction.
+    try:
+        preprocessor.set_output(transform="pandas")
+    except Exception:
+        pass
+
+    return pipe
+
+
+def _build_model() -> LGBMClassifier:
     # Keep trees relatively constrained to reduce memorization.
-    model = LGBMClassifier(
+    return LGBMClassifier(
         random_state=42,
         n_estimators=300,
         learning_rate=0.05,
@@ -136,50 +178,80 @@ def _build_pipeline(numeric_features: list[str], categorical_features: list[str]
         colsample_bytree=0.8,
     )
 
-    pipe = Pipeline(steps=[("preprocessor", preprocessor), ("model", model)])
 
-    # Helpful for feature importance extraction.
-    try:
-        preprocessor.set_output(transform="pandas")
-    except Exception:
-        pass
+def _fit_progress_callback(progress: ProgressCallback, start: float, end: float):
+    """LightGBM callback mapping boosting iterations onto [start, end] of the job."""
 
-    return pipe
+    def callback(env) -> None:
+        total = max(env.end_iteration - env.begin_iteration, 1)
+        done = env.iteration - env.begin_iteration + 1
+        progress("fitting", start + (end - start) * done / total)
+
+    return callback
 
 
 def train_risk_model(
     dataset_path: str = DATASET_PATH_DEFAULT,
     model_path: str = MODEL_PATH_DEFAULT,
     save_metrics_to_db: bool = True,
+    progress: ProgressCallback | None = None,
 ) -> TrainResult:
-    dataset_path = resolve_dataset_path(dataset_path)
-
-    df = pd.read_csv(dataset_path)
-
-    if "Eye_Disease_Risk" not in df.columns:
-        raise ValueError("Expected target column 'Eye_Disease_Risk' not found in dataset")
-
-    y = df["Eye_Disease_Risk"].astype(int)
-    X = df.drop(columns=["Eye_Disease_Risk"]).copy()
-
-    # Treat Gender as categorical; everything else numeric.
-    categorical_features = [c for c in X.columns if c.lower() == "gender"]
-    numeric_features = [c for c in X.columns if c not in categorical_features]
-
-    pipe = _build_pipeline(numeric_features=numeric_features, categorical_features=categorical_features)
+    """Train and save the Stage-1 pipeline.
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X,
-        y,
-        test_size=0.3,
-        random_state=42,
-        stratify=y,
-    )
-
-    pipe.fit(X_train, y_train)
+    `progress`, when given, is called with (stage, fraction) for the stages
+    loading, preprocessing (skipped when the dataset's preprocessed form is
+    cached), fitting (per boosting iteration), evaluating and saving; an
+    exception raised from it aborts training before the model is replaced.
+    """
+    report = progress or (lambda stage, fraction: None)
+    dataset_path = resolve_dataset_path(dataset_path)
 
-    y_pred = pipe.predict(X_test)
-    y_proba = pipe.predict_proba(X_test)[:, 1]
+    report("loading", 0.0)
+    key = training_cache_key(dataset_hash(dataset_path), PREPROCESSING_CONFIG)
+
+    def build():
+        df = load_dataset(dataset_path)
+
+        target = PREPROCESSING_CONFIG["target"]
+        if target not in df.columns:
+            raise ValueError(f"Expected target column '{target}' not found in dataset")
+
+        y = df[target].astype(int)
+        X = df.drop(columns=[target]).copy()
+
+        # Configured columns (Gender) are categorical; everything else numeric.
+        categorical = {c.lower() for c in PREPROCESSING_CONFIG["categorical_columns"]}
+        categorical_features = [c for c in X.columns if c.lower() in categorical]
+        numeric_features = [c for c in X.columns if c not in categorical_features]
+        preprocessor = _build_pipeline(
+            numeric_features=numeric_features, categorical_features=categorical_features
+        ).named_steps["preprocessor"]
+
+        X_train, X_test, y_train, y_test = train_test_split(
+            X,
+            y,
+            test_size=PREPROCESSING_CONFIG["test_size"],
+            random_state=PREPROCESSING_CONFIG["random_state"],
+            stratify=y,
+        )
+        report("preprocessing", 0.05)
+        X_train = preprocessor.fit_transform(X_train)
+        X_test = preprocessor.transform(X_test)
+        extra_meta = {"n_rows": int(len(df)), "n_features_raw": int(X.shape[1])}
+        return preprocessor, X_train, y_train, X_test, y_test, extra_meta
+
+    # Split, imputation, one-hot and LightGBM binning are reused across
+    # retrains of the same file; only boosting runs every time.
+    prepared = prepare_training_data(os.path.join(cache_dir(), "prep"), key, build)
+    callbacks = [_fit_progress_callback(progress, 0.1, 0.85)] if progress is not None else None
+    report("fitting", 0.1)
+    model = fit_classifier(_build_model(), prepared, callbacks=callbacks)
+    pipe = Pipeline(steps=[("preprocessor", prepared.preprocessor), ("model", model)])
+
+    report("evaluating", 0.85)
+    y_test = prepared.y_test
+    y_pred = model.predict(prepared.X_test)
+    y_proba = model.predict_proba(prepared.X_test)[:, 1]
 
     acc = float(accuracy_score(y_test, y_pred))
     prec = float(precision_score(y_test, y_pred, zero_division=0))
@@ -192,20 +264,27 @@ def train_risk_model(
 
     cm = confusion_matrix(y_test, y_pred).tolist()
 
-    os.makedirs(os.path.dirname(model_path), exist_ok=True)
-    joblib.dump(pipe, model_path)
+    report("saving", 0.95)
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+    # Write then rename: predictors never load a half-written model
+    tmp_path = f"{model_path}.tmp"
+    joblib.dump(pipe, tmp_path)
+    os.replace(tmp_path, model_path)
+    # Fresh model: incremental updates restart from the first assessment
+    write_model_state(model_path, {"watermark": None, "holdout_key": key, "trained_at": datetime.utcnow().isoformat()})
 
     result = TrainResult(
         model_path=model_path,
         dataset_path=dataset_path,
-        n_rows=int(len(df)),
-        n_features_raw=int(X.shape[1]),
+        n_rows=prepared.meta["n_rows"],
+        n_features_raw=prepared.meta["n_features_raw"],
         accuracy=acc,
         precision=prec,
         recall=rec,
         f1=f1,
         roc_auc=auc,
         confusion_matrix=cm,
+        feature_importance_json=_extract_feature_importance_json(pipe),
     )
 
     if save_metrics_to_db:
@@ -214,27 +293,28 @@ def train_risk_model(
     return result
 
 
-def _save_metrics_to_db(*, result: TrainResult, pipeline: Pipeline) -> None:
+def metrics_values(result: TrainResult) -> dict[str, Any]:
+    """Column values of the MLMetrics row recording a training run."""
+    return {
+        "model_version": f"RiskModel-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
+        "accuracy": result.accuracy,
+        "precision": result.precision,
+        "recall": result.recall,
+        "f1_score": result.f1,
+        "confusion_matrix": json.dumps(result.confusion_matrix),
+        "feature_importance": result.feature_importance_json,
+        "dataset_size": result.n_rows,
+    }
+
+
+def _save_metrics_to_db(*, result: TrainResult, pipeline: Pipeline | None) -> None:
     # Avoid requiring DB for local training runs.
     try:
         from app import app
         from database import db, MLMetrics
 
         with app.app_context():
-            model_version = f"RiskModel-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-
-            feature_importance_json = _extract_feature_importance_json(pipeline)
-
-            metrics = MLMetrics(
-                model_version=model_version,
-                accuracy=result.accuracy,
-                precision=result.precision,
-                recall=result.recall,
-                f1_score=result.f1,
-                confusion_matrix=json.dumps(result.confusion_matrix),
-                feature_importance=feature_importance_json,
-                dataset_size=result.n_rows,
-            )
+            metrics = MLMetrics(**metrics_values(result))
 
             db.session.add(metrics)
             db.session.commit()
@@ -268,7 +348,39 @@ def _extract_feature_importance_json(pipeline: Pipeline) -> str:
         return json.dumps({})
 
 
+def update_main(mode: str) -> None:
+    """Incrementally update the saved model from new labeled assessments."""
+    from app import app
+    from database import db
+
+    with app.app_context():
+        res = update_risk_model(db.engine, MODEL_PATH_DEFAULT, mode=mode)
+    print(f"Incremental update ({mode}): {res.reason}")
+    print(f"  - new labeled rows: {res.n_rows} (train {res.n_train}, holdout {res.n_holdout})")
+    if res.candidate_logloss is not None:
+        print(f"  - holdout log loss: current {res.current_logloss:.4f}, candidate {res.candidate_logloss:.4f}")
+    if res.promoted:
+        _save_metrics_to_db(result=res, pipeline=None)
+        print(f"  - saved: {res.model_path} (watermark {res.watermark})")
+
+
 def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the Stage-1 risk model.")
+    parser.add_argument(
+        "--incremental",
+        nargs="?",
+        const="continue",
+        choices=["continue", "refit"],
+        help="update the saved model from assessments since the last update "
+        "(continue boosting, or refit leaf values) instead of retraining from the CSV",
+    )
+    args = parser.parse_args()
+    if args.incremental:
+        update_main(args.incremental)
+        return
+
     print("=" * 70)
     print("Admin Risk Model Training (Stage 1: Eye_Disease_Risk)")
     print("=" * 70)
@@ -1,98 +1,246 @@
 """
 Caching utilities for performance optimization
+
+Entries can be registered under tags (every @cached entry is tagged with its
+key_prefix, plus any extra tags such as ``assessments:user:<id>``).
+Invalidating a tag deletes exactly the keys registered under it - no scan
+over the whole keyspace - and is broadcast to the other workers through the
+invalidation bus (utils/cache_bus) when one is configured.
+
+@cached views also coalesce concurrent misses (single-flight: one request
+computes, the others wait for its result) and refresh ahead: once an entry is
+past CACHE_REFRESH_AHEAD of its TTL, hits keep serving it while a background
+thread recomputes it by replaying the request.
+
+Each decorator records hits, misses, errors, fill time and value size per
+key_prefix in utils/cache_metrics (reported by get_cache_stats()).
 """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from flask import request
+from flask import current_app, g, request, session
 import hashlib
+import heapq
 import json
-from datetime import datetime, timedelta, timezone
 import logging
+import os
+import sys
+import threading
+import time
+from utils.cache_bus import create_invalidation_bus
+from utils.cache_metrics import cache_metrics
 
 logger = logging.getLogger(__name__)
 
+# Fraction of the TTL after which a hit triggers a background refresh (>= 1 disables)
+REFRESH_AHEAD_FRACTION = float(os.getenv('CACHE_REFRESH_AHEAD', 0.8))
+# How long a coalesced request waits for the in-flight computation
+SINGLE_FLIGHT_WAIT = float(os.getenv('CACHE_SINGLE_FLIGHT_WAIT', 30))
+REFRESH_WORKERS = int(os.getenv('CACHE_REFRESH_WORKERS', 2))
+
+
+def _estimate_size(value, _depth=0):
+    """Rough deep size of a cached value in bytes"""
+    size = sys.getsizeof(value, 64)
+    if _depth >= 3 or isinstance(value, (str, bytes, bytearray)):
+        return size
+    if isinstance(value, dict):
+        return size + sum(_estimate_size(k, _depth + 1) + _estimate_size(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(_estimate_size(v, _depth + 1) for v in value)
+    if hasattr(value, 'calculate_content_length'):
+        # Flask/werkzeug Response (cached views return jsonify(...) tuples)
+        return size + (value.calculate_content_length() or 0)
+    return size
+
 
 class SimpleCache:
-    """Simple in-memory cache implementation with TTL and pattern-based invalidation"""
+    """
+    Bounded in-memory LRU cache with TTL
     
-    def __init__(self):
-        self._cache = {}
-        self._timestamps = {}
-        self._access_count = {}  # Track cache hits for monitoring
+    - Bounded by entry count and by an approximate byte budget; the least
+      recently used entries are evicted first.
+    - TTLs use the monotonic clock (immune to wall-clock jumps).
+    - get/set/delete are O(1) under a single lock, so the cache is safe for
+      gthread workers (and gevent, whose monkeypatching makes the lock
+      cooperative).
+    - Expired entries are swept every `sweep_interval` seconds from set(),
+      not only when they happen to be read again.
+    - Hit/miss/eviction counters are maintained incrementally.
+    - Entries may carry tags; delete_tag() drops a tag's keys via a
+      tag -> keys index.
+    """
+    
+    def __init__(self, max_entries=None, max_bytes=None, sweep_interval=None):
+        self.max_entries = max_entries or int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+        self.max_bytes = max_bytes or int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.sweep_interval = sweep_interval or int(os.getenv('CACHE_SWEEP_INTERVAL', 60))
+        # key -> [value, expires_at (monotonic, or None), size, hits, tags]
+        self._cache = OrderedDict()
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._last_sweep = time.monotonic()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
     
     def get(self, key):
         """Get value from cache"""
-        if key in self._cache:
-            # Check if expired
-            if key in self._timestamps:
-                if datetime.now(timezone.utc) > self._timestamps[key]:
-                    self.delete(key)
-                    return None
-            # Track access
-            self._access_count[key] = self._access_count.get(key, 0) + 1
-            return self._cache[key]
-        return None
-    
-    def set(self, key, value, timeout=300):
+        return self.get_with_ttl(key)[0]
+    
+    def get_with_ttl(self, key):
+        """
+        Get value and its remaining lifetime
+        
+        Returns:
+            (value, seconds_left) - seconds_left is None for entries without
+            expiry; (None, None) on a miss
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, None
+            now = time.monotonic()
+            if entry[1] is not None and now >= entry[1]:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None, None
+            self._cache.move_to_end(key)
+            entry[3] += 1
+            self._stats['hits'] += 1
+            return entry[0], (entry[1] - now if entry[1] is not None else None)
+    
+    def set(self, key, value, timeout=300, tags=()):
         """
         Set value in cache
         
         Args:
             key: Cache key
             value: Value to cache
-            timeout: Timeout in seconds (default 5 minutes)
+            timeout: Timeout in seconds (default 5 minutes, 0/None = no expiry)
+            tags: Tags the entry is registered under for invalidation
+        
+        Returns:
+            Estimated size of the entry in bytes, or None if it was too
+            large to cache (any previous value for the key is dropped)
         """
-        self._cache[key] = value
-        if timeout:
-            self._timestamps[key] = datetime.now(timezone.utc) + timedelta(seconds=timeout)
-        self._access_count[key] = 0
+        size = _estimate_size(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            logger.debug(f"Cache SKIP: {key} ({size} bytes exceeds budget)")
+            with self._lock:
+                if key in self._cache:
+                    self._remove(key)
+            return None
+        
+        now = time.monotonic()
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+            tags = tuple(tags)
+            self._cache[key] = [value, now + timeout if timeout else None, size, 0, tags]
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._bytes += size
+            self._stats['sets'] += 1
+            
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._cache))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
         logger.debug(f"Cache SET: {key} (timeout={timeout}s)")
+        return size
+    
+    def _remove(self, key):
+        """Remove an entry (caller holds the lock)"""
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            for tag in entry[4]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+        return entry
+    
+    def _sweep(self, now):
+        """Drop all expired entries (caller holds the lock)"""
+        expired = [key for key, entry in self._cache.items() if entry[1] is not None and now >= entry[1]]
+        for key in expired:
+            self._remove(key)
+        self._stats['expirations'] += len(expired)
+        self._last_sweep = now
+        return len(expired)
     
     def delete(self, key):
         """Delete value from cache"""
-        if key in self._cache:
-            del self._cache[key]
-        if key in self._timestamps:
-            del self._timestamps[key]
-        if key in self._access_count:
-            del self._access_count[key]
+        with self._lock:
+            self._remove(key)
         logger.debug(f"Cache DELETE: {key}")
     
+    def delete_prefix(self, prefix):
+        """Delete all entries whose key starts with prefix"""
+        with self._lock:
+            keys = [k for k in self._cache if k.startswith(prefix)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+    
+    def delete_tag(self, *tags):
+        """Delete every entry registered under any of the tags"""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if self._remove(key) is not None:
+                        removed += 1
+        return removed
+    
+    def keys(self):
+        """Snapshot of current keys (LRU order, oldest first)"""
+        with self._lock:
+            return list(self._cache)
+    
     def clear(self):
         """Clear entire cache"""
-        count = len(self._cache)
-        self._cache.clear()
-        self._timestamps.clear()
-        self._access_count.clear()
+        with self._lock:
+            count = len(self._cache)
+            self._cache.clear()
+            self._tags.clear()
+            self._bytes = 0
         logger.info(f"Cache CLEAR: removed {count} entries")
     
     def clear_expired(self):
         """Clear all expired entries"""
-        now = datetime.now(timezone.utc)
-        expired_keys = [
-            key for key, timestamp in self._timestamps.items()
-            if now > timestamp
-        ]
-        for key in expired_keys:
-            self.delete(key)
-        if expired_keys:
-            logger.info(f"Cache cleanup: removed {len(expired_keys)} expired entries")
-        return len(expired_keys)
+        with self._lock:
+            removed = self._sweep(time.monotonic())
+        if removed:
+            logger.info(f"Cache cleanup: removed {removed} expired entries")
+        return removed
     
     def get_stats(self):
         """Get cache statistics"""
-        total_entries = len(self._cache)
-        total_hits = sum(self._access_count.values())
-        hot_keys = sorted(
-            self._access_count.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:10]
+        with self._lock:
+            stats = dict(self._stats)
+            total_entries = len(self._cache)
+            total_tags = len(self._tags)
+            total_bytes = self._bytes
+            hot_keys = heapq.nlargest(10, ((entry[3], key) for key, entry in self._cache.items()))
         
+        lookups = stats['hits'] + stats['misses']
         return {
             'total_entries': total_entries,
-            'total_hits': total_hits,
-            'hot_keys': [{'key': k, 'hits': v} for k, v in hot_keys],
-            'memory_estimate_kb': total_entries * 1  # Rough estimate
+            'total_hits': stats['hits'],
+            'hot_keys': [{'key': k, 'hits': v} for v, k in hot_keys],
+            'memory_estimate_kb': round(total_bytes / 1024, 1),
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'total_tags': total_tags,
+            'hit_rate': round(stats['hits'] / lookups * 100, 1) if lookups else 0.0,
+            **stats
         }
 
 
@@ -113,56 +261,225 @@ def cache_key(*args, **kwargs):
     return hashlib.md5(key_string.encode()).hexdigest()
 
 
-def cached(timeout=300, key_prefix='view'):
+def resolve_tags(key_prefix, tags, args, kwargs):
+    """Tags for a cached call: the key_prefix plus static or computed extra tags"""
+    if callable(tags):
+        tags = tags(*args, **kwargs)
+    return [key_prefix, *(tags or ())]
+
+
+# key -> Event set when the in-flight computation for that key finishes
+_inflight = {}
+_inflight_lock = threading.Lock()
+_refresh_executor = None
+
+
+def _claim(key):
+    """Claim the computation of key; returns (is_leader, event)"""
+    with _inflight_lock:
+        event = _inflight.get(key)
+        if event is not None:
+            return False, event
+        event = _inflight[key] = threading.Event()
+        return True, event
+
+
+def _release(key, event):
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    event.set()
+
+
+def _is_cacheable(result):
+    """Only successful view results are cached (not 401s or 500s)"""
+    status = 200
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        status = result[1]
+    elif hasattr(result, 'status_code'):
+        status = result.status_code
+    return 200 <= status < 300
+
+
+def _compute_and_store(f, args, kwargs, key, timeout, tags, namespace):
+    start = time.perf_counter()
+    try:
+        result = f(*args, **kwargs)
+    except Exception:
+        cache_metrics.error(namespace)
+        raise
+    if _is_cacheable(result):
+        size = cache.set(key, result, timeout, tags=tags)
+        cache_metrics.fill(namespace, time.perf_counter() - start, size)
+    else:
+        cache_metrics.incr(namespace, 'uncacheable')
+    return result
+
+
+def _get_refresh_executor():
+    global _refresh_executor
+    if _refresh_executor is None:
+        _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+    return _refresh_executor
+
+
+def _refresh_in_background(f, args, kwargs, key, timeout, tags, namespace, event):
+    """Recompute an entry off the request path by replaying the current request"""
+    app = current_app._get_current_object()
+    path, method = request.path, request.method
+    query_string = request.query_string.decode('utf-8')
+    saved_session = dict(session)
+    
+    def run():
+        try:
+            with app.test_request_context(path, method=method, query_string=query_string):
+                session.update(saved_session)
+                _compute_and_store(f, args, kwargs, key, timeout, tags, namespace)
+        except Exception as e:
+            logger.warning(f"Cache refresh failed for {key}: {e}")
+        finally:
+            _release(key, event)
+    
+    _get_refresh_executor().submit(run)
+
+
+def cached(timeout=300, key_prefix='view', tags=None, refresh_ahead=None):
     """
     Decorator to cache function results
     
     Args:
         timeout: Cache timeout in seconds (default 5 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key (also registered as a tag)
+        tags: Extra tags - a list, or a callable taking the function's
+            arguments, e.g. ``lambda user_id: [f'assessments:user:{user_id}']``
+        refresh_ahead: Fraction of the timeout after which hits trigger a
+            background refresh (default CACHE_REFRESH_AHEAD, >= 1 disables)
     """
+    fraction = REFRESH_AHEAD_FRACTION if refresh_ahead is None else refresh_ahead
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Generate cache key
             key = f"{key_prefix}:{cache_key(*args, **kwargs)}"
+            entry_tags = resolve_tags(key_prefix, tags, args, kwargs)
             
             # Try to get from cache
-            cached_value = cache.get(key)
+            cached_value, seconds_left = cache.get_with_ttl(key)
             if cached_value is not None:
-                return cached_value
+                stale = (
+                    fraction < 1 and timeout and seconds_left is not None
+                    and seconds_left < timeout * (1 - fraction)
+                )
+                if not stale:
+                    cache_metrics.hit(key_prefix)
+                    return cached_value
+                if not g.get('cache_warming'):
+                    # Serve the cached value; refresh it unless already in flight
+                    cache_metrics.hit(key_prefix, stale=True)
+                    leader, event = _claim(key)
+                    if leader:
+                        _refresh_in_background(f, args, kwargs, key, timeout, entry_tags, key_prefix, event)
+                    return cached_value
             
-            # Call function and cache result
-            result = f(*args, **kwargs)
-            cache.set(key, result, timeout)
-            return result
+            # Miss (or warmer refresh): only one caller computes
+            cache_metrics.miss(key_prefix)
+            leader, event = _claim(key)
+            if not leader:
+                event.wait(SINGLE_FLIGHT_WAIT)
+                cached_value = cache.get(key)
+                if cached_value is not None:
+                    return cached_value
+                # The leader failed or produced an uncacheable result
+                return f(*args, **kwargs)
+            try:
+                return _compute_and_store(f, args, kwargs, key, timeout, entry_tags, key_prefix)
+            finally:
+                _release(key, event)
         
         return decorated_function
     return decorator
 
 
+# Cross-worker invalidation bus for this process (see start_invalidation_bus)
+_bus = None
+_bus_pid = None
+_bus_lock = threading.Lock()
+
+
+def _apply_remote_invalidation(message):
+    """Apply an invalidation broadcast by another worker to the local cache"""
+    if message.get('clear'):
+        cache.clear()
+    elif message.get('prefix'):
+        cache.delete_prefix(message['prefix'])
+    else:
+        cache.delete_tag(*message.get('tags', ()))
+
+
+def start_invalidation_bus(bus=None):
+    """
+    Subscribe this process to the invalidation bus (idempotent per process)
+    
+    Args:
+        bus: Bus to use (default: the one configured by CACHE_BUS)
+    """
+    global _bus, _bus_pid
+    pid = os.getpid()
+    if _bus_pid == pid:
+        return _bus
+    with _bus_lock:
+        if _bus_pid != pid:
+            if bus is None:
+                bus = create_invalidation_bus()
+            if bus is not None:
+                bus.start(_apply_remote_invalidation)
+            _bus, _bus_pid = bus, pid
+    return _bus
+
+
+def _broadcast(message):
+    if _bus is not None and _bus_pid == os.getpid():
+        _bus.publish(message)
+
+
+def invalidate_tags(*tags):
+    """Invalidate every entry registered under any of the tags, in all workers"""
+    removed = cache.delete_tag(*tags)
+    _broadcast({'tags': list(tags)})
+    logger.info(f"Cache invalidation: removed {removed} entries tagged {', '.join(tags)}")
+    return removed
+
+
+def invalidate_prefix(prefix):
+    """Invalidate every entry whose key starts with prefix, in all workers"""
+    removed = cache.delete_prefix(prefix)
+    _broadcast({'prefix': prefix})
+    logger.info(f"Cache invalidation: removed {removed} entries with key prefix {prefix}")
+    return removed
+
+
 def invalidate_cache(key_prefix=None):
     """
     Invalidate cache entries
     
     Args:
-        key_prefix: Prefix to match (None = clear all)
+        key_prefix: Tag to invalidate - every @cached entry is tagged with
+            its key_prefix (None = clear all)
     
     Examples:
-        invalidate_cache('user_stats')  # Clear all user_stats:* keys
+        invalidate_cache('user_stats')  # Clear all @cached(key_prefix='user_stats') entries
+        invalidate_cache('assessments:user:123')  # Clear entries with that extra tag
         invalidate_cache()  # Clear entire cache
     """
     if key_prefix is None:
         cache.clear()
+        _broadcast({'clear': True})
     else:
-        # Clear entries matching prefix
-        keys_to_delete = [k for k in cache._cache.keys() if k.startswith(key_prefix)]
-        for key in keys_to_delete:
-            cache.delete(key)
-        logger.info(f"Cache invalidation: removed {len(keys_to_delete)} entries matching '{key_prefix}*'")
-        return len(keys_to_delete)
+        return invalidate_tags(key_prefix)
 
 
 def get_cache_stats():
-    """Get cache statistics for monitoring"""
-    return cache.get_stats()
+    """Get cache statistics for monitoring (backend totals plus per-namespace metrics)"""
+    stats = cache.get_stats()
+    stats['namespaces'] = cache_metrics.snapshot()
+    return stats
@@ -0,0 +1,184 @@
+"""
+Cross-worker cache invalidation bus
+
+Each Gunicorn worker has its own in-process cache (utils/cache). When one
+worker invalidates a tag, the bus broadcasts it so every other worker drops
+its copy too. Two transports:
+
+- RedisInvalidationBus: Redis pub/sub, works across hosts.
+- UnixSocketInvalidationBus: UNIX datagram sockets in a shared directory, a
+  stand-in for single-host deployments without Redis.
+
+Selected with CACHE_BUS = 'redis' | 'unix' | 'none' (default: 'redis' when
+REDIS_HOST is set, otherwise 'none').
+
+Messages are JSON: {"o": <origin>, "tags": [...]} or {"o": <origin>,
+"clear": true}. A worker ignores its own messages - it has already applied
+them locally.
+"""
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'eyecare_admin:cache_invalidate'
+MAX_DATAGRAM = 64 * 1024
+
+
+class InvalidationBus:
+    """Base class: subclasses implement start(), publish_raw() and close()"""
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handler = None
+
+    def publish(self, message):
+        """Broadcast an invalidation message to the other workers"""
+        payload = json.dumps({'o': self.origin, **message})
+        try:
+            self.publish_raw(payload)
+        except Exception as e:
+            # A lost broadcast only means other workers serve stale data until the TTL
+            logger.warning(f"Cache bus publish failed: {e}")
+
+    def _dispatch(self, raw):
+        try:
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8')
+            message = json.loads(raw)
+        except (ValueError, UnicodeDecodeError):
+            logger.warning("Cache bus: dropped malformed message")
+            return
+        if message.get('o') == self.origin or self._handler is None:
+            return
+        try:
+            self._handler(message)
+        except Exception as e:
+            logger.error(f"Cache bus handler error: {e}", exc_info=True)
+
+    def start(self, handler):
+        raise NotImplementedError
+
+    def publish_raw(self, payload):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RedisInvalidationBus(InvalidationBus):
+    """Redis pub/sub transport"""
+
+    def __init__(self, client, channel=DEFAULT_CHANNEL):
+        super().__init__()
+        self.client = client
+        self.channel = channel
+        self._pubsub = None
+        self._thread = None
+
+    def start(self, handler):
+        self._handler = handler
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: lambda message: self._dispatch(message['data'])})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        logger.info(f"Cache bus subscribed to Redis channel '{self.channel}'")
+
+    def publish_raw(self, payload):
+        self.client.publish(self.channel, payload)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+
+
+class UnixSocketInvalidationBus(InvalidationBus):
+    """
+    UNIX datagram transport for a single host
+
+    Every worker binds its own socket in `directory`; publishing sends one
+    datagram to each peer socket found there. Sockets of dead workers are
+    removed when a send to them is refused.
+    """
+
+    def __init__(self, directory=None):
+        super().__init__()
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eyecare_admin_cache_bus')
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._sock = None
+        self._thread = None
+        self._closed = threading.Event()
+
+    def start(self, handler):
+        self._handler = handler
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._thread = threading.Thread(target=self._listen, name='cache-bus', daemon=True)
+        self._thread.start()
+        logger.info(f"Cache bus listening on {self.path}")
+
+    def _listen(self):
+        while not self._closed.is_set():
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except OSError:
+                break
+            self._dispatch(data)
+
+    def publish_raw(self, payload):
+        data = payload.encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            for name in os.listdir(self.directory):
+                peer = os.path.join(self.directory, name)
+                if not name.endswith('.sock') or peer == self.path:
+                    continue
+                try:
+                    sender.sendto(data, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker is gone; clean up its socket file
+                    try:
+                        os.remove(peer)
+                    except OSError:
+                        pass
+
+    def close(self):
+        self._closed.set()
+        if self._sock is not None:
+            self._sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def create_invalidation_bus():
+    """Build the bus configured by CACHE_BUS (or None when disabled/unavailable)"""
+    kind = os.getenv('CACHE_BUS', 'redis' if os.getenv('REDIS_HOST') else 'none').lower()
+    if kind == 'redis':
+        try:
+            import redis
+            client = redis.Redis(
+                host=os.getenv('REDIS_HOST', 'localhost'),
+                port=int(os.getenv('REDIS_PORT', 6379)),
+                db=int(os.getenv('REDIS_DB', 0)),
+                password=os.getenv('REDIS_PASSWORD', None),
+                socket_connect_timeout=2,
+            )
+            client.ping()
+            return RedisInvalidationBus(client, os.getenv('CACHE_BUS_CHANNEL', DEFAULT_CHANNEL))
+        except Exception as e:
+            logger.warning(f"Cache bus disabled: Redis unavailable ({e})")
+            return None
+    if kind == 'unix':
+        if not hasattr(socket, 'AF_UNIX'):
+            logger.warning("Cache bus disabled: UNIX sockets are not available on this platform")
+            return None
+        return UnixSocketInvalidationBus(os.getenv('CACHE_BUS_SOCKET_DIR'))
+    return None
@@ -0,0 +1,105 @@
+"""
+Binary serialization for Redis cache values
+
+Values are stored as bytes with a 3-byte header - a NUL marker, the codec id
+and the compression flag - followed by the payload:
+
+    b'\\x00' + b'o' (orjson) | b'm' (msgpack) | b'j' (json) + b'z' (zlib) | b'-'
+
+Payloads of COMPRESS_THRESHOLD bytes or more are zlib-compressed. Values
+written before the header existed are plain JSON text, which never starts
+with NUL, so they are still read back correctly.
+
+The codec is chosen with CACHE_SERIALIZER = 'orjson' | 'msgpack' | 'json'
+(default: the fastest one installed).
+"""
+import json
+import os
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b'\x00'
+COMPRESSED = b'z'
+UNCOMPRESSED = b'-'
+COMPRESS_THRESHOLD = 4096  # bytes
+COMPRESS_LEVEL = 1  # favour speed; cache values are short-lived
+
+
+def _orjson_dumps(value):
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, default=str, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _json_dumps(value):
+    return json.dumps(value, default=str, separators=(',', ':')).encode('utf-8')
+
+
+# codec name -> (id byte, dumps, loads, available)
+CODECS = {
+    'orjson': (b'o', _orjson_dumps, lambda data: orjson.loads(data), orjson is not None),
+    'msgpack': (b'm', _msgpack_dumps, _msgpack_loads, msgpack is not None),
+    'json': (b'j', _json_dumps, json.loads, True),
+}
+_CODECS_BY_ID = {codec_id: loads for codec_id, _, loads, _ in CODECS.values()}
+
+
+def default_codec():
+    """Codec from CACHE_SERIALIZER, else the fastest installed one"""
+    name = os.getenv('CACHE_SERIALIZER', '').lower()
+    if name in CODECS and CODECS[name][3]:
+        return name
+    return next(name for name in ('orjson', 'msgpack', 'json') if CODECS[name][3])
+
+
+class CacheSerializer:
+    """Encode/decode cache values to header-tagged bytes"""
+
+    def __init__(self, codec=None, compress_threshold=COMPRESS_THRESHOLD, compress_level=COMPRESS_LEVEL):
+        codec = codec or default_codec()
+        if codec not in CODECS:
+            raise ValueError(f"Unknown cache serializer: {codec}")
+        if not CODECS[codec][3]:
+            raise ValueError(f"Cache serializer '{codec}' is not installed")
+        self.codec = codec
+        self._id, self._dumps, _, _ = CODECS[codec]
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def dumps(self, value):
+        payload = self._dumps(value)
+        if self.compress_threshold is not None and len(payload) >= self.compress_threshold:
+            return MAGIC + self._id + COMPRESSED + zlib.compress(payload, self.compress_level)
+        return MAGIC + self._id + UNCOMPRESSED + payload
+
+    def loads(self, data):
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if not data.startswith(MAGIC):
+            # Written before the binary format: plain JSON text
+            return json.loads(data)
+        codec_id, flag, payload = data[1:2], data[2:3], data[3:]
+        if flag == COMPRESSED:
+            payload = zlib.decompress(payload)
+        try:
+            loads = _CODECS_BY_ID[codec_id]
+        except KeyError:
+            raise ValueError(f"Unknown cache codec id: {codec_id!r}")
+        return loads(payload)
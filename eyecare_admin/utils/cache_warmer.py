@@ -0,0 +1,140 @@
+"""
+Dashboard cache pre-warming
+
+A background thread periodically replays the dashboard aggregate requests for
+the standard date ranges, so the first admin after an expiry never pays for
+the recomputation. Requests run through the real @cached views (same cache
+keys as browser requests); entries that are still fresh are left alone and
+entries past their refresh-ahead point are recomputed synchronously.
+
+The view cache is per process, so every worker runs its own warmer - but a
+pass only replays the requests that real admins made to that worker since
+the previous pass (see `note_request`). Idle workers do no work, and an
+entry nobody looks at stops being refreshed after one interval.
+
+Interval: CACHE_WARM_INTERVAL seconds (0 disables).
+"""
+import logging
+import os
+import threading
+
+from flask import g, request, session
+
+logger = logging.getLogger(__name__)
+
+WARM_RANGES = (7, 30, 90, 365)
+
+# (path, takes a `days` range)
+WARM_ENDPOINTS = (
+    ('/api/users/stats', True),
+    ('/api/assessments/stats', True),
+    ('/api/assessments/trends/risk-level', True),
+    ('/api/reports/user-growth', True),
+    ('/api/reports/assessment-trends', True),
+    ('/api/reports/dashboard-stats', False),
+)
+
+DEFAULT_INTERVAL = 240  # seconds; below the 5 minute TTL of the stats views
+
+_warmer_pid = None
+_warmer_lock = threading.Lock()
+# (path, query string) requested since the last pass in this process
+_demanded = set()
+
+
+def _warm_requests():
+    for path, ranged in WARM_ENDPOINTS:
+        if ranged:
+            for days in WARM_RANGES:
+                yield path, f'days={days}'
+        else:
+            yield path, ''
+
+
+_WARMABLE = frozenset(_warm_requests())
+
+
+def note_request():
+    """Remember the current request for the next pass if it is a warmable view"""
+    if getattr(g, 'cache_warming', False):
+        return
+    key = (request.path, request.query_string.decode('utf-8', 'replace'))
+    if key in _WARMABLE:
+        with _warmer_lock:
+            _demanded.add(key)
+
+
+def _take_demanded():
+    with _warmer_lock:
+        demanded = sorted(_demanded)
+        _demanded.clear()
+    return demanded
+
+
+def _warming_admin():
+    """Session identity the warm requests run as (views check admin roles)"""
+    from database import Admin
+    return Admin.query.filter_by(role='super_admin', status='active').order_by(Admin.id).first()
+
+
+def warm_cache(app, requests=None):
+    """
+    Run one warming pass
+
+    Args:
+        app: Flask application
+        requests: (path, query string) pairs to replay (default: all of them)
+
+    Returns:
+        Number of requests that completed successfully
+    """
+    with app.app_context():
+        admin = _warming_admin()
+        if admin is None:
+            logger.warning("Cache warm skipped: no active super admin to run as")
+            return 0
+        identity = {'admin_id': admin.id, 'admin_username': admin.username, 'admin_role': admin.role}
+
+    warmed = 0
+    for path, query_string in (_warm_requests() if requests is None else requests):
+        try:
+            with app.test_request_context(path, query_string=query_string):
+                session.update(identity)
+                g.cache_warming = True
+                if request.routing_exception is not None:
+                    raise request.routing_exception
+                result = app.view_functions[request.url_rule.endpoint](**request.view_args)
+                status = result[1] if isinstance(result, tuple) else getattr(result, 'status_code', 200)
+                if 200 <= status < 300:
+                    warmed += 1
+        except Exception as e:
+            logger.warning(f"Cache warm failed for {path}?{query_string}: {e}")
+    return warmed
+
+
+def start_cache_warmer(app, interval=None):
+    """Start the warming thread for this process (idempotent per process)"""
+    global _warmer_pid
+    if interval is None:
+        interval = int(os.getenv('CACHE_WARM_INTERVAL', DEFAULT_INTERVAL))
+    if interval <= 0:
+        return None
+
+    pid = os.getpid()
+    with _warmer_lock:
+        if _warmer_pid == pid:
+            return None
+        _warmer_pid = pid
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            demanded = _take_demanded()
+            if demanded:
+                warmed = warm_cache(app, demanded)
+                logger.debug(f"Cache warm pass: {warmed}/{len(demanded)} entries")
+
+    thread = threading.Thread(target=loop, name='cache-warmer', daemon=True)
+    thread.start()
+    return stop
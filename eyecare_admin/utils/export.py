@@ -3,11 +3,164 @@ Export utilities for data export functionality
 """
 import csv
 import io
+import tempfile
 from datetime import datetime
-from flask import Response
+from itertools import islice
+from flask import Response, stream_with_context
 import json
 
 
+# Rows fetched per server-side cursor round trip when streaming exports
+STREAM_BATCH_SIZE = 1000
+
+# Bytes buffered before a streamed chunk is flushed to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Hard row limit of a single XLSX worksheet (including the header row)
+XLSX_MAX_ROWS = 1048576
+
+# Excel files smaller than this stay in memory; larger ones spill to disk
+EXCEL_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _split_columns(columns):
+    """Return (headers, keys) for a list of column names or a {header: key} dict"""
+    if isinstance(columns, dict):
+        return list(columns.keys()), list(columns.values())
+    return columns, columns
+
+
+def _csv_row(item, keys):
+    """Build a CSV row (list of strings) from a dict or model"""
+    if hasattr(item, 'to_dict'):
+        item = item.to_dict()
+    
+    row = []
+    for key in keys:
+        value = item.get(key, '')
+        # Handle datetime objects
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        # Handle None
+        if value is None:
+            value = ''
+        row.append(str(value))
+    return row
+
+
+def iter_query_batches(query, batch_size=STREAM_BATCH_SIZE):
+    """
+    Iterate a query in batches using a server-side cursor
+    
+    Args:
+        query: SQLAlchemy query
+        batch_size: Rows fetched per round trip
+    
+    Yields:
+        Lists of at most batch_size rows
+    """
+    rows = iter(query.yield_per(batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_serialized(query, serialize_batch, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream a query through a list serializer one batch at a time
+    
+    Args:
+        query: SQLAlchemy query
+        serialize_batch: Callable taking a list of rows and returning a list of dicts
+            (e.g. User.serialize_with_counts)
+        batch_size: Rows fetched per round trip
+    
+    Yields:
+        Serialized rows
+    """
+    for batch in iter_query_batches(query, batch_size):
+        yield from serialize_batch(batch)
+
+
+def stream_csv(data, columns, filename=None):
+    """
+    Stream data as CSV without building the whole file in memory
+    
+    Args:
+        data: Iterable of dictionaries or objects with to_dict method
+            (e.g. from iter_serialized)
+        columns: List of column names or dict {header: key}
+        filename: Optional filename for download
+    
+    Returns:
+        Flask streaming Response with CSV data
+    """
+    headers, keys = _split_columns(columns)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        for item in data:
+            writer.writerow(_csv_row(item, keys))
+            if buffer.tell() >= STREAM_CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue().encode('utf-8')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename={filename or "export.csv"}'
+        }
+    )
+
+
+def stream_json(data, filename=None):
+    """
+    Stream data as a JSON array without building the whole document in memory
+    
+    Args:
+        data: Iterable of dictionaries or objects with to_dict method
+        filename: Optional filename for download
+    
+    Returns:
+        Flask streaming Response with JSON data
+    """
+    def generate():
+        parts = ['[']
+        size = 1
+        separator = '\n'
+        for item in data:
+            if hasattr(item, 'to_dict'):
+                item = item.to_dict()
+            encoded = json.dumps(item, default=str)
+            parts.append(separator)
+            parts.append(encoded)
+            size += len(encoded) + 2
+            separator = ',\n'
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(parts).encode('utf-8')
+                parts = []
+                size = 0
+        parts.append('\n]\n')
+        yield ''.join(parts).encode('utf-8')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/json',
+        headers={
+            'Content-Disposition': f'attachment; filename={filename or "export.json"}'
+        }
+    )
+
+
 def export_to_csv(data, columns, filename=None):
     """
     Export data to CSV format
@@ -22,35 +175,14 @@ def export_to_csv(data, columns, filename=None):
     """
     # Create CSV in memory
     output = io.StringIO()
-    
-    # Handle column format
-    if isinstance(columns, dict):
-        headers = list(columns.keys())
-        keys = list(columns.values())
-    else:
-        headers = columns
-        keys = columns
+    headers, keys = _split_columns(columns)
     
     writer = csv.writer(output)
     writer.writerow(headers)
     
     # Write data rows
     for item in data:
-        if hasattr(item, 'to_dict'):
-            item = item.to_dict()
-        
-        row = []
-        for key in keys:
-            value = item.get(key, '')
-            # Handle datetime objects
-            if isinstance(value, datetime):
-                value = value.isoformat()
-            # Handle None
-            if value is None:
-                value = ''
-            row.append(str(value))
-        
-        writer.writerow(row)
+        writer.writerow(_csv_row(item, keys))
     
     # Create response
     output.seek(0)
@@ -70,19 +202,22 @@ def export_to_json(data, filename=None):
     Export data to JSON format
     
     Args:
-        data: List of dictionaries or objects with to_dict method
+        data: List of dictionaries or objects with to_dict method, or a single dict
         filename: Optional filename for download
     
     Returns:
         Flask Response with JSON data
     """
-    # Convert to dict if needed
-    json_data = []
-    for item in data:
-        if hasattr(item, 'to_dict'):
-            json_data.append(item.to_dict())
-        else:
-            json_data.append(item)
+    # Convert to dict if needed (a single dict is exported as-is)
+    if isinstance(data, dict):
+        json_data = data
+    else:
+        json_data = []
+        for item in data:
+            if hasattr(item, 'to_dict'):
+                json_data.append(item.to_dict())
+            else:
+                json_data.append(item)
     
     # Create response
     response = Response(
@@ -120,13 +255,7 @@ def export_to_excel(data, columns, filename=None):
     ws = wb.active
     ws.title = "Export"
     
-    # Handle column format
-    if isinstance(columns, dict):
-        headers = list(columns.keys())
-        keys = list(columns.values())
-    else:
-        headers = columns
-        keys = columns
+    headers, keys = _split_columns(columns)
     
     # Write headers with styling
     for col_num, header in enumerate(headers, 1):
@@ -166,3 +295,165 @@ def export_to_excel(data, columns, filename=None):
     )
     
     return response
+
+
+def write_csv(data, columns, fileobj):
+    """
+    Write data as CSV to a text file object, one row at a time
+    
+    Args:
+        data: Iterable of dictionaries or objects with to_dict method
+        columns: List of column names or dict {header: key}
+        fileobj: Text file object (e.g. gzip.open(path, 'wt'))
+    
+    Returns:
+        Number of data rows written
+    """
+    headers, keys = _split_columns(columns)
+    writer = csv.writer(fileobj)
+    writer.writerow(headers)
+    written = 0
+    for item in data:
+        writer.writerow(_csv_row(item, keys))
+        written += 1
+    return written
+
+
+def write_json(data, fileobj):
+    """
+    Write data as a JSON array to a text file object, one item at a time
+    
+    Args:
+        data: Iterable of dictionaries or objects with to_dict method
+        fileobj: Text file object
+    
+    Returns:
+        Number of items written
+    """
+    fileobj.write('[')
+    written = 0
+    for item in data:
+        if hasattr(item, 'to_dict'):
+            item = item.to_dict()
+        fileobj.write(',\n' if written else '\n')
+        fileobj.write(json.dumps(item, default=str))
+        written += 1
+    fileobj.write('\n]\n')
+    return written
+
+
+def _excel_value(value):
+    """Coerce a value into something a write-only worksheet accepts"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _iter_file(fileobj, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield a file's contents in chunks, closing it afterwards"""
+    try:
+        fileobj.seek(0)
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def write_excel(data, columns, fileobj, max_rows_per_sheet=XLSX_MAX_ROWS):
+    """
+    Write data to an XLSX file using a write-only (constant memory) workbook
+    
+    Rows are appended as they are consumed from `data`, so an iterator such as
+    iter_serialized() is never materialized. When a sheet reaches
+    `max_rows_per_sheet` (header included) a new sheet is started.
+    
+    Args:
+        data: Iterable of dictionaries or objects with to_dict method
+        columns: List of column names or dict {header: key}
+        fileobj: Binary file object to save the workbook into
+        max_rows_per_sheet: Row limit per sheet, header included
+    
+    Returns:
+        Number of data rows written
+    """
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+        from openpyxl.styles import Font, PatternFill
+    except ImportError:
+        raise ImportError("openpyxl is required for Excel export. Install with: pip install openpyxl")
+    
+    headers, keys = _split_columns(columns)
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    
+    def new_sheet(number):
+        ws = wb.create_sheet(title="Export" if number == 1 else f"Export ({number})")
+        # Column widths must be set before the first row is appended
+        for col_num in range(1, len(headers) + 1):
+            ws.column_dimensions[get_column_letter(col_num)].width = 15
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            header_cells.append(cell)
+        ws.append(header_cells)
+        return ws
+    
+    sheet_number = 1
+    ws = new_sheet(sheet_number)
+    sheet_rows = 1
+    written = 0
+    for item in data:
+        if sheet_rows >= max_rows_per_sheet:
+            sheet_number += 1
+            ws = new_sheet(sheet_number)
+            sheet_rows = 1
+        if hasattr(item, 'to_dict'):
+            item = item.to_dict()
+        ws.append([_excel_value(item.get(key, '')) for key in keys])
+        sheet_rows += 1
+        written += 1
+    
+    wb.save(fileobj)
+    return written
+
+
+def stream_excel(data, columns, filename=None, max_rows_per_sheet=XLSX_MAX_ROWS):
+    """
+    Export data to Excel with a write-only workbook backed by a spooled temp file
+    
+    Args:
+        data: Iterable of dictionaries or objects with to_dict method
+            (e.g. from iter_serialized)
+        columns: List of column names or dict {header: key}
+        filename: Optional filename for download
+        max_rows_per_sheet: Row limit per sheet, header included
+    
+    Returns:
+        Flask streaming Response with Excel data
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_SIZE)
+    try:
+        write_excel(data, columns, spool, max_rows_per_sheet=max_rows_per_sheet)
+        size = spool.tell()
+    except Exception:
+        spool.close()
+        raise
+    
+    return Response(
+        _iter_file(spool),
+        mimetype=XLSX_MIMETYPE,
+        headers={
+            'Content-Disposition': f'attachment; filename={filename or "export.xlsx"}',
+            'Content-Length': str(size)
+        }
+    )
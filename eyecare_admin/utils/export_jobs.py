@@ -0,0 +1,324 @@
+"""Background export jobs.
+
+Long exports (year-long assessment dumps, the full activity log) can outlive
+the request timeout even when streamed. Instead, the export endpoints accept
+`async=true`: the request is recorded as an `ExportJob`, an exporter process
+replays it under the original query string and writes a compressed artifact
+to local storage, and the client polls `/api/exports/<id>` before downloading.
+
+Exporters are spawned processes (like the model trainer, see
+utils/training_jobs), not threads: under gevent a thread is a greenlet in the
+web worker, and CSV/openpyxl serialization would block its other requests.
+At most EXPORT_JOB_WORKERS exporters run per web worker; further jobs stay
+queued and are started by `dispatch_export_jobs()`, which runs on enqueue and
+whenever a job is polled. Exporters write a heartbeat (`updated_at`) with
+their progress; jobs whose exporter died or stopped writing are marked failed
+and later purged.
+
+Export endpoints register an "export source" builder under their export type.
+The builder runs inside a request context (the live request, or the replayed
+one in the worker) and returns an `ExportSource` describing what to write.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Optional
+
+from flask import current_app, request, session
+from sqlalchemy import func, or_, update
+
+from database import ExportJob, db
+from utils.export import (
+    STREAM_BATCH_SIZE,
+    XLSX_MIMETYPE,
+    iter_serialized,
+    write_csv,
+    write_excel,
+    write_json,
+)
+
+EXPORT_FORMATS = {
+    # format -> (artifact extension, mimetype)
+    'csv': ('.csv.gz', 'application/gzip'),
+    'json': ('.json.gz', 'application/gzip'),
+    'excel': ('.xlsx', XLSX_MIMETYPE),
+}
+
+DEFAULT_WORKERS = 2
+DEFAULT_RETENTION_HOURS = 24
+# A running job whose exporter has not written for this long is reported failed
+STALE_AFTER = timedelta(minutes=10)
+# A job nobody started within this long (no worker polled or enqueued) is failed
+QUEUED_TIMEOUT = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExportSource:
+    """What an export writes.
+
+    Either `query` + `serialize_batch` (streamed through iter_serialized) or
+    pre-built `rows`. `document`, when set, is written instead of the rows for
+    JSON exports (e.g. a report with a summary section).
+    """
+
+    columns: Any
+    query: Any = None
+    serialize_batch: Optional[Callable[[list], list]] = None
+    rows: Optional[list] = None
+    document: Any = None
+
+
+_sources: dict[str, Callable[[], ExportSource]] = {}
+# Exporter processes started by this web worker: job id -> Process
+_processes: dict[str, multiprocessing.Process] = {}
+
+
+def register_export_source(export_type: str, builder: Callable[[], ExportSource]) -> None:
+    """Register the ExportSource builder for an export type."""
+    _sources[export_type] = builder
+
+
+def build_export_source(export_type: str) -> ExportSource:
+    return _sources[export_type]()
+
+
+def wants_async_export() -> bool:
+    """True when the current export request asked to run in the background."""
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+
+def export_folder() -> str:
+    folder = current_app.config.get('EXPORT_FOLDER') or os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _exporter_main(job_id: str) -> None:
+    """Entry point of the spawned exporter process."""
+    logging.basicConfig(level=logging.INFO)
+    from app import app
+
+    run_export_job(app, job_id)
+
+
+def _start_exporter(job_id: str) -> None:
+    proc = multiprocessing.get_context('spawn').Process(
+        target=_exporter_main, args=(job_id,), name=f'exporter-{job_id[:8]}',
+    )
+    proc.start()
+    _processes[job_id] = proc
+
+
+def _reap_exporters() -> None:
+    """Join finished exporter processes; fail jobs whose exporter died mid-run."""
+    table = ExportJob.__table__
+    for job_id, proc in list(_processes.items()):
+        if proc.is_alive():
+            continue
+        proc.join()
+        del _processes[job_id]
+        if proc.exitcode != 0:
+            _update_job(
+                job_id, table.c.status.in_(['queued', 'running']),
+                status='failed', error=f'Exporter exited with code {proc.exitcode}',
+                completed_at=datetime.utcnow(),
+            )
+
+
+def fail_stale_export_jobs() -> int:
+    """Mark jobs orphaned by a recycled/restarted worker as failed."""
+    _reap_exporters()
+    table = ExportJob.__table__
+    now = datetime.utcnow()
+    heartbeat = func.coalesce(table.c.updated_at, table.c.started_at, table.c.created_at)
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            update(table)
+            .where(or_(
+                (table.c.status == 'running') & (heartbeat < now - STALE_AFTER),
+                (table.c.status == 'queued') & (table.c.created_at < now - QUEUED_TIMEOUT),
+            ))
+            .values(status='failed', error='Export worker stopped responding', completed_at=now)
+        )
+    return result.rowcount
+
+
+def dispatch_export_jobs() -> None:
+    """Start queued jobs in exporter processes, up to EXPORT_JOB_WORKERS at a time."""
+    fail_stale_export_jobs()
+    slots = int(current_app.config.get('EXPORT_JOB_WORKERS', DEFAULT_WORKERS)) - len(_processes)
+    if slots <= 0:
+        return
+    queued = (
+        db.session.query(ExportJob.id)
+        .filter(ExportJob.status == 'queued', ExportJob.id.notin_(list(_processes) or ['']))
+        .order_by(ExportJob.created_at)
+        .limit(slots)
+        .all()
+    )
+    for (job_id,) in queued:
+        _start_exporter(job_id)
+
+
+def enqueue_export_job(export_type: str, format_type: str, filename: str) -> ExportJob:
+    """Record an export job for the current request and hand it to an exporter.
+
+    With `EXPORT_JOBS_SYNC` set (tests, single-process debugging) the job runs
+    inline before returning.
+    """
+    if export_type not in _sources:
+        raise ValueError(f'Unknown export type: {export_type}')
+    if format_type not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {format_type}')
+
+    purge_expired_export_jobs()
+
+    params = request.args.to_dict(flat=False)
+    params.pop('async', None)
+
+    job = ExportJob(
+        id=str(uuid.uuid4()),
+        export_type=export_type,
+        format=format_type,
+        params=json.dumps(params),
+        filename=filename,
+        status='queued',
+        requested_by=session.get('admin_id'),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    if app.config.get('EXPORT_JOBS_SYNC'):
+        run_export_job(app, job.id)
+        db.session.refresh(job)
+    else:
+        dispatch_export_jobs()
+    return job
+
+
+def _update_job(job_id: str, *conditions, **values) -> int:
+    """Update a job row on its own connection; returns the number of rows changed.
+
+    The exporter's session may be holding a server-side cursor open; committing
+    that session mid-iteration would invalidate the cursor on MySQL/Postgres.
+    Every write doubles as the exporter's heartbeat.
+    """
+    table = ExportJob.__table__
+    values.setdefault('updated_at', datetime.utcnow())
+    with db.engine.begin() as conn:
+        result = conn.execute(update(table).where(table.c.id == job_id, *conditions).values(**values))
+    return result.rowcount
+
+
+class _ProgressTracker:
+    """Wrap a row iterator and persist the running row count every `every` rows."""
+
+    def __init__(self, rows: Iterable, job_id: str, every: int = STREAM_BATCH_SIZE):
+        self.rows = rows
+        self.job_id = job_id
+        self.every = every
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            yield row
+            self.count += 1
+            if self.count % self.every == 0:
+                _update_job(self.job_id, rows_written=self.count)
+
+
+def _write_artifact(job: ExportJob, source: ExportSource, path: str) -> int:
+    if source.query is not None:
+        rows = iter_serialized(source.query, source.serialize_batch)
+    else:
+        rows = source.rows or []
+    tracker = _ProgressTracker(rows, job.id)
+
+    if job.format == 'excel':
+        with open(path, 'wb') as fileobj:
+            write_excel(tracker, source.columns, fileobj)
+        return tracker.count
+
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as fileobj:
+        if job.format == 'csv':
+            write_csv(tracker, source.columns, fileobj)
+        elif source.document is not None:
+            json.dump(source.document, fileobj, indent=2, default=str)
+            return len(source.rows or [])
+        else:
+            write_json(tracker, fileobj)
+    return tracker.count
+
+
+def run_export_job(app, job_id: str) -> None:
+    """Execute a queued export job (exporter entry point)."""
+    with app.app_context():
+        # Claim the job; another web worker may have started an exporter for it too
+        table = ExportJob.__table__
+        if not _update_job(job_id, table.c.status == 'queued', status='running', started_at=datetime.utcnow()):
+            return
+        params = json.loads(db.session.get(ExportJob, job_id).params or '{}')
+
+    path = None
+    try:
+        with app.test_request_context(query_string=params):
+            job = db.session.get(ExportJob, job_id)
+            extension, _ = EXPORT_FORMATS[job.format]
+            path = os.path.join(export_folder(), f'{job.id}{extension}')
+
+            source = build_export_source(job.export_type)
+            if source.query is not None:
+                total = source.query.order_by(None).count()
+            else:
+                total = len(source.rows or [])
+            _update_job(job_id, total_rows=total)
+
+            written = _write_artifact(job, source, path)
+            _update_job(
+                job_id,
+                status='completed',
+                rows_written=written,
+                file_path=path,
+                file_size=os.path.getsize(path),
+                completed_at=datetime.utcnow(),
+            )
+    except Exception as e:
+        app.logger.error(f'Export job {job_id} failed: {e}', exc_info=True)
+        if path and os.path.exists(path):
+            os.remove(path)
+        with app.app_context():
+            _update_job(job_id, status='failed', error=str(e), completed_at=datetime.utcnow())
+
+
+def purge_expired_export_jobs(retention_hours: Optional[int] = None) -> int:
+    """Delete finished jobs (and their artifacts) older than the retention window.
+
+    Orphaned queued/running jobs are first marked failed (see
+    `fail_stale_export_jobs`), so they are purged like any failed job.
+    """
+    fail_stale_export_jobs()
+    if retention_hours is None:
+        retention_hours = int(current_app.config.get('EXPORT_JOB_RETENTION_HOURS', DEFAULT_RETENTION_HOURS))
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    expired = ExportJob.query.filter(
+        ExportJob.created_at < cutoff,
+        ExportJob.status.in_(['completed', 'failed']),
+    ).all()
+    for job in expired:
+        if job.file_path and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        db.session.delete(job)
+    if expired:
+        db.session.commit()
+    return len(expired)
@@ -1,14 +1,138 @@
 """
 Pagination utility for API responses
+
+Two modes are supported:
+
+- page mode (default): ``?page=N&per_page=M`` using LIMIT/OFFSET. Fine for
+  small tables, but the database still walks every skipped row, so deep pages
+  on large tables get slower with each page.
+- cursor (keyset) mode: enabled for endpoints that pass ``keyset=`` when the
+  request carries a ``cursor`` parameter (empty for the first page). Rows are
+  ordered by the sort column plus the primary key and each page seeks past the
+  last row of the previous one, so every page costs the same. Rows whose sort
+  column is NULL come after all others, ordered by primary key.
+
+Both modes serve at most ``MAX_PER_PAGE`` rows per page.
+
+Independently, each endpoint picks how the total is counted (``count=``):
+
+- ``'exact'``: ``COUNT(*)`` on every request (default).
+- ``'cached'``: exact count cached per filter signature for ``count_ttl``
+  seconds.
+- ``'estimate'``: planner row estimate (``pg_class.reltuples`` /
+  ``information_schema.tables.table_rows``) when the query has no filters,
+  otherwise a cached exact count.
+- ``'none'``: no count at all; ``has_next`` comes from fetching one extra row.
 """
+import base64
+import hashlib
+import json
+from datetime import date, datetime
 from flask import request, url_for
 from math import ceil
+from sqlalchemy import and_, or_, text
+from utils.cache import cache
+
+COUNT_STRATEGIES = ('exact', 'cached', 'estimate', 'none')
+DEFAULT_COUNT_TTL = 30  # seconds
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+# Planner estimates are rough; below this size an exact count is cheap anyway
+ESTIMATE_MIN_ROWS = 10000
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor token cannot be decoded"""
+
+
+def encode_cursor(sort_value, pk_value, direction='next'):
+    """Encode a keyset position as an opaque URL-safe token"""
+    if isinstance(sort_value, (datetime, date)):
+        sort_value = {'dt': sort_value.isoformat()}
+    payload = json.dumps({'v': sort_value, 'k': pk_value, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token into (sort_value, pk_value, direction)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        sort_value = payload['v']
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+        direction = payload.get('d', 'next')
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return sort_value, payload['k'], direction
+    except Exception:
+        raise InvalidCursorError('Invalid pagination cursor')
+
+
+def _query_table(query):
+    """Return the Table of a query's primary entity (or None)"""
+    descriptions = query.column_descriptions
+    entity = descriptions[0].get('entity') if descriptions else None
+    return getattr(entity, '__table__', None)
+
+
+def cached_count(query, ttl=DEFAULT_COUNT_TTL):
+    """
+    Exact count cached per filter signature
+    
+    The signature is the compiled COUNT statement plus its bound parameters,
+    so any change to the filters gets its own cache entry.
+    """
+    query = query.order_by(None)
+    compiled = query.statement.compile(dialect=query.session.get_bind().dialect)
+    signature = json.dumps([str(compiled), compiled.params], sort_keys=True, default=str)
+    table = _query_table(query)
+    tag = f"count:{table.name if table is not None else 'query'}"
+    key = f"{tag}:{hashlib.md5(signature.encode()).hexdigest()}"
+    
+    total = cache.get(key)
+    if total is None:
+        total = query.count()
+        cache.set(key, total, ttl, tags=(tag,))
+    return total
+
+
+def estimate_count(query, min_rows=ESTIMATE_MIN_ROWS):
+    """
+    Row estimate from planner statistics for an unfiltered query
+    
+    Returns None when no usable estimate exists (filtered query, unsupported
+    database, never-analyzed or small table) so the caller can count instead.
+    """
+    if query.whereclause is not None:
+        return None
+    table = _query_table(query)
+    if table is None:
+        return None
+    
+    dialect = query.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        sql = text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table')
+    elif dialect in ('mysql', 'mariadb'):
+        sql = text(
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = :table'
+        )
+    else:
+        return None
+    
+    estimate = query.session.execute(sql, {'table': table.name}).scalar()
+    if estimate is None or estimate < min_rows:
+        return None
+    return int(estimate)
 
 
 class Pagination:
     """Pagination helper class"""
     
-    def __init__(self, query, page=None, per_page=None, total=None, items=None):
+    def __init__(self, query, page=None, per_page=None, total=None, items=None,
+                 keyset=None, descending=True, count='exact', count_ttl=DEFAULT_COUNT_TTL,
+                 count_query=None):
         """
         Initialize pagination
         
@@ -18,13 +142,55 @@ class Pagination:
             per_page: Items per page
             total: Total number of items (optional, will be calculated from query)
             items: List of items (optional, will be fetched from query)
+            keyset: (sort_column, primary_key_column) enabling cursor mode
+            descending: Sort direction used in cursor mode
+            count: Count strategy - 'exact', 'cached', 'estimate' or 'none'
+            count_ttl: Seconds a cached count stays valid
+            count_query: Query to count instead of `query` (e.g. the base
+                query before display-only joins are added)
         """
+        if count not in COUNT_STRATEGIES:
+            raise ValueError(f'Unknown count strategy: {count}')
         self.query = query
+        self.count_query = count_query if count_query is not None else query
+        self.count_strategy = count
+        self.count_ttl = count_ttl
+        self.total_is_estimate = False
+        self._has_more = False
+        self.keyset = keyset
+        self.descending = descending
+        self.cursor = request.args.get('cursor') if keyset is not None else None
+        self.cursor_mode = self.cursor is not None
+        self.next_cursor = None
+        self.prev_cursor = None
+        self._has_next_cursor = self._has_prev_cursor = False
         self.page = page or self._get_page()
-        self.per_page = per_page or self._get_per_page()
-        self.total = total if total is not None else query.count()
-        self.items = items if items is not None else self._get_items()
-        self.pages = ceil(self.total / self.per_page) if self.per_page > 0 else 0
+        self.per_page = self._clamp_per_page(per_page) if per_page else self._get_per_page()
+        self.total = total if total is not None else self._count()
+        if items is not None:
+            self.items = items
+        elif self.cursor_mode:
+            self.items = self._get_keyset_items()
+        else:
+            self.items = self._get_items()
+        if self.total is None:
+            self.pages = None
+        else:
+            self.pages = ceil(self.total / self.per_page) if self.per_page > 0 else 0
+    
+    def _count(self):
+        """Total number of items according to the count strategy"""
+        if self.count_strategy == 'none':
+            return None
+        if self.count_strategy == 'estimate':
+            estimate = estimate_count(self.count_query)
+            if estimate is not None:
+                self.total_is_estimate = True
+                return estimate
+            return cached_count(self.count_query, self.count_ttl)
+        if self.count_strategy == 'cached':
+            return cached_count(self.count_query, self.count_ttl)
+        return self.count_query.order_by(None).count()
     
     def _get_page(self):
         """Get page number from request"""
@@ -34,27 +200,103 @@ class Pagination:
         except:
             return 1
     
+    @staticmethod
+    def _clamp_per_page(per_page):
+        """Between 1 and MAX_PER_PAGE"""
+        return min(max(1, per_page), MAX_PER_PAGE)
+    
     def _get_per_page(self):
         """Get per_page from request, with max limit"""
         try:
-            per_page = request.args.get('per_page', 20, type=int)
-            return min(max(1, per_page), 100)  # Between 1 and 100
+            return self._clamp_per_page(request.args.get('per_page', DEFAULT_PER_PAGE, type=int))
         except:
-            return 20
+            return DEFAULT_PER_PAGE
     
     def _get_items(self):
         """Fetch items for current page"""
         offset = (self.page - 1) * self.per_page
-        return self.query.limit(self.per_page).offset(offset).all()
+        if self.count_strategy != 'none':
+            return self.query.limit(self.per_page).offset(offset).all()
+        # Without a total, one extra row tells whether another page exists
+        rows = self.query.limit(self.per_page + 1).offset(offset).all()
+        self._has_more = len(rows) > self.per_page
+        return rows[:self.per_page]
+    
+    def _get_keyset_items(self):
+        """Fetch the page after (or before) the cursor position"""
+        sort_col, pk_col = self.keyset
+        sort_value = pk_value = None
+        direction = 'next'
+        if self.cursor:
+            sort_value, pk_value, direction = decode_cursor(self.cursor)
+        in_nulls = bool(self.cursor) and sort_value is None
+        
+        # Walking forward in a descending list means smaller keys
+        seek_lower = self.descending == (direction == 'next')
+        order = (lambda col: col.desc()) if seek_lower else (lambda col: col.asc())
+        query = self.query.order_by(None)
+        
+        # NULL sort keys cannot be compared, so they form their own segment
+        # after the others; each segment is a plain indexed range scan
+        keyed = query.filter(sort_col.isnot(None)).order_by(order(sort_col), order(pk_col))
+        nulls = query.filter(sort_col.is_(None)).order_by(order(pk_col))
+        if self.cursor:
+            pk_past = pk_col < pk_value if seek_lower else pk_col > pk_value
+            if in_nulls:
+                nulls = nulls.filter(pk_past)
+            else:
+                past = sort_col < sort_value if seek_lower else sort_col > sort_value
+                keyed = keyed.filter(or_(past, and_(sort_col == sort_value, pk_past)))
+        
+        # Segments in walking order: forward visits keyed rows before NULL ones
+        if direction == 'next':
+            segments = [nulls] if in_nulls else [keyed, nulls]
+        else:
+            segments = [nulls, keyed] if in_nulls else [keyed]
+        
+        rows = []
+        for segment in segments:
+            rows.extend(segment.limit(self.per_page + 1 - len(rows)).all())
+            if len(rows) > self.per_page:
+                break
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+        
+        if direction == 'next':
+            self._has_next_cursor, self._has_prev_cursor = has_more, bool(self.cursor)
+        else:
+            self._has_next_cursor, self._has_prev_cursor = True, has_more
+        
+        if rows:
+            if self._has_next_cursor:
+                self.next_cursor = self._cursor_for(rows[-1], 'next')
+            if self._has_prev_cursor:
+                self.prev_cursor = self._cursor_for(rows[0], 'prev')
+        return rows
+    
+    def _cursor_for(self, row, direction):
+        """Build the cursor token pointing at a row"""
+        sort_col, pk_col = self.keyset
+        # Multi-entity queries return rows; the keyed model comes first
+        entity = row[0] if hasattr(row, '_mapping') else row
+        return encode_cursor(getattr(entity, sort_col.key), getattr(entity, pk_col.key), direction)
     
     @property
     def has_prev(self):
         """Check if there's a previous page"""
+        if self.cursor_mode:
+            return self._has_prev_cursor
         return self.page > 1
     
     @property
     def has_next(self):
         """Check if there's a next page"""
+        if self.cursor_mode:
+            return self._has_next_cursor
+        if self.pages is None:
+            return self._has_more
         return self.page < self.pages
     
     @property
@@ -75,10 +317,14 @@ class Pagination:
             endpoint: Flask endpoint name for generating URLs
             **kwargs: Additional URL parameters
         """
+        if self.cursor_mode:
+            return self._cursor_dict(endpoint, **kwargs)
+        
         data = {
             'page': self.page,
             'per_page': self.per_page,
             'total': self.total,
+            'total_is_estimate': self.total_is_estimate,
             'pages': self.pages,
             'has_prev': self.has_prev,
             'has_next': self.has_next,
@@ -89,9 +335,10 @@ class Pagination:
         if endpoint:
             data['links'] = {
                 'self': self._get_url(endpoint, self.page, **kwargs),
-                'first': self._get_url(endpoint, 1, **kwargs),
-                'last': self._get_url(endpoint, self.pages, **kwargs)
+                'first': self._get_url(endpoint, 1, **kwargs)
             }
+            if self.pages is not None:
+                data['links']['last'] = self._get_url(endpoint, self.pages, **kwargs)
             
             if self.has_prev:
                 data['links']['prev'] = self._get_url(endpoint, self.prev_page, **kwargs)
@@ -101,6 +348,34 @@ class Pagination:
         
         return data
     
+    def _cursor_dict(self, endpoint=None, **kwargs):
+        """Dictionary for cursor mode (no page numbers)"""
+        data = {
+            'per_page': self.per_page,
+            'total': self.total,
+            'total_is_estimate': self.total_is_estimate,
+            'has_prev': self.has_prev,
+            'has_next': self.has_next,
+            'prev_cursor': self.prev_cursor,
+            'next_cursor': self.next_cursor
+        }
+        
+        if endpoint:
+            data['links'] = {'first': self._get_cursor_url(endpoint, '', **kwargs)}
+            if self.prev_cursor:
+                data['links']['prev'] = self._get_cursor_url(endpoint, self.prev_cursor, **kwargs)
+            if self.next_cursor:
+                data['links']['next'] = self._get_cursor_url(endpoint, self.next_cursor, **kwargs)
+        
+        return data
+    
+    def _get_cursor_url(self, endpoint, cursor, **kwargs):
+        """Generate URL for a cursor pagination link"""
+        try:
+            return url_for(endpoint, cursor=cursor, per_page=self.per_page, _external=True, **kwargs)
+        except:
+            return None
+    
     def _get_url(self, endpoint, page, **kwargs):
         """Generate URL for pagination link"""
         try:
@@ -109,7 +384,7 @@ class Pagination:
             return None
 
 
-def paginate(query, page=None, per_page=None):
+def paginate(query, page=None, per_page=None, keyset=None, descending=True, count='exact'):
     """
     Convenience function to paginate a query
     
@@ -117,8 +392,11 @@ def paginate(query, page=None, per_page=None):
         query: SQLAlchemy query
         page: Page number (optional, reads from request)
         per_page: Items per page (optional, reads from request)
+        keyset: (sort_column, primary_key_column) to allow cursor mode
+        descending: Sort direction used in cursor mode
+        count: Count strategy (see COUNT_STRATEGIES)
     
     Returns:
         Pagination object
     """
-    return Pagination(query, page=page, per_page=per_page)
+    return Pagination(query, page=page, per_page=per_page, keyset=keyset, descending=descending, count=count)
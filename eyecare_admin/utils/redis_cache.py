@@ -1,13 +1,35 @@
 """
 Redis Cache Implementation
 Replaces in-memory caching with Redis for production scalability
+
+Invalidation is tag based: each tag has a generation counter
+(``cache:gen:<tag>``) that is stored with the entries cached under it, and a
+lookup reads the entry and the counters in one MGET (get_tagged). Invalidating
+a tag is a single INCR - entries stored under older generations read as
+misses until they are overwritten or expire - so nothing ever runs KEYS
+against a shared Redis.
+
+Connections come from a BlockingConnectionPool (REDIS_MAX_CONNECTIONS,
+waiting up to REDIS_POOL_TIMEOUT seconds for a free one), values are stored
+in the binary format of utils/cache_serializer, and get_many()/set_many()
+batch several keys into one round trip.
+
+Every Redis call goes through a circuit breaker (utils/circuit_breaker).
+When Redis errors or slows down repeatedly the circuit opens and calls are
+served by the in-memory fallback without touching the network; tag
+invalidations made meanwhile are replayed on Redis once it recovers.
 """
 from functools import wraps
-import json
 import hashlib
+import os
+import threading
 import time
 from datetime import timedelta
 
+from utils.cache_serializer import CacheSerializer
+from utils.cache_metrics import cache_metrics
+from utils.circuit_breaker import CircuitBreaker
+
 # Try to import Redis, fallback to in-memory if not available
 try:
     import redis
@@ -41,6 +63,16 @@ class SimpleCache:
         """Redis-compatible setex"""
         return self.set(key, value, timeout)
     
+    def mget(self, keys):
+        """Redis-compatible mget"""
+        return [self.get(k) for k in keys]
+    
+    def incr(self, key):
+        """Redis-compatible incr"""
+        value = int(self.get(key) or 0) + 1
+        self.set(key, str(value))
+        return value
+    
     def delete(self, key, *keys):
         """Delete one or more keys"""
         deleted = 0
@@ -94,30 +126,78 @@ class SimpleCache:
             'keyspace_misses': 0,
             'used_memory_human': 'N/A'
         }
+    
+    def scan_iter(self, match='*', count=None):
+        """Redis-compatible scan_iter"""
+        return iter(self.keys(match))
+    
+    def pipeline(self, transaction=False):
+        """Redis-compatible pipeline (commands run immediately)"""
+        return _ImmediatePipeline(self)
+
+
+class _ImmediatePipeline:
+    """Pipeline stand-in for SimpleCache: runs each command, collects results"""
+    
+    def __init__(self, client):
+        self._client = client
+        self._results = []
+    
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        
+        def command(*args, **kwargs):
+            self._results.append(method(*args, **kwargs))
+            return self
+        return command
+    
+    def execute(self):
+        results, self._results = self._results, []
+        return results
 
 
 class RedisCache:
     """Redis-based cache for production use"""
     
-    def __init__(self, host='localhost', port=6379, db=0, password=None):
-        """Initialize Redis connection with fallback"""
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 max_connections=None, pool_timeout=None, serializer=None):
+        """
+        Initialize Redis connection with fallback
+        
+        Args:
+            max_connections: Pool size (default REDIS_MAX_CONNECTIONS or 50)
+            pool_timeout: Seconds to wait for a free pooled connection
+                (default REDIS_POOL_TIMEOUT or 5)
+            serializer: CacheSerializer for values (default: fastest installed codec)
+        """
         self.redis_client = False
+        self.serializer = serializer or CacheSerializer()
+        self.fallback = SimpleCache()
+        self.breaker = CircuitBreaker('redis_cache')
+        self._pending_tags = set()
+        self._pending_lock = threading.Lock()
         
         if not REDIS_AVAILABLE:
             print("⚠ redis-py not installed. Using in-memory cache fallback.")
-            self.client = SimpleCache()
+            self.client = self.fallback
             return
         
         try:
-            self.client = redis.Redis(
+            # Blocking pool: under load, callers wait for a connection instead
+            # of opening unbounded new ones against Redis
+            self.pool = redis.BlockingConnectionPool(
                 host=host,
                 port=port,
                 db=db,
                 password=password,
-                decode_responses=True,
+                max_connections=max_connections or int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+                timeout=pool_timeout or float(os.getenv('REDIS_POOL_TIMEOUT', 5)),
                 socket_connect_timeout=2,
-                socket_timeout=2
+                # Sub-second: a slow Redis must fail fast into the circuit
+                # breaker (REDIS_BREAKER_LATENCY) rather than stall the request
+                socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.5))
             )
+            self.client = redis.Redis(connection_pool=self.pool)
             
             # Test connection
             self.client.ping()
@@ -125,37 +205,120 @@ class RedisCache:
             print(f"✓ Redis connected: {host}:{port}")
         except Exception as e:
             print(f"⚠ Redis not available ({e.__class__.__name__}). Using in-memory cache fallback.")
-            self.client = SimpleCache()
+            self.client = self.fallback
             self.redis_client = False
     
+    def _call(self, op):
+        """
+        Run op(client) on Redis through the circuit breaker
+        
+        While the circuit is open (or Redis never connected) op runs on the
+        in-memory fallback instead, so a degraded Redis costs nothing rather
+        than a socket timeout per call.
+        """
+        if not self.redis_client or not self.breaker.allow():
+            return op(self.fallback)
+        start = time.monotonic()
+        try:
+            result = op(self.client)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self.breaker.record_failure(e)
+            return op(self.fallback)
+        except Exception:
+            # Redis answered (e.g. a command error): not an availability problem
+            self.breaker.record_success(time.monotonic() - start)
+            raise
+        self.breaker.record_success(time.monotonic() - start)
+        if self._pending_tags:
+            self._replay_invalidations()
+        return result
+    
+    def _replay_invalidations(self):
+        """Apply tag invalidations that happened while the circuit was open"""
+        with self._pending_lock:
+            tags, self._pending_tags = self._pending_tags, set()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(f"cache:gen:{tag}")
+            pipe.execute()
+        except Exception as e:
+            with self._pending_lock:
+                self._pending_tags |= tags
+            print(f"Redis invalidation replay error: {e}")
+    
     def get(self, key):
         """Get value from cache"""
         try:
-            value = self.client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            return self.serializer.loads(self._call(lambda client: client.get(key)))
         except Exception as e:
             print(f"Redis get error: {e}")
             return None
     
+    def get_many(self, keys):
+        """
+        Get several values in one round trip
+        
+        Returns:
+            Dict of key -> value for the keys that were found
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            values = self._call(lambda client: client.mget(keys))
+            result = {}
+            for key, raw in zip(keys, values):
+                if raw is not None:
+                    result[key] = self.serializer.loads(raw)
+            return result
+        except Exception as e:
+            print(f"Redis get_many error: {e}")
+            return {}
+    
     def set(self, key, value, timeout=300):
-        """Set value in cache with timeout (seconds)"""
+        """
+        Set value in cache with timeout (seconds)
+        
+        Returns:
+            Size of the stored value in bytes (truthy), or False on error
+        """
         try:
-            serialized = json.dumps(value, default=str)
+            serialized = self.serializer.dumps(value)
             if timeout:
-                self.client.setex(key, timeout, serialized)
+                self._call(lambda client: client.setex(key, timeout, serialized))
             else:
-                self.client.set(key, serialized)
-            return True
+                self._call(lambda client: client.set(key, serialized))
+            return len(serialized)
         except Exception as e:
             print(f"Redis set error: {e}")
             return False
     
+    def set_many(self, mapping, timeout=300):
+        """Set several values in one pipelined round trip"""
+        if not mapping:
+            return True
+        try:
+            items = [(key, self.serializer.dumps(value)) for key, value in mapping.items()]
+            
+            def op(client):
+                pipe = client.pipeline(transaction=False)
+                for key, serialized in items:
+                    if timeout:
+                        pipe.setex(key, timeout, serialized)
+                    else:
+                        pipe.set(key, serialized)
+                return pipe.execute()
+            self._call(op)
+            return True
+        except Exception as e:
+            print(f"Redis set_many error: {e}")
+            return False
+    
     def delete(self, key):
         """Delete key from cache"""
         try:
-            self.client.delete(key)
+            self._call(lambda client: client.delete(key))
             return True
         except Exception as e:
             print(f"Redis delete error: {e}")
@@ -164,7 +327,7 @@ class RedisCache:
     def clear(self):
         """Clear all cache"""
         try:
-            self.client.flushdb()
+            self._call(lambda client: client.flushdb())
             return True
         except Exception as e:
             print(f"Redis clear error: {e}")
@@ -173,7 +336,7 @@ class RedisCache:
     def exists(self, key):
         """Check if key exists"""
         try:
-            return self.client.exists(key) > 0
+            return self._call(lambda client: client.exists(key)) > 0
         except Exception as e:
             print(f"Redis exists error: {e}")
             return False
@@ -181,23 +344,92 @@ class RedisCache:
     def get_ttl(self, key):
         """Get time to live for key"""
         try:
-            if self.redis_client:
-                return self.client.ttl(key)
-            else:
-                return self.client.ttl(key)
+            return self._call(lambda client: client.ttl(key))
         except Exception as e:
             print(f"Redis ttl error: {e}")
             return -1
     
-    def invalidate_by_prefix(self, prefix):
-        """Invalidate all keys with given prefix"""
+    def tag_generations(self, tags):
+        """Current generation of each tag (0 if never invalidated)"""
+        if not tags:
+            return []
+        try:
+            keys = [f"cache:gen:{tag}" for tag in tags]
+            values = self._call(lambda client: client.mget(keys))
+            return [int(v or 0) for v in values]
+        except Exception as e:
+            print(f"Redis generation lookup error: {e}")
+            return [0] * len(tags)
+    
+    def get_tagged(self, key, tags):
+        """
+        Get an entry stored by set_tagged, in one round trip with its tags' generations
+        
+        Returns:
+            (value, generations): value is None on a miss or when the entry
+            predates an invalidation; generations is None if Redis failed
+        """
+        keys = [key] + [f"cache:gen:{tag}" for tag in tags]
+        try:
+            raw, *generations = self._call(lambda client: client.mget(keys))
+            generations = [int(g or 0) for g in generations]
+        except Exception as e:
+            print(f"Redis get error: {e}")
+            return None, None
+        if raw is None:
+            return None, generations
+        try:
+            stored_generations, value = self.serializer.loads(raw)
+        except Exception as e:
+            print(f"Redis entry {key} unreadable: {e}")
+            return None, generations
+        return (value if stored_generations == generations else None), generations
+    
+    def set_tagged(self, key, value, generations, timeout=300):
+        """Store an entry for get_tagged under the generations it was computed at"""
+        return self.set(key, [generations, value], timeout)
+    
+    def invalidate_tags(self, *tags):
+        """Invalidate all entries cached under any of the tags (one INCR per tag)"""
+        def op(client):
+            if client is self.fallback and self.redis_client:
+                # Redis is unreachable: remember the tags for when it's back
+                with self._pending_lock:
+                    self._pending_tags.update(tags)
+            pipe = client.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(f"cache:gen:{tag}")
+            return pipe.execute()
+        
+        try:
+            self._call(op)
+            return True
+        except Exception as e:
+            print(f"Redis invalidate error: {e}")
+            return False
+    
+    def invalidate_by_prefix(self, prefix, batch_size=500):
+        """
+        Delete all keys with given prefix
+        
+        Walks the keyspace with SCAN (incremental, non-blocking) rather than
+        KEYS. Prefer invalidate_tags() for anything on a hot path.
+        """
         try:
             pattern = f"{prefix}*"
-            keys = self.client.keys(pattern)
-            if keys:
-                deleted = self.client.delete(*keys) if self.redis_client else sum(self.client.delete(k) for k in keys)
+            
+            def op(client):
+                deleted = 0
+                batch = []
+                for key in client.scan_iter(match=pattern, count=batch_size):
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        deleted += client.delete(*batch)
+                        batch = []
+                if batch:
+                    deleted += client.delete(*batch)
                 return deleted
-            return 0
+            return self._call(op)
         except Exception as e:
             print(f"Redis invalidate error: {e}")
             return 0
@@ -205,7 +437,7 @@ class RedisCache:
     def get_stats(self):
         """Get cache statistics"""
         try:
-            if self.redis_client:
+            if self.redis_client and self.breaker.state != 'open':
                 info = self.client.info('stats')
                 memory = self.client.info('memory')
                 return {
@@ -214,12 +446,14 @@ class RedisCache:
                     'hits': info.get('keyspace_hits', 0),
                     'misses': info.get('keyspace_misses', 0),
                     'memory_used_bytes': memory.get('used_memory', 0),
-                    'memory_used_human': memory.get('used_memory_human', 'N/A')
+                    'memory_used_human': memory.get('used_memory_human', 'N/A'),
+                    'circuit_breaker': self.breaker.snapshot()
                 }
             else:
                 return {
                     'type': 'in-memory',
-                    'keys': self.client.dbsize()
+                    'keys': self.fallback.dbsize(),
+                    'circuit_breaker': self.breaker.snapshot() if self.redis_client else None
                 }
         except Exception as e:
             return {'error': str(e)}
@@ -235,7 +469,6 @@ def get_cache():
         # Try to use Redis
         if REDIS_AVAILABLE:
             try:
-                import os
                 redis_host = os.getenv('REDIS_HOST', 'localhost')
                 redis_port = int(os.getenv('REDIS_PORT', 6379))
                 redis_password = os.getenv('REDIS_PASSWORD', None)
@@ -256,13 +489,28 @@ def get_cache():
     
     return _cache_instance
 
-def cached(timeout=300, key_prefix=''):
+def circuit_state():
+    """Redis circuit breaker state, or None if the Redis cache is not in use"""
+    if isinstance(_cache_instance, RedisCache) and _cache_instance.redis_client:
+        return _cache_instance.breaker.snapshot()
+    return None
+
+def _resolve_tags(key_prefix, tags, args, kwargs):
+    """Tags for a cached call: the key_prefix plus static or computed extra tags"""
+    if callable(tags):
+        tags = tags(*args, **kwargs)
+    return ([key_prefix] if key_prefix else []) + list(tags or ())
+
+
+def cached(timeout=300, key_prefix='', tags=None):
     """
     Decorator to cache function results
     
     Args:
         timeout: Cache timeout in seconds (default 300 = 5 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key (also registered as a tag)
+        tags: Extra tags - a list, or a callable taking the function's
+            arguments, e.g. ``lambda user_id: [f'assessments:user:{user_id}']``
     
     Usage:
         @cached(timeout=600, key_prefix='user_stats')
@@ -272,21 +520,41 @@ def cached(timeout=300, key_prefix=''):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            # Build cache key
+            cache = get_cache()
+            entry_tags = _resolve_tags(key_prefix, tags, args, kwargs)
+            
             cache_key = _build_cache_key(f, key_prefix, args, kwargs)
             
-            # Try to get from cache
-            cache = get_cache()
-            cached_result = cache.get(cache_key)
+            # Try to get from cache (Redis: one MGET with the tags' generations)
+            if isinstance(cache, RedisCache):
+                cached_result, generations = cache.get_tagged(cache_key, entry_tags)
+            else:
+                cached_result = cache.get(cache_key)
             
             if cached_result is not None:
+                cache_metrics.hit(key_prefix)
                 return cached_result
+            cache_metrics.miss(key_prefix)
             
             # Execute function
-            result = f(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = f(*args, **kwargs)
+            except Exception:
+                cache_metrics.error(key_prefix)
+                raise
+            elapsed = time.perf_counter() - start
             
-            # Store in cache
-            cache.set(cache_key, result, timeout)
+            # Store in cache, stamped with the generations read above: if a tag
+            # was invalidated meanwhile, the entry is already stale
+            if isinstance(cache, RedisCache):
+                stored = cache.set_tagged(cache_key, result, generations, timeout) if generations is not None else False
+            else:
+                stored = cache.set(cache_key, result, timeout, tags=entry_tags)
+            if stored is False:
+                cache_metrics.error(key_prefix)
+            else:
+                cache_metrics.fill(key_prefix, elapsed, stored)
             
             return result
         
@@ -314,51 +582,38 @@ def _build_cache_key(func, prefix, args, kwargs):
     
     return f"cache:{prefix}:{key_hash}" if prefix else f"cache:{key_hash}"
 
-def invalidate_cache(key_prefix):
+def invalidate_cache(*tags):
     """
-    Invalidate all cache entries with given prefix
+    Invalidate all cache entries registered under the given tags
+    
+    Every @cached entry is tagged with its key_prefix, so this also
+    invalidates by prefix.
     
     Usage:
         invalidate_cache('user_stats')
+        invalidate_cache('assessment_stats', 'assessments:user:123')
     """
     cache = get_cache()
     
-    # For Redis, we can use pattern matching
     if isinstance(cache, RedisCache):
-        try:
-            pattern = f"cache:{key_prefix}:*"
-            keys = cache.client.keys(pattern)
-            if keys:
-                cache.client.delete(*keys)
-                print(f"Invalidated {len(keys)} cache entries with prefix: {key_prefix}")
-        except Exception as e:
-            print(f"Cache invalidation error: {e}")
+        # Bump the generations; stale entries are skipped until overwritten or expired
+        cache.invalidate_tags(*tags)
     else:
-        # For in-memory cache, clear all
-        cache.clear()
-        print(f"Cleared entire cache (in-memory mode)")
+        cache.delete_tag(*tags)
 
 def cache_stats():
     """Get cache statistics"""
     cache = get_cache()
     
     if isinstance(cache, RedisCache):
-        try:
-            info = cache.client.info('stats')
-            return {
-                'type': 'redis',
-                'keys': cache.client.dbsize(),
-                'hits': info.get('keyspace_hits', 0),
-                'misses': info.get('keyspace_misses', 0),
-                'memory_used': cache.client.info('memory').get('used_memory_human', 'N/A')
-            }
-        except Exception as e:
-            return {'error': str(e)}
+        stats = cache.get_stats()
     else:
-        return {
+        stats = {
             'type': 'in-memory',
             'keys': len(cache._cache)
         }
+    stats['namespaces'] = cache_metrics.snapshot()
+    return stats
 
 # Example usage
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ Search utilities for advanced filtering
 """
 from sqlalchemy import or_, and_
 from datetime import datetime, timedelta
+from utils.text_search import text_search_condition
 
 
 class SearchFilter:
@@ -20,15 +21,17 @@ class SearchFilter:
     
     def add_text_search(self, columns, search_term):
         """
-        Add text search across multiple columns
+        Add substring search across multiple columns
+        
+        Uses the database's search index when one is available (see
+        utils.text_search) and falls back to a plain ILIKE scan otherwise.
         
         Args:
             columns: List of column objects to search
             search_term: Search text
         """
         if search_term:
-            conditions = [col.ilike(f'%{search_term}%') for col in columns]
-            self.filters.append(or_(*conditions))
+            self.filters.append(text_search_condition(self.model, columns, search_term))
         return self
     
     def add_exact_match(self, column, value):
@@ -119,6 +122,33 @@ def parse_sort_params(allowed_columns, default_column='created_at', default_orde
     return column, sort_order
 
 
+def parse_fields_param(allowed_fields, param='fields'):
+    """
+    Parse a comma-separated field projection from request
+    
+    Args:
+        allowed_fields: Iterable of field names that may be requested
+        param: Query-string parameter name (default 'fields')
+    
+    Returns:
+        List of requested fields in request order, or None for "all fields"
+    """
+    from flask import request
+    
+    raw = request.args.get(param, '').strip()
+    if not raw:
+        return None
+    
+    allowed = set(allowed_fields)
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if name in allowed and name not in fields:
+            fields.append(name)
+    
+    return fields or None
+
+
 def apply_sorting(query, column, order='asc'):
     """
     Apply sorting to query
@@ -0,0 +1,138 @@
+"""
+Indexed substring search
+
+`ILIKE '%term%'` cannot use a B-tree index, so every search keystroke in the
+admin UI scans the whole table. This module picks an indexed path per
+database backend:
+
+- PostgreSQL: pg_trgm GIN indexes, which serve ILIKE '%term%' directly.
+- MySQL/MariaDB: a FULLTEXT index built WITH PARSER ngram, queried with
+  MATCH ... AGAINST in boolean phrase mode. The index lives in the database,
+  so rows written by any process (other workers, the mobile backend) are
+  searchable as soon as they are committed.
+- Anything else (SQLite in development/tests): the plain ILIKE scan.
+
+The ILIKE condition is always kept on top of the indexed predicate, so the
+results are identical to the plain scan - the index only shrinks the set of
+rows it has to be checked against. For that, MATCH must never reject a row
+the ILIKE accepts:
+
+- the index is created with stopwords disabled (the ngram parser drops every
+  n-gram containing a stopword);
+- MATCH is only given the longest run of letters/digits in the term, and only
+  when that run is at least `ngram_token_size` long, since a substring match
+  of the term implies a substring match of any run within it.
+
+LIKE wildcards in the term (`%`, `_`) are escaped and match literally.
+"""
+import re
+
+from sqlalchemy import or_, text
+
+# table name -> columns covered by one search index
+TEXT_SEARCH_INDEXES = {
+    'users': ('email', 'full_name', 'username'),
+}
+
+# MySQL's default ngram_token_size, used when the server does not report one
+DEFAULT_NGRAM_TOKEN_SIZE = 2
+
+_fulltext_ready = {}
+
+
+def _index_name(table_name, column=None, kind='trgm'):
+    if column:
+        return f'ix_{table_name}_{column}_{kind}'
+    return f'ft_{table_name}_search_ngram'
+
+
+def _legacy_index_name(table_name):
+    # Built with stopwords enabled, so it can miss rows; replaced by _index_name
+    return f'ft_{table_name}_search'
+
+
+def _index_exists(conn, table_name, index_name):
+    return conn.execute(text(
+        'SELECT COUNT(*) FROM information_schema.statistics '
+        'WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :index'
+    ), {'table': table_name, 'index': index_name}).scalar() > 0
+
+
+def _fulltext_token_size(session, table_name, column_names):
+    """
+    ngram_token_size when the FULLTEXT index from ensure_text_search_indexes
+    exists, else None (checked once per process)
+    """
+    key = (table_name, tuple(column_names))
+    if key not in _fulltext_ready:
+        rows = session.execute(text(
+            'SELECT column_name FROM information_schema.statistics '
+            'WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :index'
+        ), {'table': table_name, 'index': _index_name(table_name)}).scalars().all()
+        ready = {name.lower() for name in rows} == {name.lower() for name in column_names}
+        size = None
+        if ready:
+            size = session.execute(text('SELECT @@ngram_token_size')).scalar() or DEFAULT_NGRAM_TOKEN_SIZE
+        _fulltext_ready[key] = size
+    return _fulltext_ready[key]
+
+
+def _match_phrase(search_term, token_size):
+    """Longest letter/digit run of the term, if MATCH can look it up"""
+    runs = re.findall(r'[^\W_]+', search_term)
+    longest = max(runs, key=len, default='')
+    return longest if len(longest) >= token_size else None
+
+
+def text_search_condition(model, columns, search_term, session=None):
+    """
+    Build a WHERE condition matching `search_term` as a substring of any column
+
+    Args:
+        model: SQLAlchemy model class
+        columns: List of column objects to search
+        search_term: Search text (LIKE wildcards match literally)
+        session: Session used for index lookups (defaults to the model's)
+    """
+    session = session or model.query.session
+    substring = or_(*[col.icontains(search_term, autoescape=True) for col in columns])
+
+    if session.get_bind().dialect.name in ('mysql', 'mariadb'):
+        column_names = [col.key for col in columns]
+        token_size = _fulltext_token_size(session, model.__tablename__, column_names)
+        phrase = _match_phrase(search_term, token_size) if token_size else None
+        if phrase:
+            match = text(
+                f"MATCH({', '.join(column_names)}) AGAINST(:fulltext_term IN BOOLEAN MODE)"
+            ).bindparams(fulltext_term=f'"{phrase}"')
+            return match & substring
+
+    # PostgreSQL: pg_trgm GIN indexes serve the ILIKE directly
+    return substring
+
+
+def ensure_text_search_indexes(engine):
+    """Create the search indexes in TEXT_SEARCH_INDEXES if they are missing"""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        for table_name, column_names in TEXT_SEARCH_INDEXES.items():
+            if dialect == 'postgresql':
+                conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                for column in column_names:
+                    conn.execute(text(
+                        f'CREATE INDEX IF NOT EXISTS {_index_name(table_name, column)} '
+                        f'ON {table_name} USING gin ({column} gin_trgm_ops)'
+                    ))
+            elif dialect in ('mysql', 'mariadb'):
+                legacy = _legacy_index_name(table_name)
+                if _index_exists(conn, table_name, legacy):
+                    conn.execute(text(f'ALTER TABLE {table_name} DROP INDEX {legacy}'))
+                if not _index_exists(conn, table_name, _index_name(table_name)):
+                    # Read when the index is built: with stopwords on, the ngram
+                    # parser would skip every n-gram containing one
+                    conn.execute(text('SET SESSION innodb_ft_enable_stopword = OFF'))
+                    conn.execute(text(
+                        f"ALTER TABLE {table_name} ADD FULLTEXT INDEX {_index_name(table_name)} "
+                        f"({', '.join(column_names)}) WITH PARSER ngram"
+                    ))
+    _fulltext_ready.clear()
@@ -0,0 +1,281 @@
+"""Background model retraining jobs.
+
+Fitting the LightGBM risk model is CPU-bound for tens of seconds. Run inside
+a gevent worker it blocks every other greenlet in that process, so the
+dashboard froze while a model trained. `/api/ml/retrain` now records a
+`TrainingJob` and starts a dedicated trainer process (spawned, not forked, so
+it inherits no gevent hub or open sockets). The trainer talks to the database
+on its own engine: it writes stage/progress to the job row about once a
+second, and at the same moment checks `cancel_requested`, so a cancel takes
+effect mid-fit. The ML analytics page polls `/api/ml/retrain/jobs/<id>`.
+
+With `TRAINING_JOBS_SYNC` set (tests, single-process debugging) the job runs
+inline before returning.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import multiprocessing
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import MLMetrics, TrainingJob, db
+from utils.cache import invalidate_tags, start_invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+# Job modes that update the current model from assessment_results (see incremental_training)
+INCREMENTAL_MODES = ('continue', 'refit')
+# Job mode that re-scores stored assessments with the current model (see rescoring)
+RESCORE_MODE = 'rescore'
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes / cancel checks
+# A running job whose trainer has not written for this long is reported failed
+STALE_AFTER = timedelta(minutes=10)
+
+# Trainer processes started by this web worker: job id -> Process
+_processes: dict[str, multiprocessing.Process] = {}
+
+
+class TrainingCancelled(Exception):
+    """Raised inside the trainer when the job's cancel flag is set."""
+
+
+class TrainingJobConflict(Exception):
+    """Another training job is already queued or running."""
+
+    def __init__(self, job: TrainingJob):
+        super().__init__(f'Training job {job.id} is already {job.status}')
+        self.job = job
+
+
+def _set_job(engine, job_id: str, *conditions, **values) -> int:
+    """Update a job row; returns the number of rows changed."""
+    table = TrainingJob.__table__
+    values.setdefault('updated_at', datetime.utcnow())
+    if values.get('status', 'running') not in ACTIVE_STATUSES:
+        values['active_slot'] = None  # free the slot for the next job
+    with engine.begin() as conn:
+        result = conn.execute(update(table).where(table.c.id == job_id, *conditions).values(**values))
+    return result.rowcount
+
+
+class _ProgressReporter:
+    """progress(stage, fraction) callback: persists progress, honours cancellation."""
+
+    def __init__(self, engine, job_id: str, interval: float = PROGRESS_INTERVAL):
+        self.engine = engine
+        self.job_id = job_id
+        self.interval = interval
+        self._stage = None
+        self._last_write = 0.0
+
+    def __call__(self, stage: str, fraction: float) -> None:
+        now = time.monotonic()
+        if stage == self._stage and now - self._last_write < self.interval:
+            return
+        self._stage, self._last_write = stage, now
+
+        table = TrainingJob.__table__
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.id == self.job_id)
+                .values(stage=stage, progress=round(fraction * 100, 1), updated_at=datetime.utcnow())
+            )
+            cancel = conn.execute(select(table.c.cancel_requested).where(table.c.id == self.job_id)).scalar()
+        if cancel:
+            raise TrainingCancelled()
+
+
+def _result_summary(result) -> dict:
+    return {
+        'accuracy': result.accuracy,
+        'precision': result.precision,
+        'recall': result.recall,
+        'f1': result.f1,
+        'roc_auc': None if math.isnan(result.roc_auc) else result.roc_auc,
+        'n_rows': result.n_rows,
+        'model_path': result.model_path,
+        'dataset_path': result.dataset_path,
+    }
+
+
+def run_training_job(job_id: str, engine, model_path: Optional[str] = None) -> None:
+    """Execute a queued training job (trainer entry point)."""
+    table = TrainingJob.__table__
+    started = _set_job(
+        engine, job_id, table.c.status == 'queued', table.c.cancel_requested.is_(False),
+        status='running', stage='loading', started_at=datetime.utcnow(),
+    )
+    if not started:
+        return  # cancelled before it started, or picked up elsewhere
+
+    with engine.connect() as conn:
+        dataset_path, mode = conn.execute(
+            select(table.c.dataset_path, table.c.mode).where(table.c.id == job_id)
+        ).one()
+
+    try:
+        from train_risk_model import MODEL_PATH_DEFAULT, metrics_values, train_risk_model
+
+        reporter = _ProgressReporter(engine, job_id)
+        if mode in INCREMENTAL_MODES:
+            from incremental_training import update_risk_model
+
+            result = update_risk_model(engine, model_path or MODEL_PATH_DEFAULT, mode=mode, progress=reporter)
+            summary = result.summary()
+            promoted = result.promoted
+        elif mode == RESCORE_MODE:
+            from rescoring import rescore_job_options, rescore_assessments
+
+            result = rescore_assessments(
+                engine, model_path=model_path or MODEL_PATH_DEFAULT, progress=reporter,
+                **rescore_job_options(engine, model_path or MODEL_PATH_DEFAULT),
+            )
+            summary = result.summary()
+            promoted = False  # no new model, nothing to record in ml_metrics
+        else:
+            kwargs = {'model_path': model_path} if model_path else {}
+            result = train_risk_model(
+                dataset_path=dataset_path,
+                save_metrics_to_db=False,
+                progress=reporter,
+                **kwargs,
+            )
+            summary = _result_summary(result)
+            promoted = True
+
+        metrics_id = None
+        if promoted:
+            with engine.begin() as conn:
+                metrics_id = conn.execute(
+                    MLMetrics.__table__.insert().values(**metrics_values(result))
+                ).inserted_primary_key[0]
+            # Cached latest model version and explanations (routes/ml_routes) in every web worker
+            invalidate_tags('ml_metrics', 'ml_explanations')
+        _set_job(
+            engine, job_id,
+            status='completed', stage='done', progress=100.0, metrics_id=metrics_id,
+            result=json.dumps(summary), completed_at=datetime.utcnow(),
+        )
+    except TrainingCancelled:
+        _set_job(engine, job_id, status='cancelled', stage='cancelled', completed_at=datetime.utcnow())
+    except Exception as e:
+        logger.error(f'Training job {job_id} failed: {e}', exc_info=True)
+        _set_job(engine, job_id, status='failed', error=str(e), completed_at=datetime.utcnow())
+
+
+def _trainer_main(job_id: str, database_url: str, model_path: Optional[str]) -> None:
+    """Entry point of the spawned trainer process."""
+    logging.basicConfig(level=logging.INFO)
+    # Lets the trainer broadcast cache invalidations to the web workers
+    start_invalidation_bus()
+    engine = create_engine(database_url, pool_pre_ping=True)
+    try:
+        run_training_job(job_id, engine, model_path)
+    finally:
+        engine.dispose()
+
+
+def _reap_trainers() -> None:
+    """Join finished trainer processes; fail jobs whose trainer died mid-run."""
+    for job_id, proc in list(_processes.items()):
+        if proc.is_alive():
+            continue
+        proc.join()
+        del _processes[job_id]
+        if proc.exitcode != 0:
+            table = TrainingJob.__table__
+            _set_job(
+                db.engine, job_id, table.c.status.in_(ACTIVE_STATUSES),
+                status='failed', error=f'Trainer exited with code {proc.exitcode}',
+                completed_at=datetime.utcnow(),
+            )
+
+
+def fail_stale_training_jobs() -> int:
+    """Mark running jobs whose trainer stopped writing heartbeats as failed."""
+    _reap_trainers()
+    table = TrainingJob.__table__
+    cutoff = datetime.utcnow() - STALE_AFTER
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            update(table)
+            .where(table.c.status == 'running', table.c.updated_at < cutoff)
+            .values(status='failed', error='Trainer stopped responding', completed_at=datetime.utcnow(),
+                    active_slot=None)
+        )
+    return result.rowcount
+
+
+def enqueue_training_job(dataset_path: str, requested_by: Optional[int], mode: str = 'full') -> TrainingJob:
+    """Record a training job and start its trainer process.
+
+    `mode` is 'full' (retrain from `dataset_path`), one of INCREMENTAL_MODES
+    or RESCORE_MODE.
+
+    Raises:
+        TrainingJobConflict: a job is already queued or running (training
+            twice at once would only race to overwrite the same model file)
+    """
+    fail_stale_training_jobs()
+    job = TrainingJob(
+        id=str(uuid.uuid4()),
+        dataset_path=dataset_path,
+        mode=mode,
+        status='queued',
+        stage='queued',
+        progress=0.0,
+        requested_by=requested_by,
+        active_slot=TrainingJob.ACTIVE_SLOT,
+    )
+    db.session.add(job)
+    try:
+        # The unique active_slot makes check-and-insert one atomic step,
+        # across web workers and app instances
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        active = TrainingJob.query.filter(TrainingJob.active_slot == TrainingJob.ACTIVE_SLOT).first()
+        if active is None:
+            raise
+        raise TrainingJobConflict(active)
+
+    app = current_app._get_current_object()
+    model_path = app.config.get('RISK_MODEL_PATH')
+    if app.config.get('TRAINING_JOBS_SYNC'):
+        run_training_job(job.id, db.engine, model_path)
+        db.session.refresh(job)
+    else:
+        database_url = db.engine.url.render_as_string(hide_password=False)
+        proc = multiprocessing.get_context('spawn').Process(
+            target=_trainer_main,
+            args=(job.id, database_url, model_path),
+            name=f'trainer-{job.id[:8]}',
+        )
+        proc.start()
+        _processes[job.id] = proc
+    return job
+
+
+def cancel_training_job(job: TrainingJob) -> TrainingJob:
+    """Cancel a job: queued jobs stop immediately, running ones at the next progress write."""
+    table = TrainingJob.__table__
+    cancelled = _set_job(
+        db.engine, job.id, table.c.status == 'queued',
+        status='cancelled', stage='cancelled', cancel_requested=True, completed_at=datetime.utcnow(),
+    )
+    if not cancelled:
+        _set_job(db.engine, job.id, table.c.status == 'running', cancel_requested=True)
+    db.session.refresh(job)
+    return job